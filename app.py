@@ -4,10 +4,22 @@ import streamlit as st
 import mysql.connector
 from datetime import datetime
 import pandas as pd
+import functools
 import hashlib 
 import os
 from pathlib import Path
 
+from db import ConnectionPool, LATENCY_BUCKETS, QueryMetrics, set_route
+from catalog import SORT_NEWEST, SORT_RATING, CategoryTree, LRUCache, browse_count_query, browse_filter, browse_page_query, browse_rows_query, page_cursor, placeholders, read_catalog_version
+from search import SearchIndex
+from images import ImageManifest, store_listing_image, variant_path
+from dashboard import DASHBOARD_QUERIES, load_dashboard
+from recommend import SimilarityIndex, student_history
+from dedupe import find_duplicates, listing_signature, store_signature
+from profiling import RerunProfile, section
+from queries import (BARTER_CIRCLES, BARTER_HISTORY, BARTER_LISTINGS, BARTER_PROPOSALS, BUYSELL_AWAITING_CONFIRMATION, BUYSELL_AWAITING_PAYMENT,
+                     BUYSELL_LISTINGS, LEND_CALENDAR, LEND_LISTINGS, LOGIN, MY_BARTER_LISTINGS, MY_LOANS, MY_RESERVATIONS)
+
 # --- Configuration & Constants ---
 BASE_DIR = Path(__file__).resolve().parent 
 UPLOAD_DIR = BASE_DIR / "static" / "images"
@@ -18,12 +30,34 @@ try:
     DB_USER = st.secrets["mysql"]["user"]
     DB_PASSWORD = st.secrets["mysql"]["password"]
     DB_NAME = st.secrets["mysql"]["database"]
+    DB_POOL_SIZE = int(st.secrets["mysql"].get("pool_size", 8))
+    # Separate connections for the My Activity queries, one per query by default so they all run at once
+    DASHBOARD_POOL_SIZE = int(st.secrets["mysql"].get("dashboard_pool_size", len(DASHBOARD_QUERIES)))
+    # Optional [metrics] table: slow_query_ms, admins (SRNs that may open the query metrics page),
+    # profile (profile every rerun for everyone; admins can also add ?profile=1 to the URL)
+    SLOW_QUERY_MS = float(st.secrets.get("metrics", {}).get("slow_query_ms", 500))
+    METRICS_ADMINS = set(st.secrets.get("metrics", {}).get("admins", []))
+    PROFILE_ALL = bool(st.secrets.get("metrics", {}).get("profile", False))
 except (KeyError, AttributeError):
     st.error("🚨 Configuration Error: Could not find database credentials in secrets.toml.")
     DB_HOST = DB_USER = DB_PASSWORD = DB_NAME = None 
+    DB_POOL_SIZE = DASHBOARD_POOL_SIZE = 0
+    SLOW_QUERY_MS = 500
+    METRICS_ADMINS = set()
+    PROFILE_ALL = False
     
 DEPARTMENTS = ['Computer Science', 'Electronics and Commn', 'Mechanical', 'Electrical', 'Civil']
 IMAGE_PLACEHOLDER = "Click to Upload Image" 
+CATEGORY_CACHE_TTL = 600 # seconds; invalidate_category_tree() drops it sooner after a Category write
+SEARCH_INDEX_TTL = 3600 # seconds; periodic full rebuild (deleted rows are already dropped on refresh)
+SEARCH_MIN_CHARS = 2 # shorter search input is ignored instead of matching nearly everything
+BROWSE_PAGE_SIZE = 12 # cards per browse page
+BROWSE_CACHE_ENTRIES = 512 # browse pages kept in the cross-session result cache
+DASHBOARD_QUERY_TIMEOUT = 5 # seconds allowed per My Activity query
+IMAGE_MANIFEST_TTL = 600 # seconds; rescans the upload directory to drop files removed by the image sweeper
+SIMILAR_ITEMS_K = 4 # similar listings offered per browse card
+RECOMMENDATION_COUNT = 6 # 'You might need' listings on the browse page
+PROFILE_DIR = BASE_DIR / "profiles" # folded-stack dumps of the rerun profiler
 
 # --- Session State Initialization ---
 if 'logged_in_srn' not in st.session_state: st.session_state.logged_in_srn = None
@@ -31,20 +65,40 @@ if 'page' not in st.session_state: st.session_state.page = 'landing'
 if 'history' not in st.session_state: st.session_state.history = ['landing']
 # We will initialize other flags (like 'barter_proposed') inside their respective pages
 
-# --- File System Utility (Remains the same) ---
+# --- File System Utility ---
 def save_uploaded_file(uploaded_file):
+    """
+    Stores an uploaded photo (original/detail/thumb variants) in the content-addressed image store.
+    Returns (path for Resource.ImagePath, StoredImage) or None. An identical photo is stored only once.
+    """
     if uploaded_file is None: return None
-    file_extension = Path(uploaded_file.name).suffix
-    unique_filename = f"{Path(uploaded_file.name).stem}_{datetime.now().strftime('%Y%m%d%H%M%S')}{file_extension}"
-    file_path = UPLOAD_DIR / unique_filename
     try:
-        with open(file_path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
-        return str(Path("static") / "images" / unique_filename)
+        stored = store_listing_image(uploaded_file.getvalue(), UPLOAD_DIR)
+        for variant in ('original', 'detail', 'thumb'):
+            get_image_manifest().add(variant_path(stored.name, variant))
+        return str(Path("static") / "images" / stored.name), stored
     except Exception as e:
         st.error(f"Error saving file: {e}")
         return None
 
+@st.cache_resource(ttl=IMAGE_MANIFEST_TTL)
+def get_image_manifest():
+    """Process-wide set of stored image files, so card rendering never stats the disk for a known file."""
+    return ImageManifest(UPLOAD_DIR)
+
+def card_image_path(image_path):
+    """Full path of the card thumbnail for a listing, falling back to the original for photos stored before variants existed."""
+    if not image_path: return None
+    manifest = get_image_manifest()
+    upload_prefix = Path("static") / "images"
+    for candidate in (variant_path(image_path, 'thumb'), image_path):
+        try:
+            name = Path(candidate).relative_to(upload_prefix).as_posix()
+        except ValueError:
+            continue
+        if manifest.exists(name): return UPLOAD_DIR / name
+    return None
+
 # --- FIX 1: Add a function to reset submission flags ---
 def reset_submission_flags():
     """Resets all form submission flags when navigating."""
@@ -75,18 +129,60 @@ def go_back():
 def render_back_button():
     """Renders a back button on sub-pages."""
     if st.session_state.page not in ['landing', 'home']:
-        st.markdown('<div style="margin-bottom: 20px;">', unsafe_allow_html=True)
-        if st.button("⬅️ Go Back", key="back_btn"):
-            go_back()
-        st.markdown('</div>', unsafe_allow_html=True)
+        with section("navigation"):
+            st.markdown('<div style="margin-bottom: 20px;">', unsafe_allow_html=True)
+            if st.button("⬅️ Go Back", key="back_btn"):
+                go_back()
+            st.markdown('</div>', unsafe_allow_html=True)
+        
+def select_tab(key, labels):
+    """
+    Tab strip for pages whose tabs query the database. Unlike st.tabs, which runs every tab body on
+    every rerun, the caller only runs the body of the tab returned here.
+    """
+    return st.radio("Section", labels, key=key, horizontal=True, label_visibility="collapsed")
         
 # --- DB Connection & Utility Functions ---
 
+@st.cache_resource
+def get_query_metrics():
+    """Process-wide latency/row/error metrics of every statement run through the pool, by page."""
+    return QueryMetrics(slow_threshold=SLOW_QUERY_MS / 1000)
+
+@st.cache_resource
+def get_db_pool():
+    """One connection pool per server process, shared by every session and rerun."""
+    return ConnectionPool(size=DB_POOL_SIZE, metrics=get_query_metrics(),
+                          host=DB_HOST, user=DB_USER, password=DB_PASSWORD, database=DB_NAME)
+
+@st.cache_resource
+def get_dashboard_pool():
+    """Pool reserved for the My Activity fan-out, so it neither starves page renders nor waits behind them."""
+    return ConnectionPool(size=DASHBOARD_POOL_SIZE, checkout_timeout=DASHBOARD_QUERY_TIMEOUT, metrics=get_query_metrics(),
+                          host=DB_HOST, user=DB_USER, password=DB_PASSWORD, database=DB_NAME)
+
+def with_db_connection(render):
+    """
+    For pages/tabs that render, read and write through one connection: checks it out, passes it as the
+    first argument and returns it to the pool however the function exits (st.rerun() and early returns too).
+    """
+    @functools.wraps(render)
+    def wrapper(*args, **kwargs):
+        conn = get_db_connection()
+        if not conn: return
+        try:
+            return render(conn, *args, **kwargs)
+        finally:
+            conn.close()
+    return wrapper
+
 def get_db_connection():
+    """Checks a connection out of the shared pool. conn.close() returns it to the pool."""
     if DB_HOST is None: return None
+    # Fragment reruns skip the router and may run on a fresh thread/context, so label the statements here
+    set_route(st.session_state.page)
     try:
-        conn = mysql.connector.connect(host=DB_HOST, user=DB_USER, password=DB_PASSWORD, database=DB_NAME)
-        return conn
+        return get_db_pool().checkout()
     except mysql.connector.Error as err:
         st.error(f"Database Connection Error: {err}")
         return None
@@ -95,25 +191,43 @@ def hash_password(password): return hashlib.sha256(password.encode()).hexdigest(
 
 def verify_password(stored_hash, provided_password): return stored_hash == hash_password(provided_password)
 
-def fetch_all_categories(conn):
+@st.cache_resource(ttl=CATEGORY_CACHE_TTL)
+def get_category_tree():
     """
-    Fetches only the MainType names for the dropdown (CORRECTED FIX).
+    Loads the whole Category table once into a CategoryTree shared by all sessions.
+    Pages use it for dropdowns, name -> ID mapping and labels without touching the database.
     """
-    if not conn: return []
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("""
-        SELECT 
-            MIN(Cat_ID) AS Cat_ID, 
-            MainType AS FullType 
-        FROM Category
-        GROUP BY MainType
-        ORDER BY 
-            CASE WHEN MainType = 'Miscellaneous' THEN 1 ELSE 0 END, -- <-- FIX: Changed 'Misc' to 'Miscellaneous'
-            MainType
-    """)
-    categories = cursor.fetchall()
+    set_route(st.session_state.page)
+    with get_db_pool().connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("SELECT Cat_ID, MainType, SubType FROM Category")
+        rows = cursor.fetchall()
+        cursor.close()
+    return CategoryTree(rows)
+
+def invalidate_category_tree():
+    """Call after any write to the Category table so the next render reloads it."""
+    get_category_tree.clear()
+
+@st.cache_resource(ttl=SEARCH_INDEX_TTL)
+def get_search_index():
+    """Process-wide full-text index over Resource; each search first pulls in rows changed since the last one."""
+    return SearchIndex()
+
+@st.cache_resource(ttl=SEARCH_INDEX_TTL)
+def get_similarity_index():
+    """Process-wide vector index over Resource for recommendations; refreshed from UpdatedAt deltas like the search index."""
+    return SimilarityIndex()
+
+def listing_titles(conn, resource_ids):
+    """{ResourceID: Title} for the given listings, in one query."""
+    resource_ids = sorted(set(resource_ids))
+    if not resource_ids: return {}
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT ResourceID, Title FROM Resource WHERE ResourceID IN ({placeholders(resource_ids)})", resource_ids)
+    titles = dict(cursor.fetchall())
     cursor.close()
-    return categories
+    return titles
 
 # --- 0. Landing Page ---
 def page_landing():
@@ -145,17 +259,18 @@ def page_login():
             
             conn = get_db_connection()
             if conn:
-                cursor = conn.cursor(dictionary=True)
-                query = "SELECT SRN, Password FROM Student WHERE SRN = %s OR Email = %s"
-                cursor.execute(query, (login_srn, login_srn))
-                user = cursor.fetchone()
-                
+                try:
+                    cursor = conn.cursor(dictionary=True)
+                    cursor.execute(LOGIN, (login_srn, login_srn))
+                    user = cursor.fetchone()
+                finally:
+                    conn.close()
+
                 if user and verify_password(user['Password'], login_password):
                     st.session_state.logged_in_srn = user['SRN']
                     navigate_to('home')
                 else:
                     st.error("Invalid SRN/Email or Password.")
-                conn.close()
     
     st.markdown('**Don\'t have an account?**')
     if st.button("Go to Sign Up", key='login_to_signup'): navigate_to('signup')
@@ -206,122 +321,245 @@ def page_signup():
 
 # --- 3. Home Page (Browsing & Filtering) ---
 def page_home_browse():
-    st.sidebar.title(f"Welcome, {st.session_state.logged_in_srn}")
-    
-    # --- Sidebar Navigation (Main Buttons) ---
-    st.sidebar.subheader("Quick Actions")
-    if st.sidebar.button("🏠 Browse/Home", use_container_width=True): navigate_to('home')
-    if st.sidebar.button("💸 **SELL** an Item", use_container_width=True): navigate_to('upload_sell')
-    if st.sidebar.button("📚 **LEND** an Item", use_container_width=True): navigate_to('upload_lend')
-    if st.sidebar.button("🔄 **BARTER** an Item", use_container_width=True): navigate_to('upload_barter')
-    st.sidebar.markdown("---")
-    if st.sidebar.button("⚙️ My Activity/Transactions", use_container_width=True): navigate_to('my_activity')
-    if st.sidebar.button("🚪 Logout", use_container_width=True): 
-        # --- FIX: Also reset flags on logout ---
-        reset_submission_flags()
-        st.session_state.logged_in_srn = None
-        st.session_state.page = 'landing'
-        st.rerun()
+    with section("navigation"):
+        st.sidebar.title(f"Welcome, {st.session_state.logged_in_srn}")
+
+        # --- Sidebar Navigation (Main Buttons) ---
+        st.sidebar.subheader("Quick Actions")
+        if st.sidebar.button("🏠 Browse/Home", use_container_width=True): navigate_to('home')
+        if st.sidebar.button("💸 **SELL** an Item", use_container_width=True): navigate_to('upload_sell')
+        if st.sidebar.button("📚 **LEND** an Item", use_container_width=True): navigate_to('upload_lend')
+        if st.sidebar.button("🔄 **BARTER** an Item", use_container_width=True): navigate_to('upload_barter')
+        st.sidebar.markdown("---")
+        if st.sidebar.button("⚙️ My Activity/Transactions", use_container_width=True): navigate_to('my_activity')
+        if st.session_state.logged_in_srn in METRICS_ADMINS:
+            if st.sidebar.button("📈 Query Metrics", use_container_width=True): navigate_to('metrics')
+        if st.sidebar.button("🚪 Logout", use_container_width=True): 
+            # --- FIX: Also reset flags on logout ---
+            reset_submission_flags()
+            st.session_state.logged_in_srn = None
+            st.session_state.page = 'landing'
+            st.rerun()
 
     st.title("Explore UniSync Resources")
-    
+    if DB_HOST is None: return
+
+    # Filters and results rerun as fragments; the sidebar and title above are left alone
+    browse_recommendations()
+    browse_filter_bar()
+
+@st.fragment
+def browse_recommendations():
+    """'You might need' strip, ranked by similarity to what the student bought or borrowed before."""
+    user_srn = st.session_state.logged_in_srn
     conn = get_db_connection()
     if not conn: return
+    try:
+        # A student's history and the listings both live in Resource/BuySell, so the picks only change with the catalog version
+        version = read_catalog_version(conn)
+        cached = st.session_state.get('recommendations')
+        if cached is not None and cached[0] == (version, user_srn):
+            picks, titles = cached[1], cached[2]
+        else:
+            similarity_index = get_similarity_index()
+            similarity_index.refresh(conn, version)
+            picks = similarity_index.recommend_for(student_history(conn, user_srn), user_srn, k=RECOMMENDATION_COUNT)
+            titles = listing_titles(conn, [resource_id for resource_id, _ in picks])
+            st.session_state.recommendations = ((version, user_srn), picks, titles)
+    finally:
+        conn.close()
+    if not picks: return
+
+    st.markdown("#### 💡 You might need")
+    for col, (resource_id, _) in zip(st.columns(len(picks)), picks):
+        if resource_id in titles: col.caption(f"**{titles[resource_id]}** (ID: {resource_id})")
+
+def normalize_search(text):
+    """Collapses whitespace and case so trivially different inputs map to the same query."""
+    return " ".join(text.lower().split())
+
+@st.fragment
+def browse_filter_bar():
+    """Search box and filter selectboxes. A change reruns only this fragment and the results under it."""
+    # st.text_input commits on Enter or blur, not per keystroke; normalizing and a minimum
+    # length keep whitespace edits and single letters from triggering a search at all
+    search_query = normalize_search(st.text_input("🔍 Search by Title or Description", "", key="browse_search"))
+    if 0 < len(search_query) < SEARCH_MIN_CHARS:
+        st.caption(f"Type at least {SEARCH_MIN_CHARS} characters to search.")
+        search_query = ""
+    col_filter1, col_filter2, col_filter3, col_sort = st.columns(4)
+    category_tree = get_category_tree()
     
-    # --- Search Bar and Filters ---
-    search_query = st.text_input("🔍 Search by Title or Description", "")
-    col_filter1, col_filter2 = st.columns(2)
-    categories = fetch_all_categories(conn)
-    
-    category_options = ['All Categories'] + [c['FullType'] for c in categories]
+    category_options = ['All Categories'] + category_tree.main_types()
     selected_category_name = col_filter1.selectbox("Filter by Category", category_options)
     
-    option_filters = ['All Options', 'Buy/Sell', 'Lend/Borrow', 'Barter']
-    selected_option = col_filter2.selectbox("Filter by Transaction Type", option_filters)
-    
-    # --- *** CRITICAL FIX 3: SQL Injection Patch and Dynamic Query ---
-    
-    # Base query now selects the ListingType
-    base_query = """
-        SELECT 
-            r.ResourceID, r.Title, r.Description, r.itemCondition, r.ImagePath, r.ListingType,
-            CONCAT(c.MainType, ' - ', c.SubType) AS CategoryName, c.Cat_ID
-        FROM Resource r
-        JOIN Category c ON r.CategoryID = c.Cat_ID
-    """
-    
-    # Use parameterized queries to prevent SQL Injection
-    where_clauses = ["r.Status = 'Available'"]
-    params = []
-    
-    if search_query:
-        where_clauses.append("(r.Title LIKE %s OR r.Description LIKE %s)")
-        params.extend([f"%%{search_query}%%", f"%%{search_query}%%"])
-    
-    # Category Filtering Logic (Handles MainType selection)
+    # SubType level is only offered once a MainType is picked
+    subtype_options = ['All Types']
     if selected_category_name != 'All Categories':
-        # This part is safe as it's not direct user input
-        where_clauses.append("c.MainType = %s")
-        params.append(selected_category_name)
-
-    # Apply Transaction Type filter
-    if selected_option != 'All Options':
-        type_map = {'Buy/Sell': 'Sell', 'Lend/Borrow': 'Lend', 'Barter': 'Barter'}
-        where_clauses.append("r.ListingType = %s")
-        params.append(type_map[selected_option])
+        subtype_options += category_tree.sub_types(selected_category_name)
+    selected_subtype = col_filter2.selectbox("Filter by Sub-Type", subtype_options, disabled=len(subtype_options) == 1)
     
-    # Finalize query
-    final_query = base_query + " WHERE " + " AND ".join(where_clauses)
+    option_filters = ['All Options', 'Buy/Sell', 'Lend/Borrow', 'Barter']
+    selected_option = col_filter3.selectbox("Filter by Transaction Type", option_filters)
+
+    sort_options = {'Newest': SORT_NEWEST, 'Top Rated': SORT_RATING}
+    sort = sort_options[col_sort.selectbox("Sort by", list(sort_options))]
     
-    # Pass parameters safely to pandas
-    df_resources = pd.read_sql(final_query, conn, params=params)
-    conn.close()
+    # --- Parameterized filters shared by the page query and the count query ---
+    category_ids = None
+    if selected_category_name != 'All Categories':
+        # The tree resolves MainType/SubType to Cat_IDs, so no Category join is needed
+        sub_type = None if selected_subtype == 'All Types' else selected_subtype
+        category_ids = category_tree.ids_under(selected_category_name, sub_type)
+    type_map = {'Buy/Sell': 'Sell', 'Lend/Borrow': 'Lend', 'Barter': 'Barter'}
+
+    # --- Pagination: a stack of page cursors, reset whenever the filters change ---
+    filter_key = (search_query, selected_category_name, selected_subtype, selected_option, sort)
+    if st.session_state.get('browse_filter_key') != filter_key:
+        st.session_state.browse_filter_key = filter_key
+        st.session_state.browse_cursors = [None]
+
+    browse_results(search_query, category_ids, type_map.get(selected_option), sort)
+
+def fetch_browse_page(conn, search_query, category_ids, listing_type, cursor_value, sort=SORT_NEWEST):
+    """One page of browse cards: returns (rows, total matching count, cursor of the next page or None)."""
+    where, params = browse_filter(category_ids, listing_type)
+    cursor = conn.cursor(dictionary=True)
+    if search_query:
+        # Full-text search runs in-process (ranked, prefix and typo tolerant). The index holds each listing's
+        # status, type and category as of the refresh just done, so every filtered hit is ranked and counted;
+        # SQL only reads the page's rows. Cursors are offsets into the filtered, ranked ID list.
+        search_index = get_search_index()
+        search_index.refresh(conn)
+        matching_ids = [resource_id for resource_id, _ in search_index.search(
+            search_query, limit=None, status='Available', listing_type=listing_type, category_ids=category_ids)]
+        if sort == SORT_RATING:
+            # Stable sort: equally rated hits keep their relevance order
+            matching_ids.sort(key=search_index.rating, reverse=True)
+        total_count = len(matching_ids)
+        offset = cursor_value or 0
+        page_ids = matching_ids[offset:offset + BROWSE_PAGE_SIZE]
+        resources = []
+        if page_ids:
+            cursor.execute(*browse_rows_query(page_ids))
+            resources = cursor.fetchall()
+        next_cursor = offset + BROWSE_PAGE_SIZE if offset + BROWSE_PAGE_SIZE < total_count else None
+    else:
+        # Keyset pagination (newest first, or by stored rating): each page is an index range scan
+        cursor.execute(*browse_count_query(where, params))
+        total_count = cursor.fetchone()['Total']
+        cursor.execute(*browse_page_query(where, params, cursor_value, BROWSE_PAGE_SIZE, sort))
+        resources = cursor.fetchall()
+        next_cursor = page_cursor(resources[BROWSE_PAGE_SIZE - 1], sort) if len(resources) > BROWSE_PAGE_SIZE else None
+        resources = resources[:BROWSE_PAGE_SIZE]
+    cursor.close()
+    return resources, total_count, next_cursor
+
+@st.cache_resource
+def get_browse_cache():
+    """Browse pages shared by every session, keyed by catalog version + filters + page cursor."""
+    return LRUCache(BROWSE_CACHE_ENTRIES)
+
+def cached_browse_page(conn, search_query, category_ids, listing_type, cursor_value, sort=SORT_NEWEST):
+    """
+    fetch_browse_page() through the shared cache. The key includes the catalog version, which triggers
+    bump on any Resource/BuySell write, so a sale or new listing makes every older entry unreachable
+    (LRU eviction then drops them). Entries also hold the cards' similar listings and their titles, so a
+    hit costs one read of the 64 version shards. Returns (rows, total, next cursor, similar, similar titles).
+    """
+    version = read_catalog_version(conn)
+    key = (version, search_query, tuple(category_ids) if category_ids is not None else None, listing_type, sort, cursor_value)
+    page = get_browse_cache().get(key)
+    if page is None:
+        resources, total_count, next_cursor = fetch_browse_page(conn, search_query, category_ids, listing_type, cursor_value, sort)
+        # One batched similarity query for the whole page; the index is only refreshed when the catalog changed
+        similarity_index = get_similarity_index()
+        similarity_index.refresh(conn, version)
+        similar = similarity_index.similar([row['ResourceID'] for row in resources], k=SIMILAR_ITEMS_K)
+        similar_titles = listing_titles(conn, [hit for hits in similar.values() for hit, _ in hits])
+        page = (resources, total_count, next_cursor, similar, similar_titles)
+        get_browse_cache().put(key, page)
+    return page
+
+def format_rating(rating_avg, rating_count):
+    """Card rating line from the stored Resource.RatingAvg/RatingCount."""
+    if not rating_count: return "☆ No reviews yet"
+    return f"⭐ {float(rating_avg):.1f} ({rating_count} review{'s' if rating_count != 1 else ''})"
+
+@st.fragment
+def browse_results(search_query, category_ids, listing_type, sort=SORT_NEWEST):
+    """Card grid and page control. Paging reruns only this fragment."""
+    conn = get_db_connection()
+    if not conn: return
+    try:
+        resources, total_count, next_cursor, similar, similar_titles = cached_browse_page(
+            conn, search_query, category_ids, listing_type, st.session_state.browse_cursors[-1], sort)
+    finally:
+        conn.close()
+    category_tree = get_category_tree()
 
     # --- Display Results ---
     st.markdown("---")
-    st.subheader(f"Available Items ({len(df_resources)})")
+    st.subheader(f"Available Items ({total_count})")
     
-    if df_resources.empty:
+    if not resources:
         st.info("No items found matching your search and filters.")
         return
 
     cols = st.columns(3)
-    
-    for index, row in df_resources.iterrows():
-        col = cols[index % 3]
+    with section("cards"):
+        for index, row in enumerate(resources):
+            col = cols[index % 3]
         
-        # --- *** CRITICAL FIX 4: Use ListingType, not ResourceID % 3 ***
-        # This correctly identifies the item type based on data from the DB
-        listing_type = row['ListingType']
-        if listing_type == 'Sell': 
-            option_tag, tag_color, action_page = "BUY/SELL", "#007bff", 'buysell'
-        elif listing_type == 'Lend': 
-            option_tag, tag_color, action_page = "LEND/BORROW", "#28a745", 'lendborrow'
-        else: # Barter
-            option_tag, tag_color, action_page = "BARTER", "#ffc107", 'barter'
+            # --- *** CRITICAL FIX 4: Use ListingType, not ResourceID % 3 ***
+            # This correctly identifies the item type based on data from the DB
+            listing_type = row['ListingType']
+            if listing_type == 'Sell': 
+                option_tag, tag_color, action_page = "BUY/SELL", "#007bff", 'buysell'
+            elif listing_type == 'Lend': 
+                option_tag, tag_color, action_page = "LEND/BORROW", "#28a745", 'lendborrow'
+            else: # Barter
+                option_tag, tag_color, action_page = "BARTER", "#ffc107", 'barter'
             
-        # Note: The filter logic is now handled by the SQL query, 
-        # so the old Python `if selected_option ... continue` block is no longer needed.
+            # Note: The filter logic is now handled by the SQL query, 
+            # so the old Python `if selected_option ... continue` block is no longer needed.
         
-        with col:
-            with st.container(border=True): 
-                st.markdown(f"#### {row['Title']} <span style='background-color: {tag_color}; color: white; padding: 3px 8px; border-radius: 4px; font-size: 14px;'>{option_tag}</span>", unsafe_allow_html=True)
+            with col:
+                with st.container(border=True): 
+                    st.markdown(f"#### {row['Title']} <span style='background-color: {tag_color}; color: white; padding: 3px 8px; border-radius: 4px; font-size: 14px;'>{option_tag}</span>", unsafe_allow_html=True)
                 
-                image_full_path = BASE_DIR / row['ImagePath'] if row['ImagePath'] else None
+                    image_full_path = card_image_path(row['ImagePath'])
                 
-                if row['ImagePath'] and os.path.exists(image_full_path):
-                    # --- FIX: Hide Warning ---
-                    st.image(str(image_full_path), caption=row['Title'], use_container_width=True)
-                else:
-                    st.markdown(f'<div style="width: 100%; height: 150px; background-color: #f0f0f0; text-align: center; line-height: 150px; color: #777; border-radius: 5px; font-size: 12px;">{IMAGE_PLACEHOLDER}</div>', unsafe_allow_html=True)
-
-                st.caption(f"**Category:** {row['CategoryName']} | **Condition:** {row['itemCondition']}")
-                st.markdown(f"*{row['Description'][:70]}...*")
-
-                if st.button(f"View/Act on {row['ResourceID']}", key=f"act_{row['ResourceID']}", use_container_width=True):
-                    # Store target_resource_id only if needed by target page (e.g., buysell)
-                    # st.session_state.target_resource_id = row['ResourceID'] 
-                    navigate_to(action_page) 
+                    if image_full_path:
+                        with section("card images"):
+                            st.image(str(image_full_path), caption=row['Title'], use_container_width=True)
+                    else:
+                        st.markdown(f'<div style="width: 100%; height: 150px; background-color: #f0f0f0; text-align: center; line-height: 150px; color: #777; border-radius: 5px; font-size: 12px;">{IMAGE_PLACEHOLDER}</div>', unsafe_allow_html=True)
+
+                    st.caption(f"**Category:** {category_tree.label(row['CategoryID'])} | **Condition:** {row['itemCondition']}")
+                    st.caption(format_rating(row['RatingAvg'], row['RatingCount']))
+                    st.markdown(f"*{row['Description'][:70]}...*")
+
+                    similar_ids = [hit for hit, _ in similar.get(row['ResourceID'], []) if hit in similar_titles]
+                    if similar_ids:
+                        with st.popover("Similar items", use_container_width=True):
+                            for hit in similar_ids: st.markdown(f"- {similar_titles[hit]} (ID: {hit})")
+
+                    if st.button(f"View/Act on {row['ResourceID']}", key=f"act_{row['ResourceID']}", use_container_width=True):
+                        # Store target_resource_id only if needed by target page (e.g., buysell)
+                        # st.session_state.target_resource_id = row['ResourceID'] 
+                        navigate_to(action_page) 
+
+    # --- Page Control ---
+    page_number = len(st.session_state.browse_cursors)
+    col_prev, col_page, col_next = st.columns([1, 2, 1])
+    if col_prev.button("◀ Previous", disabled=page_number == 1, use_container_width=True):
+        st.session_state.browse_cursors.pop()
+        st.rerun(scope="fragment")
+    col_page.caption(f"Page {page_number} of {max(1, -(-total_count // BROWSE_PAGE_SIZE))}")
+    if col_next.button("Next ▶", disabled=next_cursor is None, use_container_width=True):
+        st.session_state.browse_cursors.append(next_cursor)
+        st.rerun(scope="fragment")
 
 
 # --- 4. Upload Pages ---
@@ -330,11 +568,8 @@ def page_upload_item(action_type):
     st.header(f"💸 List Item for {action_type.capitalize()}")
     st.markdown("---")
 
-    conn = get_db_connection()
-    if not conn: return
-
-    categories = fetch_all_categories(conn)
-    category_map = {c['FullType']: c['Cat_ID'] for c in categories}
+    # Every MainType/SubType pair is selectable, e.g. "Books - Textbook"
+    category_map = dict(get_category_tree().labelled_ids())
     category_names = list(category_map.keys())
     
     with st.form(f"upload_{action_type}_form"):
@@ -365,32 +600,55 @@ def page_upload_item(action_type):
                 action_specific_data = lend_terms
                 button_label = "List Item for Lending"
             elif action_type == 'barter':
-                barter_preference = st.text_area("Barter Preferences (What are you looking for?)")
-                action_specific_data = barter_preference
+                # Wanted categories feed the multi-party matcher (barter_match.py); the text is shown to people
+                wanted_categories = st.multiselect("Categories you would accept in exchange", category_names)
+                barter_preference = st.text_area("Barter Preferences (What are you looking for?)", max_chars=255)
+                action_specific_data = (wanted_categories, barter_preference)
                 button_label = "List Item for Barter"
-                
+
+        list_anyway = st.checkbox("List it even if it looks like one of my existing listings")
         submitted = st.form_submit_button(button_label)
 
         if submitted:
-            image_path_to_db = save_uploaded_file(uploaded_file)
-            
+            category_id = category_map.get(category_name)
+            if not title: st.error("Title is required."); return
+            if category_id is None: st.error("Category ID could not be determined. Please ensure the selected category exists in the database."); return
+
+            conn = get_db_connection()
+            if not conn: return
             try:
-                selected_main_type = category_name 
                 cursor = conn.cursor()
-                cursor.execute("SELECT MIN(Cat_ID) FROM Category WHERE MainType = %s GROUP BY MainType", (selected_main_type,))
-                cat_row = cursor.fetchone()
-                category_id = cat_row[0] if cat_row else None
 
-                if not title: st.error("Title is required."); return
-                if category_id is None: st.error("Category ID could not be determined. Please ensure the selected category exists in the database."); return
+                # Near-duplicate check (text MinHash + photo dHash) against Available listings, the owner's own first
+                signature = listing_signature(title, description, uploaded_file.getvalue() if uploaded_file else None)
+                duplicates = find_duplicates(cursor, st.session_state.logged_in_srn, signature)
+                own_duplicates = [d for d in duplicates if d.same_owner]
+                if own_duplicates and not list_anyway:
+                    st.warning(
+                        "This looks like something you have already listed: "
+                        + ", ".join(f"'{d.title}' (ID: {d.resource_id})" for d in own_duplicates[:3])
+                        + ". Tick 'List it even if it looks like one of my existing listings' to post it anyway."
+                    )
+                    return
+
+                # Store the photo only once the listing is going in, so rejected submits leave no unreferenced blob.
+                # Register it; the Resource insert trigger then bumps its RefCount
+                saved_image = save_uploaded_file(uploaded_file)
+                image_path_to_db = saved_image[0] if saved_image else None
+                if saved_image:
+                    cursor.execute(
+                        "INSERT INTO ImageBlob (Digest, ImagePath, Bytes) VALUES (%s, %s, %s) ON DUPLICATE KEY UPDATE Digest = Digest",
+                        (saved_image[1].digest, image_path_to_db, saved_image[1].size)
+                    )
 
                 # --- *** CRITICAL FIX 5: Insert the ListingType into Resource ***
                 # This ensures the item is correctly tagged from the moment it's created.
                 query_resource = """
-                INSERT INTO Resource (Title, Description, itemCondition, Status, OwnerID, CategoryID, ImagePath, ListingType)
-                VALUES (%s, %s, %s, 'Available', %s, %s, %s, %s)
+                INSERT INTO Resource (Title, Description, itemCondition, Status, OwnerID, CategoryID, ImagePath, ListingType, BarterPreference)
+                VALUES (%s, %s, %s, 'Available', %s, %s, %s, %s, %s)
                 """
-                cursor.execute(query_resource, (title, description, item_condition, st.session_state.logged_in_srn, category_id, image_path_to_db, action_type))
+                barter_preference = (action_specific_data[1] or None) if action_type == 'barter' else None
+                cursor.execute(query_resource, (title, description, item_condition, st.session_state.logged_in_srn, category_id, image_path_to_db, action_type, barter_preference))
                 resource_id = cursor.lastrowid
                 
                 # This part of your logic was already correct:
@@ -404,8 +662,18 @@ def page_upload_item(action_type):
                     """
                     # Note: Removed BuyerID from insert, as it's NULL on listing
                     cursor.execute(query_bs, (resource_id, st.session_state.logged_in_srn, action_specific_data))
-                
+                elif action_type == 'barter' and action_specific_data[0]:
+                    cursor.executemany(
+                        "INSERT INTO BarterWant (ResourceID, CategoryID) VALUES (%s, %s)",
+                        [(resource_id, category_map[name]) for name in action_specific_data[0]]
+                    )
+
+                # Stored so later uploads find this one through the band/block index; a match is kept as a flag
+                store_signature(cursor, resource_id, signature, duplicate_of=duplicates[0].resource_id if duplicates else None)
+
                 conn.commit()
+                if duplicates and not own_duplicates:
+                    st.toast(f"Similar listings already exist, e.g. '{duplicates[0].title}' (ID: {duplicates[0].resource_id}).")
                 st.success(f"Item '{title}' successfully listed for {action_type}! Resource ID: {resource_id}")
                 navigate_to('home') 
 
@@ -421,279 +689,287 @@ def page_buysell():
     render_back_button()
     st.header("🤝 Buy / Sell Management")
     user_srn = st.session_state.logged_in_srn
-    
-    tab1, tab2 = st.tabs(["Browse Items to Buy", "Confirm Sales"])
 
-    # Tab 1: Browse Items to Buy (R-operation & C-operation for purchase initiation)
-    with tab1:
-        st.subheader("Available Items for Sale")
-        conn = get_db_connection()
-        if not conn: return
-        
-        # This query is now correct because the homepage 
-        # only sends users here for items that are ACTUALLY for sale.
-        query = """
-        SELECT 
-            r.ResourceID, r.Title, r.Description, r.itemCondition, 
-            bs.Price, CONCAT(s.FirstName, ' ', s.LastName) AS SellerName
-        FROM Resource r
-        JOIN Student s ON r.OwnerID = s.SRN
-        JOIN BuySell bs ON r.ResourceID = bs.ItemID 
-        WHERE r.Status = 'Available' 
-          AND r.ListingType = 'Sell' -- Ensures it's a 'Sell' item
-          AND r.OwnerID != %s 
-          AND bs.Status = 'Listed' -- Only show items that are 'Listed'
-        """
-        df = pd.read_sql(query, conn, params=(user_srn,))
-
-        if df.empty:
-            st.info("No items currently listed for sale by others.")
-        else:
-            st.dataframe(df)
-            st.markdown("---")
-            st.markdown("#### Initiate Purchase")
-            
-            # Check if there are any items left to select
-            if df['ResourceID'].empty:
-                st.info("No items available to purchase.")
-                conn.close()
-                return
+    # Only the selected tab runs (and hits the database); actions inside it rerun just that tab
+    active_tab = select_tab("buysell_tab", ['Browse Items to Buy', 'Confirm Sales'])
+    if active_tab == 'Browse Items to Buy': tab_buysell_browse(user_srn)
+    else: tab_buysell_confirm(user_srn)
 
-            buy_resource_id = st.selectbox("Select Resource ID to Purchase", df['ResourceID'].unique())
-            
-            if st.button("Request Purchase"):
+# Tab 1: Browse Items to Buy (R-operation & C-operation for purchase initiation)
+@st.fragment
+@with_db_connection
+def tab_buysell_browse(conn, user_srn):
+    st.subheader("Available Items for Sale")
+
+    # This query is now correct because the homepage 
+    # only sends users here for items that are ACTUALLY for sale.
+    df = pd.read_sql(BUYSELL_LISTINGS, conn, params=(user_srn,))
+
+    if df.empty:
+        st.info("No items currently listed for sale by others.")
+    else:
+        st.dataframe(df)
+        st.markdown("---")
+        st.markdown("#### Initiate Purchase")
+
+        # Check if there are any items left to select
+        if df['ResourceID'].empty:
+            st.info("No items available to purchase.")
+            return
+
+        buy_resource_id = st.selectbox("Select Resource ID to Purchase", df['ResourceID'].unique())
+
+        if st.button("Request Purchase"):
+            cursor = None
+            try:
+                cursor = conn.cursor()
+                # Lock, validate, assign the buyer and open the Transactions row in one server-side call
+                cursor.callproc('purchase_item', (int(buy_resource_id), user_srn))
+                result, _, price = next(cursor.stored_results()).fetchone()
+                conn.commit()
+
+                if result == 'Reserved':
+                    st.success(f"Purchase request initiated for Resource ID: {buy_resource_id} (Price: ₹{price:.2f}). Please provide transaction ID in the **Confirm Sales** tab.")
+                    st.rerun(scope="fragment") # Rerun to update the dataframe
+                elif result == 'Busy':
+                    st.warning("Another student is buying this item right now. Please try again in a moment.")
+                elif result == 'OwnItem':
+                    st.error("You cannot buy your own listing.")
+                else:
+                    st.error("This item is no longer available or already pending.")
+            except mysql.connector.Error as err:
+                st.error(f"Failed to initiate purchase: {err}")
+            finally:
+                if cursor: cursor.close()
+
+# Tab 2: Confirm Sales (This section is correct and implements your payment flow)
+@st.fragment
+@with_db_connection
+def tab_buysell_confirm(conn, user_srn):
+    st.subheader("Payment Validation")
+
+    # Buyer Action (Providing Transaction ID)
+    st.markdown("##### 1. Confirm Your Purchase (Buyer Action)")
+    df_buyer = pd.read_sql(BUYSELL_AWAITING_PAYMENT, conn, params=(user_srn,))
+
+    if not df_buyer.empty:
+        st.dataframe(df_buyer)
+        with st.form("buyer_confirm_form"):
+            confirm_buysell_id = st.selectbox("Select BuySellID to Confirm Payment", df_buyer['BuySellID'].unique(), key="buy_trans_id_select")
+            provided_trans_id = st.text_input("Enter External Transaction ID (e.g., UPI Ref No.)", key="buy_trans_id_input")
+            if st.form_submit_button("Submit Transaction ID"):
                 try:
                     cursor = conn.cursor()
-                    
-                    # Your payment logic is correct
-                    cursor.execute("SELECT SellerID, Price FROM BuySell WHERE ItemID = %s AND Status = 'Listed' LIMIT 1", (buy_resource_id,))
-                    res_info = cursor.fetchone()
-                    
-                    if not res_info:
-                        st.error("This item is no longer available or already pending.")
-                        return
-                    
-                    seller_srn = res_info[0]
-                    price = res_info[1]
-
-                    query_update_bs = """
-                    UPDATE BuySell
-                    SET BuyerID = %s, Status = 'PendingPayment', TransactionDate = CURDATE()
-                    WHERE ItemID = %s AND SellerID = %s AND Status = 'Listed'
-                    """
-                    cursor.execute(query_update_bs, (user_srn, buy_resource_id, seller_srn))
-                    
+                    cursor.execute("UPDATE BuySell SET BuyerTransID = %s, Status = 'PendingConfirmation' WHERE BuySellID = %s", 
+                                   (provided_trans_id, confirm_buysell_id))
                     conn.commit()
-                    st.success(f"Purchase request initiated for Resource ID: {buy_resource_id} (Price: ₹{price:.2f}). Please provide transaction ID in the **Confirm Sales** tab.")
-                    st.rerun() # Rerun to update the dataframe
+                    st.success("Transaction ID submitted! Waiting for the seller's confirmation.")
+                    st.rerun(scope="fragment")
                 except mysql.connector.Error as err:
-                    st.error(f"Failed to initiate purchase: {err}")
+                    st.error(f"Failed to submit Transaction ID: {err}")
                 finally:
                     cursor.close()
-        conn.close()
-
-    # Tab 2: Confirm Sales (This section is correct and implements your payment flow)
-    with tab2:
-        st.subheader("Payment Validation")
-        conn = get_db_connection()
-        if not conn: return
-        
-        # Buyer Action (Providing Transaction ID)
-        st.markdown("##### 1. Confirm Your Purchase (Buyer Action)")
-        query_buyer = """
-        SELECT bs.BuySellID, r.Title, bs.Price, bs.BuyerTransID 
-        FROM BuySell bs
-        JOIN Resource r ON bs.ItemID = r.ResourceID
-        WHERE bs.BuyerID = %s AND bs.BuyerTransID IS NULL AND bs.Status = 'PendingPayment'
-        """
-        df_buyer = pd.read_sql(query_buyer, conn, params=(user_srn,))
-        
-        if not df_buyer.empty:
-            st.dataframe(df_buyer)
-            with st.form("buyer_confirm_form"):
-                confirm_buysell_id = st.selectbox("Select BuySellID to Confirm Payment", df_buyer['BuySellID'].unique(), key="buy_trans_id_select")
-                provided_trans_id = st.text_input("Enter External Transaction ID (e.g., UPI Ref No.)", key="buy_trans_id_input")
-                if st.form_submit_button("Submit Transaction ID"):
-                    try:
-                        cursor = conn.cursor()
-                        cursor.execute("UPDATE BuySell SET BuyerTransID = %s, Status = 'PendingConfirmation' WHERE BuySellID = %s", 
-                                       (provided_trans_id, confirm_buysell_id))
-                        conn.commit()
-                        st.success("Transaction ID submitted! Waiting for the seller's confirmation.")
-                        st.rerun()
-                    except mysql.connector.Error as err:
-                        st.error(f"Failed to submit Transaction ID: {err}")
-                    finally:
-                        cursor.close()
-        else:
-            st.info("You have no pending payments to confirm.")
+    else:
+        st.info("You have no pending payments to confirm.")
 
-        st.markdown("---")
-        # Seller Action (Confirming Transaction ID)
-        st.markdown("##### 2. Confirm Buyer's Transaction ID (Seller Action)")
-        query_seller = """
-        SELECT bs.BuySellID, r.Title, bs.Price, bs.BuyerTransID, s.FirstName AS BuyerName
-        FROM BuySell bs
-        JOIN Resource r ON bs.ItemID = r.ResourceID
-        JOIN Student s ON bs.BuyerID = s.SRN
-        WHERE bs.SellerID = %s AND bs.BuyerTransID IS NOT NULL AND bs.SellerConfirm = FALSE AND bs.Status = 'PendingConfirmation'
-        """
-        df_seller = pd.read_sql(query_seller, conn, params=(user_srn,))
-
-        if not df_seller.empty:
-            st.dataframe(df_seller)
-            with st.form("seller_confirm_form"):
-                confirm_sale_id = st.selectbox("Select BuySellID to CONFIRM Payment Received", df_seller['BuySellID'].unique(), key="sell_trans_id_select")
-                if st.form_submit_button("Confirm Payment & Complete Sale"):
-                    try:
-                        cursor = conn.cursor()
-                        cursor.execute("UPDATE BuySell SET SellerConfirm = TRUE, Status = 'Completed' WHERE BuySellID = %s", (confirm_sale_id,))
-                        conn.commit()
-                        st.success(f"Sale for BuySellID {confirm_sale_id} confirmed and completed! The resource status has been updated to 'Sold'.")
-                        st.rerun()
-                    except mysql.connector.Error as err:
-                        st.error(f"Failed to confirm sale: {err}")
-                    finally:
-                        cursor.close()
-        else:
-             st.info("No sales awaiting your confirmation.")
-        conn.close()
+    st.markdown("---")
+    # Seller Action (Confirming Transaction ID)
+    st.markdown("##### 2. Confirm Buyer's Transaction ID (Seller Action)")
+    df_seller = pd.read_sql(BUYSELL_AWAITING_CONFIRMATION, conn, params=(user_srn,))
+
+    if not df_seller.empty:
+        st.dataframe(df_seller)
+        with st.form("seller_confirm_form"):
+            confirm_sale_id = st.selectbox("Select BuySellID to CONFIRM Payment Received", df_seller['BuySellID'].unique(), key="sell_trans_id_select")
+            if st.form_submit_button("Confirm Payment & Complete Sale"):
+                try:
+                    cursor = conn.cursor()
+                    cursor.execute("UPDATE BuySell SET SellerConfirm = TRUE, Status = 'Completed' WHERE BuySellID = %s", (confirm_sale_id,))
+                    conn.commit()
+                    st.success(f"Sale for BuySellID {confirm_sale_id} confirmed and completed! The resource status has been updated to 'Sold'.")
+                    st.rerun(scope="fragment")
+                except mysql.connector.Error as err:
+                    st.error(f"Failed to confirm sale: {err}")
+                finally:
+                    cursor.close()
+    else:
+         st.info("No sales awaiting your confirmation.")
 
 def page_lendborrow():
     render_back_button()
     st.header("📚 Lend / Borrow Management")
     user_srn = st.session_state.logged_in_srn
-    
-    tab1, tab2 = st.tabs(["Browse Items to Borrow", "Manage Active Loans"])
 
-    # Tab 1: Browse Items to Borrow (R-operation & C-operation for loan)
-    with tab1:
-        st.subheader("Available Items to Borrow")
-        conn = get_db_connection()
-        if not conn: return
-        
-        # This query is now correct because the homepage 
-        # only sends users here for items that are ACTUALLY for lend.
-        query = """
-        SELECT 
-            r.ResourceID, r.Title, r.Description, r.itemCondition, 
-            CONCAT(s.FirstName, ' ', s.LastName) AS LenderName
-        FROM Resource r
-        JOIN Student s ON r.OwnerID = s.SRN
-        WHERE r.Status = 'Available' 
-          AND r.ListingType = 'Lend' -- This is the fix
-          AND r.OwnerID != %s
-        """
-        df = pd.read_sql(query, conn, params=(user_srn,))
-        
-        if df.empty:
-            st.info("No items currently available to borrow.")
-            conn.close()
-            return
+    # Only the selected tab runs (and hits the database); actions inside it rerun just that tab
+    active_tab = select_tab("lendborrow_tab", ['Browse Items to Borrow', 'Reserve for Later', 'Manage Active Loans'])
+    if active_tab == 'Browse Items to Borrow': tab_lendborrow_browse(user_srn)
+    elif active_tab == 'Reserve for Later': tab_lendborrow_reserve(user_srn)
+    else: tab_lendborrow_loans(user_srn)
 
-        st.dataframe(df)
+# Tab 1: Browse Items to Borrow (R-operation & C-operation for loan)
+@st.fragment
+@with_db_connection
+def tab_lendborrow_browse(conn, user_srn):
+    st.subheader("Available Items to Borrow")
 
-        st.markdown("---")
-        st.markdown("#### Request to Borrow")
-        
-        if df['ResourceID'].empty:
-            conn.close()
-            return
-            
-        borrow_resource_id = st.selectbox("Select Resource ID to Borrow", df['ResourceID'].unique())
-        start_date = st.date_input("Start Date", datetime.today())
-        default_end_date = datetime.today() + pd.Timedelta(days=7) 
-        end_date = st.date_input("Planned Return Date (Late fee of ₹10/day applies)", default_end_date)
-        
-        if st.button("Initiate Borrow"):
-            if end_date <= start_date:
-                st.error("Return Date must be after Start Date.")
-            else:
+    # This query is now correct because the homepage 
+    # only sends users here for items that are ACTUALLY for lend.
+    df = pd.read_sql(LEND_LISTINGS, conn, params=(user_srn,))
+
+    if df.empty:
+        st.info("No items currently available to borrow.")
+        return
+
+    st.dataframe(df)
+
+    st.markdown("---")
+    st.markdown("#### Request to Borrow")
+
+    if df['ResourceID'].empty:
+        return
+
+    borrow_resource_id = st.selectbox("Select Resource ID to Borrow", df['ResourceID'].unique())
+    start_date = st.date_input("Start Date", datetime.today())
+    default_end_date = datetime.today() + pd.Timedelta(days=7) 
+    end_date = st.date_input("Planned Return Date (Late fee of ₹10/day applies)", default_end_date)
+
+    if st.button("Initiate Borrow"):
+        if end_date <= start_date:
+            st.error("Return Date must be after Start Date.")
+        else:
+            cursor = conn.cursor()
+            cursor.execute("SELECT OwnerID FROM Resource WHERE ResourceID = %s", (borrow_resource_id,))
+            lender_srn_tuple = cursor.fetchone()
+
+            if not lender_srn_tuple:
+                st.error("Resource not found.")
+                cursor.close()
+                return
+
+            lender_srn = lender_srn_tuple[0]
+
+            try:
+                # Your logic for calling the stored procedure is correct.
+                cursor.callproc('initiate_lend', (borrow_resource_id, lender_srn, user_srn, start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'), 0)) 
+                conn.commit()
+                st.success(f"Borrowing initiated for Resource ID: {borrow_resource_id}. Resource status updated to 'Unavailable'.")
+                st.rerun(scope="fragment")
+            except mysql.connector.Error as err:
+                st.error(f"Failed to initiate loan: {err}")
+            finally:
+                if cursor: cursor.close()
+
+# Tab 2: Reserve for Later (bookings on the lending calendar, see LendReservation)
+@st.fragment
+@with_db_connection
+def tab_lendborrow_reserve(conn, user_srn):
+    st.subheader("Reserve an Item for Later")
+    st.caption("Book a lend item for future dates, even while someone else has it. If the dates are taken you join the waitlist, and when the current borrower returns it, a booking that is due becomes your loan automatically.")
+
+    col_from, col_until = st.columns(2)
+    reserve_from = col_from.date_input("From", datetime.today() + pd.Timedelta(days=1), key="reserve_from")
+    reserve_until = col_until.date_input("Until (return date)", datetime.today() + pd.Timedelta(days=8), key="reserve_until")
+    if reserve_until < reserve_from:
+        st.error("Return Date must not be before the start date.")
+        return
+    window_end = (reserve_until + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+
+    # One covering-index probe per item (idx_lres_calendar): is any booking overlapping [from, until + 1)?
+    df_items = pd.read_sql(LEND_CALENDAR, conn, params=(window_end, reserve_from.strftime('%Y-%m-%d'), user_srn))
+
+    if df_items.empty:
+        st.info("No items are listed for lending by others.")
+    else:
+        df_items['FreeForDates'] = df_items['FreeForDates'].astype(bool)
+        st.dataframe(df_items)
+        reserve_id = st.selectbox("Select Resource ID to Reserve", df_items['ResourceID'].unique(), key="reserve_id_select")
+        if st.button("Reserve", key="reserve_btn"):
+            cursor = None
+            try:
                 cursor = conn.cursor()
-                cursor.execute("SELECT OwnerID FROM Resource WHERE ResourceID = %s", (borrow_resource_id,))
-                lender_srn_tuple = cursor.fetchone()
-                
-                if not lender_srn_tuple:
-                    st.error("Resource not found.")
-                    cursor.close()
-                    conn.close()
-                    return
-                
-                lender_srn = lender_srn_tuple[0]
-                
+                cursor.callproc('reserve_lend', (int(reserve_id), user_srn, reserve_from.strftime('%Y-%m-%d'), reserve_until.strftime('%Y-%m-%d')))
+                _, status = next(cursor.stored_results()).fetchone()
+                conn.commit()
+                if status == 'Reserved': st.success(f"Resource ID {reserve_id} is reserved for you from {reserve_from} to {reserve_until}.")
+                else: st.warning(f"Those dates are taken for Resource ID {reserve_id}; you are on the waitlist.")
+            except mysql.connector.Error as err:
+                st.error(f"Failed to reserve: {err.msg.removeprefix('reserve_lend: ')}")
+            finally:
+                if cursor: cursor.close()
+
+    st.markdown("---")
+    st.markdown("#### My Reservations")
+    df_mine = pd.read_sql(MY_RESERVATIONS, conn, params=(user_srn,))
+    if df_mine.empty:
+        st.info("You have no open reservations.")
+    else:
+        st.dataframe(df_mine)
+        st.caption("A reserved item that is already back with its owner can be borrowed from the 'Browse Items to Borrow' tab; the reservation turns into the loan.")
+        cancel_id = st.selectbox("Select Reservation ID to Cancel", df_mine['ReservationID'].unique(), key="cancel_reservation_select")
+        if st.button("Cancel Reservation", key="cancel_reservation_btn"):
+            cursor = None
+            try:
+                cursor = conn.cursor()
+                cursor.callproc('cancel_lend_reservation', (int(cancel_id), user_srn))
+                conn.commit()
+                st.rerun(scope="fragment")
+            except mysql.connector.Error as err:
+                st.error(f"Failed to cancel: {err.msg.removeprefix('cancel_lend_reservation: ')}")
+            finally:
+                if cursor: cursor.close()
+
+# Tab 3: Manage Active Loans (This logic was already correct)
+@st.fragment
+@with_db_connection
+def tab_lendborrow_loans(conn, user_srn):
+    st.subheader("Manage Items to Return")
+
+    df_loans = pd.read_sql(MY_LOANS, conn, params=(user_srn,))
+
+    if df_loans.empty:
+        st.info("No active or historical items borrowed.")
+    else:
+        st.dataframe(df_loans)
+
+        st.markdown("---")
+        st.markdown("#### Item Actions")
+
+        # Actions for ONGOING loans
+        df_ongoing = df_loans[df_loans['Status'] == 'Ongoing']
+        if not df_ongoing.empty:
+            return_id = st.selectbox("Select Loan ID to Return", df_ongoing['LendBorrowID'].unique(), key="return_id_select")
+
+            if st.button("Confirm Return Early / On Time", key="confirm_return_btn"):
                 try:
-                    # Your logic for calling the stored procedure is correct.
-                    cursor.callproc('initiate_lend', (borrow_resource_id, lender_srn, user_srn, start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'), 0)) 
+                    cursor = conn.cursor()
+                    cursor.callproc('complete_lend_with_penalty', (return_id,))
                     conn.commit()
-                    st.success(f"Borrowing initiated for Resource ID: {borrow_resource_id}. Resource status updated to 'Unavailable'.")
-                    st.rerun()
+
+                    cursor.execute("SELECT PenaltyAmount FROM LendBorrow WHERE LendBorrowID = %s", (return_id,))
+                    penalty_tuple = cursor.fetchone()
+                    penalty = penalty_tuple[0] if penalty_tuple else 0
+
+                    if penalty > 0:
+                        st.warning(f"Item returned. **LATE RETURN** - A penalty of **₹{penalty:.2f}** has been applied.")
+                    else:
+                        st.success("Item successfully returned and loan completed!")
+                    st.rerun(scope="fragment")
                 except mysql.connector.Error as err:
-                    st.error(f"Failed to initiate loan: {err}")
+                    st.error(f"Failed to process return: {err}")
                 finally:
                     if cursor: cursor.close()
-        conn.close()
 
-    # Tab 2: Manage Active Loans (This logic was already correct)
-    with tab2:
-        st.subheader("Manage Items to Return")
-        conn = get_db_connection()
-        if not conn: return
-        
-        query = """
-        SELECT 
-            lb.LendBorrowID, r.Title, lb.StartDate, lb.EndDate, lb.Status, 
-            DATEDIFF(CURDATE(), lb.EndDate) AS DaysLate, 
-            r.ResourceID
-        FROM LendBorrow lb
-        JOIN Resource r ON lb.itemID = r.ResourceID
-        WHERE lb.BorrowerID = %s
-        ORDER BY lb.StartDate DESC
-        """
-        df_loans = pd.read_sql(query, conn, params=(user_srn,))
-
-        if df_loans.empty:
-            st.info("No active or historical items borrowed.")
-        else:
-            st.dataframe(df_loans)
-            
-            st.markdown("---")
-            st.markdown("#### Item Actions")
+        # --- REVIEW BUTTON HINT: Display review options for COMPLETED loans ---
+        completed_ids = [int(item_id) for item_id in df_loans.loc[df_loans['Status'] == 'Completed', 'ResourceID'].unique()]
+        pending_review = False
+        if completed_ids:
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT 1 FROM ReviewEligibility WHERE STD_ID = %s AND ItemID IN ({placeholders(completed_ids)}) LIMIT 1", [user_srn] + completed_ids)
+            pending_review = cursor.fetchone() is not None
+            cursor.close()
 
-            # Actions for ONGOING loans
-            df_ongoing = df_loans[df_loans['Status'] == 'Ongoing']
-            if not df_ongoing.empty:
-                return_id = st.selectbox("Select Loan ID to Return", df_ongoing['LendBorrowID'].unique(), key="return_id_select")
-                
-                if st.button("Confirm Return Early / On Time", key="confirm_return_btn"):
-                    try:
-                        cursor = conn.cursor()
-                        cursor.callproc('complete_lend_with_penalty', (return_id,))
-                        conn.commit()
-                        
-                        cursor.execute("SELECT PenaltyAmount FROM LendBorrow WHERE LendBorrowID = %s", (return_id,))
-                        penalty_tuple = cursor.fetchone()
-                        penalty = penalty_tuple[0] if penalty_tuple else 0
-                        
-                        if penalty > 0:
-                            st.warning(f"Item returned. **LATE RETURN** - A penalty of **₹{penalty:.2f}** has been applied.")
-                        else:
-                            st.success("Item successfully returned and loan completed!")
-                        st.rerun()
-                    except mysql.connector.Error as err:
-                        st.error(f"Failed to process return: {err}")
-                    finally:
-                        if cursor: cursor.close()
-
-            # --- REVIEW BUTTON HINT: Display review options for COMPLETED loans ---
-            df_completed_unreviewed = df_loans[
-                (df_loans['Status'] == 'Completed') & 
-                (~df_loans['ResourceID'].isin(pd.read_sql("SELECT ItemID FROM Review WHERE STD_ID = %s", conn, params=(user_srn,))['ItemID']))
-            ]
-            
-            if not df_completed_unreviewed.empty:
-                st.info("You have completed loans pending review. Please use the 'My Reviews' tab in 'My Activity'.")
-                
-        conn.close()
+        if pending_review:
+            st.info("You have completed loans pending review. Please use the 'My Reviews' tab in 'My Activity'.")
 
 def page_barter():
     render_back_button()
@@ -704,214 +980,195 @@ def page_barter():
     if 'barter_proposed' not in st.session_state:
         st.session_state.barter_proposed = False
 
-    tab1, tab2, tab3 = st.tabs(["Propose Barter", "Review Proposals", "My Barters"])
-    
+    # Only the selected tab runs (and hits the database); actions inside it rerun just that tab
+    active_tab = select_tab("barter_tab", ['Propose Barter', 'Review Proposals', 'Trade Circles', 'My Barters'])
+    if active_tab == 'Propose Barter': tab_barter_propose(user_srn)
+    elif active_tab == 'Review Proposals': tab_barter_review(user_srn)
+    elif active_tab == 'Trade Circles': tab_barter_circles(user_srn)
+    else: tab_barter_history(user_srn)
+
+# Tab 1: Propose Barter (C-operation)
+@st.fragment
+def tab_barter_propose(user_srn):
+    st.subheader("Propose a New Barter")
     conn = get_db_connection()
     if not conn: return
     # Users can only offer their own 'Barter' items
-    user_resources = pd.read_sql("SELECT ResourceID, Title FROM Resource WHERE OwnerID = %s AND Status = 'Available' AND ListingType = 'Barter'", conn, params=(user_srn,))
+    user_resources = pd.read_sql(MY_BARTER_LISTINGS, conn, params=(user_srn,))
     resource_map = {f"{r['Title']} (ID: {r['ResourceID']})": r['ResourceID'] for r in user_resources.to_dict('records')}
     resource_names = list(resource_map.keys())
     conn.close()
 
-    # Tab 1: Propose Barter (C-operation)
-    with tab1:
-        st.subheader("Propose a New Barter")
+    # --- FIX: Logic to show message OR form ---
+    if st.session_state.get('barter_proposed', False):
+        st.success("✅ Barter proposal submitted! Awaiting acceptance.")
+        st.info("The other user will see this in their 'Review Proposals' tab.")
+        # This hides the form by not running the 'else' block
 
-        # --- FIX: Logic to show message OR form ---
-        if st.session_state.get('barter_proposed', False):
-            st.success("✅ Barter proposal submitted! Awaiting acceptance.")
-            st.info("The other user will see this in their 'Review Proposals' tab.")
-            # This hides the form by not running the 'else' block
-        
-        else:
-            # This 'else' block contains all your original form logic
-            if not resource_names:
-                st.info("You must have 'Barter' items listed as 'Available' to propose a trade.")
-                return
+    else:
+        # This 'else' block contains all your original form logic
+        if not resource_names:
+            st.info("You must have 'Barter' items listed as 'Available' to propose a trade.")
+            return
 
-            conn = get_db_connection()
-            if not conn: return
-            
-            # Users can only trade for other 'Barter' items
-            query_others = """
-            SELECT ResourceID, Title, CONCAT(s.FirstName, ' ', s.LastName) AS OwnerName
-            FROM Resource r JOIN Student s ON r.OwnerID = s.SRN
-            WHERE r.Status = 'Available' 
-              AND r.ListingType = 'Barter' -- This is the fix
-              AND r.OwnerID != %s
-            """
-            df_others = pd.read_sql(query_others, conn, params=(user_srn,))
-            conn.close()
+        conn = get_db_connection()
+        if not conn: return
 
-            if df_others.empty:
-                st.info("No available 'Barter' items from other students to trade with.")
-                return
+        # Users can only trade for other 'Barter' items
+        df_others = pd.read_sql(BARTER_LISTINGS, conn, params=(user_srn,))
+        conn.close()
 
-            other_map = {f"{r['Title']} (Owner: {r['OwnerName']}) (ID: {r['ResourceID']})": r['ResourceID'] for r in df_others.to_dict('records')}
-            other_names = list(other_map.keys())
+        if df_others.empty:
+            st.info("No available 'Barter' items from other students to trade with.")
+            return
 
-            with st.form("propose_barter_form"):
-                item1_name = st.selectbox("Your Item (Item 1)", resource_names)
-                item2_name = st.selectbox("Item You Want (Item 2)", other_names)
-                
-                if st.form_submit_button("Submit Barter Proposal"):
-                    item1_id = resource_map[item1_name]
-                    item2_id = other_map[item2_name]
-                    
-                    conn = get_db_connection()
-                    if conn:
-                        try:
-                            cursor = conn.cursor()
-                            cursor.execute("SELECT OwnerID FROM Resource WHERE ResourceID = %s", (item2_id,))
-                            accepter_id_tuple = cursor.fetchone()
-                            if not accepter_id_tuple:
-                                st.error("Target item not found.")
-                                return
-                            accepter_id = accepter_id_tuple[0]
-                            
-                            cursor.execute("INSERT INTO Transactions (Type) VALUES ('Barter')")
-                            trans_id = cursor.lastrowid
-                            
-                            query = """
-                            INSERT INTO Barter (Item1ID, Item2ID, ProposerID, AccepterID, Status, BarterDate, TransactionID)
-                            VALUES (%s, %s, %s, %s, 'Pending', CURDATE(), %s)
-                            """
-                            cursor.execute(query, (item1_id, item2_id, user_srn, accepter_id, trans_id))
-                            conn.commit()
-                            
-                            # --- FIX: Set the flag and rerun ---
-                            st.session_state.barter_proposed = True
-                            st.rerun()
+        other_map = {f"{r['Title']} (Owner: {r['OwnerName']}) (ID: {r['ResourceID']})": r['ResourceID'] for r in df_others.to_dict('records')}
+        other_names = list(other_map.keys())
 
-                        except mysql.connector.Error as err:
-                            st.error(f"Failed to submit barter: {err}")
-                        finally:
-                            cursor.close()
-                            conn.close()
+        with st.form("propose_barter_form"):
+            item1_name = st.selectbox("Your Item (Item 1)", resource_names)
+            item2_name = st.selectbox("Item You Want (Item 2)", other_names)
 
-    # Tab 2: Review Proposals (U-operation - Acceptance)
-    with tab2:
-        st.subheader("Proposals to Review")
-        
-        # --- FIX: Added info box for debugging ---
-        st.info(f"📋 Checking for proposals where you ({user_srn}) are the 'Accepter'.")
+            if st.form_submit_button("Submit Barter Proposal"):
+                item1_id = resource_map[item1_name]
+                item2_id = other_map[item2_name]
 
-        conn = get_db_connection()
-        if not conn: return
-        
-        # This query is correct.
-        query = """
-        SELECT b.BarterID, r1.Title AS ProposerItem, r2.Title AS YourItem, 
-               CONCAT(s.FirstName, ' ', s.LastName) AS ProposerName
-        FROM Barter b
-        JOIN Resource r1 ON b.Item1ID = r1.ResourceID
-        JOIN Resource r2 ON b.Item2ID = r2.ResourceID
-        JOIN Student s ON b.ProposerID = s.SRN
-        WHERE b.AccepterID = %s AND b.Status = 'Pending'
-        """
-        df_proposals = pd.read_sql(query, conn, params=(user_srn,))
-        
-        if not df_proposals.empty:
-            st.dataframe(df_proposals)
-            with st.form("review_barter_form"):
-                barter_to_review = st.selectbox("Select Barter ID to Accept/Reject", df_proposals['BarterID'].unique())
-                
-                col_accept, col_reject = st.columns(2)
-                
-                if col_accept.form_submit_button("Accept Barter"):
+                conn = get_db_connection()
+                if conn:
                     try:
                         cursor = conn.cursor()
-                        cursor.execute("UPDATE Barter SET Status = 'Accepted' WHERE BarterID = %s", (barter_to_review,))
+                        # Ownership, availability and duplicate checks plus both inserts happen server-side
+                        cursor.callproc('propose_barter', (int(item1_id), int(item2_id), user_srn))
+                        for result in cursor.stored_results(): result.fetchall()
                         conn.commit()
-                        st.success(f"Barter ID {barter_to_review} accepted! Item statuses updated. Coordinate the exchange.")
-                        st.rerun()
+
+                        # --- FIX: Set the flag and rerun ---
+                        st.session_state.barter_proposed = True
+                        st.rerun(scope="fragment")
+
                     except mysql.connector.Error as err:
-                        st.error(f"Failed to accept barter: {err}")
+                        st.error(f"Failed to submit barter: {err.msg.removeprefix('propose_barter: ')}")
                     finally:
                         cursor.close()
-                
-                if col_reject.form_submit_button("Reject Barter"):
+                        conn.close()
+
+# Tab 2: Review Proposals (U-operation - Acceptance)
+@st.fragment
+@with_db_connection
+def tab_barter_review(conn, user_srn):
+    st.subheader("Proposals to Review")
+
+    # --- FIX: Added info box for debugging ---
+    st.info(f"📋 Checking for proposals where you ({user_srn}) are the 'Accepter'.")
+
+    # This query is correct.
+    df_proposals = pd.read_sql(BARTER_PROPOSALS, conn, params=(user_srn,))
+
+    if not df_proposals.empty:
+        st.dataframe(df_proposals)
+        with st.form("review_barter_form"):
+            barter_to_review = st.selectbox("Select Barter ID to Accept/Reject", df_proposals['BarterID'].unique())
+
+            col_accept, col_reject = st.columns(2)
+
+            if col_accept.form_submit_button("Accept Barter"):
+                try:
+                    cursor = conn.cursor()
+                    cursor.execute("UPDATE Barter SET Status = 'Accepted' WHERE BarterID = %s", (barter_to_review,))
+                    conn.commit()
+                    st.success(f"Barter ID {barter_to_review} accepted! Item statuses updated. Coordinate the exchange.")
+                    st.rerun(scope="fragment")
+                except mysql.connector.Error as err:
+                    st.error(f"Failed to accept barter: {err}")
+                finally:
+                    cursor.close()
+
+            if col_reject.form_submit_button("Reject Barter"):
+                try:
+                    cursor = conn.cursor()
+                    cursor.execute("UPDATE Barter SET Status = 'Rejected' WHERE BarterID = %s", (barter_to_review,))
+                    conn.commit()
+                    st.warning(f"Barter ID {barter_to_review} rejected.")
+                    st.rerun(scope="fragment")
+                except mysql.connector.Error as err:
+                    st.error(f"Failed to reject barter: {err}")
+                finally:
+                    cursor.close()
+    else:
+        st.info("No pending barter proposals for you to review.")
+
+# Tab 3: Trade Circles (multi-party exchanges proposed by barter_match.py)
+@st.fragment
+@with_db_connection
+def tab_barter_circles(conn, user_srn):
+    st.subheader("Trade Circles")
+    st.caption("Exchanges found for you in which every member gets something they asked for. Each one goes ahead once every member accepts.")
+
+    df_legs = pd.read_sql(BARTER_CIRCLES, conn, params=(user_srn,))
+
+    if df_legs.empty:
+        st.info("No trade circles for you right now. Listing barter items with wanted categories lets the matcher find some.")
+        return
+
+    for cycle_id, legs in df_legs.groupby('CycleID', sort=False):
+        with st.container(border=True):
+            st.markdown(f"**Circle #{cycle_id}** ({len(legs)} students)")
+            for leg in legs.to_dict('records'):
+                status_icon = {'Accepted': '✅', 'Declined': '❌'}.get(leg['Response'], '⏳')
+                st.markdown(f"{status_icon} {leg['GiverName']} gives **{leg['Title']}** to {leg['ReceiverName']}")
+            my_leg = legs[legs['GiverID'] == user_srn].iloc[0]
+            if my_leg['Response'] != 'Pending':
+                st.caption("Waiting for the other members to respond.")
+                continue
+            col_accept, col_decline = st.columns(2)
+            for column, accept, label in ((col_accept, True, "Accept"), (col_decline, False, "Decline")):
+                if column.button(label, key=f"cycle_{cycle_id}_{label}", use_container_width=True):
+                    cursor = None
                     try:
                         cursor = conn.cursor()
-                        cursor.execute("UPDATE Barter SET Status = 'Rejected' WHERE BarterID = %s", (barter_to_review,))
+                        cursor.callproc('respond_barter_cycle', (int(cycle_id), user_srn, accept))
+                        status = next(cursor.stored_results()).fetchone()[0]
                         conn.commit()
-                        st.warning(f"Barter ID {barter_to_review} rejected.")
-                        st.rerun()
+                        if status == 'Completed': st.success("Everyone accepted! Coordinate the hand-overs with your circle.")
+                        elif status == 'Expired': st.warning("One of the items is no longer available, so this circle was cancelled.")
+                        st.rerun(scope="fragment")
                     except mysql.connector.Error as err:
-                        st.error(f"Failed to reject barter: {err}")
+                        st.error(f"Failed to respond: {err.msg.removeprefix('respond_barter_cycle: ')}")
                     finally:
-                        cursor.close()
+                        if cursor: cursor.close()
+
+# Tab 4: My Barters (R-operation - Status Check)
+@st.fragment
+def tab_barter_history(user_srn):
+    st.subheader("My Barter History")
+    conn = get_db_connection()
+    if conn:
+        # --- FIX: This query is now from the user's perspective and ONLY shows 'Accepted' ---
+        df_history = pd.read_sql(BARTER_HISTORY, conn, params=(user_srn, user_srn))
+        if df_history.empty:
+            st.info("No accepted barter history found.")
         else:
-            st.info("No pending barter proposals for you to review.")
+            st.dataframe(df_history, hide_index=True)
         conn.close()
 
-    # Tab 3: My Barters (R-operation - Status Check)
-    with tab3:
-        st.subheader("My Barter History")
-        conn = get_db_connection()
-        if conn:
-            # --- FIX: This query is now from the user's perspective and ONLY shows 'Accepted' ---
-            query_history = """
-            (
-                -- I was the Proposer (I GAVE Item1, I RECEIVED Item2)
-                SELECT 
-                    b.BarterID, 
-                    r1.Title AS 'Item You Gave',
-                    r2.Title AS 'Item You Received',
-                    CONCAT(s_acc.FirstName, ' ', s_acc.LastName) AS 'Traded With',
-                    b.Status, 
-                    b.BarterDate
-                FROM Barter b
-                JOIN Resource r1 ON b.Item1ID = r1.ResourceID
-                JOIN Resource r2 ON b.Item2ID = r2.ResourceID
-                JOIN Student s_acc ON b.AccepterID = s_acc.SRN
-                WHERE b.ProposerID = %s AND b.Status = 'Accepted'
-            )
-            UNION
-            (
-                -- I was the Accepter (I GAVE Item2, I RECEIVED Item1)
-                SELECT 
-                    b.BarterID, 
-                    r2.Title AS 'Item You Gave',
-                    r1.Title AS 'Item You Received',
-                    CONCAT(s_prop.FirstName, ' ', s_prop.LastName) AS 'Traded With',
-                    b.Status, 
-                    b.BarterDate
-                FROM Barter b
-                JOIN Resource r1 ON b.Item1ID = r1.ResourceID
-                JOIN Resource r2 ON b.Item2ID = r2.ResourceID
-                JOIN Student s_prop ON b.ProposerID = s_prop.SRN
-                WHERE b.AccepterID = %s AND b.Status = 'Accepted'
-            )
-            ORDER BY BarterDate DESC
-            """
-            df_history = pd.read_sql(query_history, conn, params=(user_srn, user_srn))
-            if df_history.empty:
-                st.info("No accepted barter history found.")
-            else:
-                st.dataframe(df_history, hide_index=True)
-            conn.close()
-
-def page_my_activity():
+@with_db_connection
+def page_my_activity(conn):
     render_back_button()
     st.header("⚙️ My Resources and Activity")
     user_srn = st.session_state.logged_in_srn
-    conn = get_db_connection()
-    if not conn: return
+
+    # Read queries run concurrently, one connection each from the dashboard's own pool
+    set_route(st.session_state.page)
+    data = load_dashboard(get_dashboard_pool(), user_srn, timeout=DASHBOARD_QUERY_TIMEOUT)
+    for query_name, error in data.errors.items():
+        st.warning(f"Could not load '{query_name}': {error}")
 
     tab1, tab2, tab3, tab4 = st.tabs(["My Resources (Owner)", "My Purchases", "My Loans", "My Reviews/Reminders"])
 
     # Tab 1: My Resources (Owner/Delete)
     with tab1:
         st.subheader("Items I Own")
-        query_resources = """
-        SELECT r.ResourceID, r.Title, r.itemCondition, r.Status, c.MainType, r.ListingType
-        FROM Resource r
-        JOIN Category c ON r.CategoryID = c.Cat_ID
-        WHERE r.OwnerID = %s
-        """
-        df_resources = pd.read_sql(query_resources, conn, params=(user_srn,))
+        df_resources = data.resources
         
         if not df_resources.empty:
             st.dataframe(df_resources)
@@ -1020,6 +1277,8 @@ def page_my_activity():
                         # Requires ON DELETE CASCADE on: BuySell, LendBorrow, Barter, Review
                         cursor.execute("DELETE FROM Resource WHERE ResourceID = %s AND OwnerID = %s", (delete_id, user_srn))
                         conn.commit()
+                        get_search_index().remove(int(delete_id))
+                        get_similarity_index().remove(int(delete_id))
                         st.success(f"Resource ID {delete_id} deleted successfully (and all related records).")
                         st.rerun()
                     except mysql.connector.Error as err:
@@ -1032,51 +1291,15 @@ def page_my_activity():
     # Tab 2: My Purchases (Bought/Bartered)
     with tab2:
         st.subheader("Purchased Items (Buy/Sell)")
-        # This correctly shows the 'Completed' status
-        query_purchases = """
-        SELECT bs.BuySellID, r.Title, bs.Price, bs.Status AS SaleStatus, bs.TransactionDate
-        FROM BuySell bs
-        JOIN Resource r ON bs.ItemID = r.ResourceID
-        WHERE bs.BuyerID = %s AND bs.Status IN ('Completed', 'PendingPayment', 'PendingConfirmation');
-        """
-        df_purchases = pd.read_sql(query_purchases, conn, params=(user_srn,))
-        st.dataframe(df_purchases, hide_index=True)
+        st.dataframe(data.purchases, hide_index=True)
         
         st.subheader("Bartered Items (Acquired)")
-        # --- FIX: This query is now correct. It checks both roles (Proposer/Accepter) ---
-        query_barter_acquired = """
-        (
-            -- Find items I acquired as the PROPOSER (I get Item2)
-            SELECT b.BarterID, r2.Title AS AcquiredItemTitle, b.BarterDate, b.Status
-            FROM Barter b
-            JOIN Resource r2 ON b.Item2ID = r2.ResourceID -- Item I received
-            WHERE b.ProposerID = %s AND b.Status = 'Accepted'
-        )
-        UNION
-        (
-            -- Find items I acquired as the ACCEPTER (I get Item1)
-            SELECT b.BarterID, r1.Title AS AcquiredItemTitle, b.BarterDate, b.Status
-            FROM Barter b
-            JOIN Resource r1 ON b.Item1ID = r1.ResourceID -- Item I received
-            WHERE b.AccepterID = %s AND b.Status = 'Accepted'
-        )
-        ORDER BY BarterDate DESC
-        """
-        df_barter_acquired = pd.read_sql(query_barter_acquired, conn, params=(user_srn, user_srn))
-        st.dataframe(df_barter_acquired, hide_index=True)
+        st.dataframe(data.barter_acquired, hide_index=True)
 
     # Tab 3: My Loans (Borrowed/Lent)
     with tab3:
         st.subheader("Borrowed Items (My Responsibility)")
-        query_borrowed = """
-        SELECT lb.LendBorrowID, r.Title, lb.StartDate, lb.EndDate, lb.Status, 
-               lb.PenaltyAmount, r.ResourceID
-        FROM LendBorrow lb
-        JOIN Resource r ON lb.itemID = r.ResourceID
-        WHERE lb.BorrowerID = %s
-        ORDER BY lb.StartDate DESC;
-        """
-        df_borrowed = pd.read_sql(query_borrowed, conn, params=(user_srn,))
+        df_borrowed = data.borrowed
         st.dataframe(df_borrowed, hide_index=True)
 
         # --- Display Return/Review Buttons for Borrowed Items ---
@@ -1114,51 +1337,22 @@ def page_my_activity():
                         if cursor: cursor.close()
         
         st.subheader("Items I Have Lent Out")
-        query_lent = """
-        SELECT lb.LendBorrowID, r.Title, lb.StartDate, lb.EndDate, lb.Status, 
-               CONCAT(s.FirstName, ' ', s.LastName) AS Borrower
-        FROM LendBorrow lb
-        JOIN Resource r ON lb.itemID = r.ResourceID
-        JOIN Student s ON lb.BorrowerID = s.SRN
-        WHERE lb.LenderID = %s;
-        """
-        df_lent = pd.read_sql(query_lent, conn, params=(user_srn,))
-        st.dataframe(df_lent, hide_index=True)
+        st.dataframe(data.lent, hide_index=True)
 
 
     # Tab 4: My Reviews (Reminders/Reviews)
     with tab4:
         st.subheader("My Reminders")
-        query_reminders = "SELECT ReminderID, Msg, RDate, Status FROM Reminder WHERE STD_ID = %s ORDER BY RDate DESC"
-        df_reminders = pd.read_sql(query_reminders, conn, params=(user_srn,))
-        st.dataframe(df_reminders, hide_index=True)
+        st.dataframe(data.reminders, hide_index=True)
         
         st.subheader("My Reviews")
-        query_reviews = """
-        SELECT rv.Rating, rv.Comments, r.Title, r.ResourceID
-        FROM Review rv JOIN Resource r ON rv.ItemID = r.ResourceID WHERE rv.STD_ID = %s
-        """
-        df_reviews = pd.read_sql(query_reviews, conn, params=(user_srn,))
-        st.dataframe(df_reviews)
+        st.dataframe(data.reviews)
 
         st.markdown("---")
         st.subheader("Submit a New Review")
         
-        # Determine items eligible for review (Completed transactions without a review)
-        query_eligible = """
-        SELECT DISTINCT r.ResourceID, r.Title
-        FROM Resource r
-        JOIN LendBorrow lb ON r.ResourceID = lb.ItemID AND lb.BorrowerID = %s AND lb.Status = 'Completed'
-        LEFT JOIN Review rv ON r.ResourceID = rv.ItemID AND rv.STD_ID = %s
-        WHERE rv.ReviewID IS NULL
-        UNION
-        SELECT DISTINCT r.ResourceID, r.Title
-        FROM Resource r
-        JOIN BuySell bs ON r.ResourceID = bs.ItemID AND bs.BuyerID = %s AND bs.Status = 'Completed'
-        LEFT JOIN Review rv ON r.ResourceID = rv.ItemID AND rv.STD_ID = %s
-        WHERE rv.ReviewID IS NULL
-        """
-        df_eligible = pd.read_sql(query_eligible, conn, params=(user_srn, user_srn, user_srn, user_srn))
+        # Items eligible for review (Completed transactions without a review)
+        df_eligible = data.eligible
         
         if not df_eligible.empty:
             eligible_map = {f"{r['Title']} (ID: {r['ResourceID']})": r['ResourceID'] for r in df_eligible.to_dict('records')}
@@ -1181,20 +1375,98 @@ def page_my_activity():
         else:
             st.info("No items are eligible for a new review.")
 
-    conn.close()
+# --- Admin: Query Metrics ---
+def page_metrics():
+    render_back_button()
+    st.header("📈 Query Metrics")
+    if st.session_state.logged_in_srn not in METRICS_ADMINS:
+        st.error("This page is only available to administrators.")
+        return
+    metrics = get_query_metrics()
+    st.caption(f"Since {metrics.started_at:%Y-%m-%d %H:%M:%S}; statements slower than {SLOW_QUERY_MS:.0f} ms go to the slow log.")
+
+    pool_stats = get_db_pool().stats()
+    cols = st.columns(4)
+    cols[0].metric("Connections in use", f"{pool_stats['in_use']} / {pool_stats['size']}")
+    cols[1].metric("Checkouts", pool_stats['checkouts'])
+    cols[2].metric("Waits (timeouts)", f"{pool_stats['waits']} ({pool_stats['timeouts']})")
+    cols[3].metric("Leaked connections", pool_stats['leaks'])
+
+    df = pd.DataFrame(metrics.snapshot())
+    if df.empty:
+        st.info("No statements recorded yet.")
+    else:
+        st.subheader("By Page")
+        by_route = df.groupby('Route').agg(Calls=('Calls', 'sum'), Errors=('Errors', 'sum'), Rows=('Rows', 'sum'),
+                                           TotalSeconds=('TotalSeconds', 'sum'), MaxMs=('MaxMs', 'max'))
+        st.dataframe(by_route.sort_values('TotalSeconds', ascending=False))
+
+        st.subheader("By Statement")
+        routes = st.multiselect("Pages", sorted(df['Route'].unique()), key="metrics_routes")
+        if routes: df = df[df['Route'].isin(routes)]
+        st.dataframe(df.drop(columns=['Histogram']), hide_index=True)
+
+        labels = {f"[{r['Route']}] {r['Statement'][:100]}": r for r in df.to_dict('records')}
+        if labels:
+            chosen = labels[st.selectbox("Latency histogram for", list(labels.keys()), key="metrics_statement")]
+            bounds = [f"≤ {b * 1000:g} ms" for b in LATENCY_BUCKETS] + [f"> {LATENCY_BUCKETS[-1] * 1000:g} ms"]
+            st.dataframe(
+                pd.DataFrame({'Latency': bounds, 'Calls': chosen['Histogram']}), hide_index=True,
+                column_config={'Calls': st.column_config.ProgressColumn("Calls", format="%d", min_value=0, max_value=max(max(chosen['Histogram']), 1))},
+            )
+
+    st.subheader("Slow Query Log")
+    slow = metrics.slow_queries()
+    if slow: st.dataframe(pd.DataFrame(slow), hide_index=True)
+    else: st.info("No slow statements recorded.")
+
+    if st.button("Reset metrics"):
+        metrics.reset()
+        st.rerun()
+
+# --- Developer Mode: Rerun Profiler ---
+def profiling_requested():
+    """Profile this rerun? Everyone's when [metrics] profile is set, else only admins who add ?profile=1 to the URL."""
+    if PROFILE_ALL: return True
+    return st.query_params.get("profile") == "1" and st.session_state.logged_in_srn in METRICS_ADMINS
+
+def render_profile_overlay(profile):
+    """Where the rerun's time went, below the page. The save button dumps the rerun it was shown for."""
+    with st.expander(f"⏱️ Rerun profile: {profile.seconds * 1000:.0f} ms", expanded=False):
+        st.dataframe(pd.DataFrame(profile.breakdown()), hide_index=True)
+        queries = profile.query_breakdown()
+        if queries:
+            st.caption("Statements by section")
+            st.dataframe(pd.DataFrame(queries), hide_index=True)
+        st.caption(f"Hottest functions ({sum(profile.samples.values())} stack samples)")
+        st.dataframe(pd.DataFrame(profile.hot_functions()), hide_index=True)
+        if st.button("Save flamegraph stacks", key="profile_dump"):
+            previous = st.session_state.get('last_profile')
+            if previous is not None:
+                st.success(f"Saved {previous.dump(PROFILE_DIR)}")
+    st.session_state.last_profile = profile
 
 # --- Main Router ---
-if st.session_state.logged_in_srn is None:
-    if st.session_state.page == 'login': page_login()
-    elif st.session_state.page == 'signup': page_signup()
-    else: page_landing() 
-else:
-    if st.session_state.page == 'home': page_home_browse()
-    elif st.session_state.page == 'upload_sell': page_upload_item('sell')
-    elif st.session_state.page == 'upload_lend': page_upload_item('lend')
-    elif st.session_state.page == 'upload_barter': page_upload_item('barter')
-    elif st.session_state.page == 'buysell': page_buysell()
-    elif st.session_state.page == 'lendborrow': page_lendborrow()
-    elif st.session_state.page == 'barter': page_barter()
-    elif st.session_state.page == 'my_activity': page_my_activity()
-    else: page_home_browse()
\ No newline at end of file
+# Every statement of a full rerun is labelled with the current page; fragment reruns relabel in get_db_connection()
+set_route(st.session_state.page)
+profile = RerunProfile(st.session_state.page, root=BASE_DIR).start() if profiling_requested() else None
+try:
+    with section(f"page_{st.session_state.page}"):
+        if st.session_state.logged_in_srn is None:
+            if st.session_state.page == 'login': page_login()
+            elif st.session_state.page == 'signup': page_signup()
+            else: page_landing() 
+        else:
+            if st.session_state.page == 'home': page_home_browse()
+            elif st.session_state.page == 'upload_sell': page_upload_item('sell')
+            elif st.session_state.page == 'upload_lend': page_upload_item('lend')
+            elif st.session_state.page == 'upload_barter': page_upload_item('barter')
+            elif st.session_state.page == 'buysell': page_buysell()
+            elif st.session_state.page == 'lendborrow': page_lendborrow()
+            elif st.session_state.page == 'barter': page_barter()
+            elif st.session_state.page == 'my_activity': page_my_activity()
+            elif st.session_state.page == 'metrics': page_metrics()
+            else: page_home_browse()
+finally:
+    if profile is not None: profile.stop()
+if profile is not None: render_profile_overlay(profile)
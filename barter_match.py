@@ -0,0 +1,318 @@
+# barter_match.py - Multi-party barter matching: exchange cycles in the want-graph of barter listings
+
+import argparse
+import time
+from collections import namedtuple
+from pathlib import Path
+
+# Longest exchange offered, in listings (= students). Longer circles rarely complete.
+DEFAULT_MAX_CYCLE_LENGTH = 4
+
+
+class WantGraph:
+    """
+    Who-wants-what over Available barter listings. An edge x -> y means the owner of listing x would
+    take listing y in exchange, either because they named it or because they want its category.
+
+    Category wants are never expanded into listing-to-listing edges. Each category is one bucket, so
+    wanting "Books" costs one entry however many books are listed, and the graph stays
+    O(listings + wants). Listings are addressed by dense indices internally; `ids` maps back to ResourceID.
+    """
+
+    def __init__(self, listings, wants):
+        # listings: (ResourceID, OwnerID, CategoryID); wants: (ResourceID, CategoryID or None, WantedItemID or None)
+        self.ids, self.owner, self.category = [], [], []
+        self.index = {}
+        for resource_id, owner_id, category_id in listings:
+            self.index[resource_id] = len(self.ids)
+            self.ids.append(resource_id)
+            self.owner.append(owner_id)
+            self.category.append(category_id)
+
+        self.bucket = {}
+        for i, category_id in enumerate(self.category):
+            self.bucket.setdefault(category_id, []).append(i)
+
+        self.wanted_categories = [set() for _ in self.ids]
+        self.wanted_items = [set() for _ in self.ids]
+        for resource_id, category_id, wanted_item_id in wants:
+            i = self.index.get(resource_id)
+            if i is None: continue
+            if category_id is not None:
+                if category_id in self.bucket: self.wanted_categories[i].add(category_id)
+            elif wanted_item_id in self.index:
+                j = self.index[wanted_item_id]
+                if self.owner[j] != self.owner[i]: self.wanted_items[i].add(j)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def wants(self, i, j):
+        """True if the owner of listing i would take listing j."""
+        return self.owner[i] != self.owner[j] and (self.category[j] in self.wanted_categories[i] or j in self.wanted_items[i])
+
+    # --- Strongly Connected Components ---
+
+    def components(self):
+        """
+        Component number of every listing (Tarjan, iterative) over listings plus category buckets.
+        A listing can only be part of an exchange cycle if its component holds more than one node,
+        which rules most listings out before any cycle search starts.
+        Returns (component per listing, size per component).
+        """
+        n = len(self.ids)
+        bucket_node = {category_id: n + k for k, category_id in enumerate(self.bucket)}
+        adjacency = [
+            list(self.wanted_items[i]) + [bucket_node[c] for c in self.wanted_categories[i]]
+            for i in range(n)
+        ] + [self.bucket[category_id] for category_id in bucket_node]
+
+        total = len(adjacency)
+        order, low = [-1] * total, [0] * total
+        on_stack = [False] * total
+        component = [-1] * total
+        sizes, stack, counter = [], [], 0
+        for root in range(total):
+            if order[root] != -1: continue
+            work = [(root, 0)]
+            while work:
+                node, pos = work.pop()
+                if pos == 0:
+                    order[node] = low[node] = counter
+                    counter += 1
+                    stack.append(node)
+                    on_stack[node] = True
+                edges = adjacency[node]
+                descended = False
+                while pos < len(edges):
+                    child = edges[pos]
+                    pos += 1
+                    if order[child] == -1:
+                        work.append((node, pos))
+                        work.append((child, 0))
+                        descended = True
+                        break
+                    if on_stack[child] and order[child] < low[node]:
+                        low[node] = order[child]
+                if descended: continue
+                if low[node] == order[node]:
+                    size = 0
+                    while True:
+                        member = stack.pop()
+                        on_stack[member] = False
+                        component[member] = len(sizes)
+                        size += 1
+                        if member == node: break
+                    sizes.append(size)
+                if work:
+                    parent = work[-1][0]
+                    if low[node] < low[parent]: low[parent] = low[node]
+        return component[:n], sizes
+
+    # --- Cycle Search ---
+
+    def find_cycle(self, seed, free, component, max_length=DEFAULT_MAX_CYCLE_LENGTH, buckets=None):
+        """
+        Shortest exchange cycle through `seed` among listings with free[i] set, found by a breadth-first
+        search that stays inside the seed's component and expands every category bucket at most once.
+        Owners along a path must all differ. Returns listing indices [seed, ...] or None.
+        `buckets` is a working copy of self.bucket that gets pruned of listings no longer free.
+        """
+        if buckets is None: buckets = self.bucket
+        parent = {seed: None}
+        seen_categories = set()
+        frontier = [seed]
+        for depth in range(1, max_length):
+            next_frontier = []
+            for i in frontier:
+                owners = self._path_owners(i, parent)
+                for j in self._successors(i, seen_categories, free, buckets):
+                    if j in parent or not free[j] or component[j] != component[seed] or self.owner[j] in owners:
+                        continue
+                    parent[j] = i
+                    if self.wants(j, seed):
+                        return self._path(j, parent)
+                    next_frontier.append(j)
+            if not next_frontier: break
+            frontier = next_frontier
+        return None
+
+    def _successors(self, i, seen_categories, free, buckets):
+        yield from self.wanted_items[i]
+        for category_id in self.wanted_categories[i]:
+            if category_id in seen_categories: continue
+            seen_categories.add(category_id)
+            members = buckets[category_id]
+            live = [j for j in members if free[j]]
+            if len(live) < len(members): buckets[category_id] = live
+            yield from live
+
+    def _path_owners(self, i, parent):
+        owners = set()
+        while i is not None:
+            owners.add(self.owner[i])
+            i = parent[i]
+        return owners
+
+    @staticmethod
+    def _path(i, parent):
+        path = []
+        while i is not None:
+            path.append(i)
+            i = parent[i]
+        return path[::-1]
+
+
+def find_cycles(graph, seeds=None, max_length=DEFAULT_MAX_CYCLE_LENGTH, excluded=(), declined=()):
+    """
+    Disjoint exchange cycles, as lists of ResourceIDs in which each owner receives the next listing
+    (the last owner receives the first). Only cycles through `seeds` (ResourceIDs, None = all) are
+    searched: once a graph has been matched, a new cycle must pass through a listing that was added,
+    changed its wants or was freed since, so an incremental run only needs those as seeds.
+    Listings in `excluded` are skipped; cycles whose item set is in `declined` are not offered again.
+    """
+    component, sizes = graph.components()
+    excluded = set(excluded)
+    free = bytearray(
+        1 if sizes[component[i]] > 1 and graph.ids[i] not in excluded else 0
+        for i in range(len(graph))
+    )
+    if seeds is None:
+        seed_indices = range(len(graph))
+    else:
+        seed_indices = sorted(graph.index[resource_id] for resource_id in set(seeds) if resource_id in graph.index)
+
+    buckets = {category_id: [i for i in members if free[i]] for category_id, members in graph.bucket.items()}
+    cycles = []
+    for seed in seed_indices:
+        if not free[seed]: continue
+        cycle = graph.find_cycle(seed, free, component, max_length, buckets)
+        if cycle is None: continue
+        resource_ids = [graph.ids[i] for i in cycle]
+        if frozenset(resource_ids) in declined: continue
+        for i in cycle: free[i] = 0
+        cycles.append(resource_ids)
+    return cycles
+
+
+# --- Database ---
+
+MatchReport = namedtuple('MatchReport', 'listings wants seeds cycles expired seconds')
+
+LISTINGS_QUERY = """
+    SELECT ResourceID, OwnerID, CategoryID FROM Resource
+    WHERE Status = 'Available' AND ListingType = 'Barter'
+"""
+WANTS_QUERY = """
+    SELECT w.ResourceID, w.CategoryID, w.WantedItemID
+    FROM BarterWant w JOIN Resource r ON r.ResourceID = w.ResourceID
+    WHERE r.Status = 'Available' AND r.ListingType = 'Barter'
+"""
+# Listings that could be on a cycle the previous run did not see
+DIRTY_QUERY = """
+    SELECT ResourceID FROM Resource WHERE ListingType = 'Barter' AND UpdatedAt >= %s
+    UNION
+    SELECT ResourceID FROM BarterWant WHERE CreatedAt >= %s
+    UNION
+    SELECT l.ItemID FROM BarterCycleLeg l JOIN BarterCycle c ON c.CycleID = l.CycleID
+    WHERE c.Status IN ('Declined', 'Expired') AND c.UpdatedAt >= %s
+"""
+
+
+def expire_stale_cycles(cursor):
+    """Proposed cycles with a listing that is no longer available can never complete."""
+    cursor.execute("""
+        UPDATE BarterCycle c SET c.Status = 'Expired'
+        WHERE c.Status = 'Proposed' AND EXISTS (
+            SELECT 1 FROM BarterCycleLeg l JOIN Resource r ON r.ResourceID = l.ItemID
+            WHERE l.CycleID = c.CycleID AND r.Status <> 'Available'
+        )
+    """)
+    return cursor.rowcount
+
+
+def save_cycles(cursor, graph, cycles):
+    """Inserts each cycle as a 'Proposed' BarterCycle; leg p is listing p going to the owner of listing p-1."""
+    for resource_ids in cycles:
+        cursor.execute("INSERT INTO BarterCycle (Status) VALUES ('Proposed')")
+        cycle_id = cursor.lastrowid
+        owners = [graph.owner[graph.index[resource_id]] for resource_id in resource_ids]
+        cursor.executemany(
+            "INSERT INTO BarterCycleLeg (CycleID, Position, ItemID, GiverID, ReceiverID) VALUES (%s, %s, %s, %s, %s)",
+            [(cycle_id, p, resource_id, owners[p], owners[p - 1]) for p, resource_id in enumerate(resource_ids)],
+        )
+
+
+def run_matcher(conn, full=False, max_length=DEFAULT_MAX_CYCLE_LENGTH, log=print):
+    """
+    One matching pass: expires dead proposals, loads the want-graph, searches from the listings that
+    changed since the previous run (everything on the first run or with full=True), stores the new
+    cycles as proposals and records the run in BarterMatchRun.
+    """
+    started = time.perf_counter()
+    cursor = conn.cursor()
+    cursor.execute("SELECT NOW()")
+    run_started_at = cursor.fetchone()[0]
+    since = None
+    if not full:
+        cursor.execute("SELECT MAX(StartedAt) FROM BarterMatchRun")
+        since = cursor.fetchone()[0]
+
+    expired = expire_stale_cycles(cursor)
+
+    cursor.execute(LISTINGS_QUERY)
+    listings = cursor.fetchall()
+    cursor.execute(WANTS_QUERY)
+    wants = cursor.fetchall()
+    graph = WantGraph(listings, wants)
+
+    # Listings already offered in an open cycle stay out until it is resolved
+    cursor.execute("SELECT l.ItemID FROM BarterCycleLeg l JOIN BarterCycle c ON c.CycleID = l.CycleID WHERE c.Status = 'Proposed'")
+    excluded = {row[0] for row in cursor.fetchall()}
+    cursor.execute("SELECT l.CycleID, l.ItemID FROM BarterCycleLeg l JOIN BarterCycle c ON c.CycleID = l.CycleID WHERE c.Status = 'Declined'")
+    declined_items = {}
+    for cycle_id, item_id in cursor.fetchall():
+        declined_items.setdefault(cycle_id, set()).add(item_id)
+    declined = {frozenset(items) for items in declined_items.values()}
+
+    seeds = None
+    if since is not None:
+        cursor.execute(DIRTY_QUERY, (since, since, since))
+        seeds = [row[0] for row in cursor.fetchall()]
+    log(f"{len(graph)} barter listings, {len(wants)} wants, "
+        f"{'all' if seeds is None else len(seeds)} listings to search from")
+
+    cycles = find_cycles(graph, seeds, max_length, excluded, declined)
+    save_cycles(cursor, graph, cycles)
+    cursor.execute(
+        "INSERT INTO BarterMatchRun (StartedAt, Seeds, CyclesFound) VALUES (%s, %s, %s)",
+        (run_started_at, len(graph) if seeds is None else len(seeds), len(cycles)),
+    )
+    conn.commit()
+    cursor.close()
+    return MatchReport(len(graph), len(wants), len(graph) if seeds is None else len(seeds),
+                       len(cycles), expired, time.perf_counter() - started)
+
+
+def main():
+    from db import load_mysql_config
+    import mysql.connector
+
+    parser = argparse.ArgumentParser(description="Find multi-party barter cycles and offer them as proposals.")
+    parser.add_argument("--full", action="store_true", help="search from every listing, not just those changed since the last run")
+    parser.add_argument("--max-length", type=int, default=DEFAULT_MAX_CYCLE_LENGTH, help="most students in one exchange")
+    parser.add_argument("--secrets", type=Path, help="path to secrets.toml (default: .streamlit/secrets.toml)")
+    args = parser.parse_args()
+
+    conn = mysql.connector.connect(**load_mysql_config(args.secrets))
+    try:
+        report = run_matcher(conn, full=args.full, max_length=args.max_length)
+    finally:
+        conn.close()
+    print(f"{report.cycles} exchange cycles proposed from {report.seeds} seed listings "
+          f"({report.listings} listings, {report.wants} wants), {report.expired} stale proposals expired, "
+          f"{report.seconds:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
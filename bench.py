@@ -0,0 +1,309 @@
+# bench.py - Query benchmark suite: the app's read queries with realistic parameters, latency percentiles, EXPLAIN plans, baseline comparison
+
+import argparse
+import datetime
+import json
+import math
+import random
+import re
+import statistics
+import sys
+import time
+from collections import namedtuple
+from pathlib import Path
+
+import queries
+from catalog import (CATALOG_VERSION_QUERY, SORT_NEWEST, SORT_RATING, browse_count_query, browse_filter,
+                     browse_page_query, browse_rows_query)
+from dashboard import DASHBOARD_QUERIES
+
+PAGE_SIZE = 12                  # app.BROWSE_PAGE_SIZE
+REGRESSION_RATIO = 1.25         # p95 this much above the baseline's is a regression...
+REGRESSION_MIN_MS = 1.0         # ...if it is also at least this many ms slower
+SAMPLE_POOL = 2000              # students/listings drawn from the database to pick parameters from
+FULL_SCAN = re.compile(r"(?:Table scan|Covering index scan|Index scan) on (\w+)")   # alias of a fully read table/index
+ACCESS = re.compile(r"(?:Table scan|(?:Covering )?index (?:scan|range scan|lookup)|Single-row (?:covering )?index lookup) on (\w+)",
+                    re.IGNORECASE)      # any leaf reading a table; the first one in a plan is the driving table
+
+# Benchmarks allowed to read a whole table, and why; every other one is on the hot path (--check-scans)
+SCAN_EXEMPT = {
+    'lend_calendar': "lists every Lend listing, whatever its status",
+    'eligibility_union': "legacy query, kept for comparison only",
+}
+# Aliases a hot-path plan may still scan: tables too small for an index to matter
+SCAN_ALLOWED = {
+    'dashboard_resources': {'c'},       # Category
+    'catalog_version': {'CatalogVersion'},   # 64 counter shards
+}
+
+# How My Activity found reviewable items before ReviewEligibility existed; kept to compare against 'eligible'
+ELIGIBILITY_UNION = """
+SELECT DISTINCT r.ResourceID, r.Title
+FROM Resource r
+JOIN LendBorrow lb ON r.ResourceID = lb.ItemID
+WHERE lb.BorrowerID = %s
+  AND lb.Status = 'Completed'
+  AND r.ResourceID NOT IN (SELECT rv.ItemID FROM Review rv WHERE rv.STD_ID = %s)
+UNION
+SELECT DISTINCT r.ResourceID, r.Title
+FROM Resource r
+JOIN BuySell bs ON r.ResourceID = bs.ItemID
+WHERE bs.BuyerID = %s
+  AND bs.Status = 'Completed'
+  AND r.ResourceID NOT IN (SELECT rv.ItemID FROM Review rv WHERE rv.STD_ID = %s)
+"""
+
+Benchmark = namedtuple('Benchmark', 'name build')      # build(parameter pool, rng) -> (sql, params)
+
+# Whose My Activity page each dashboard query is timed for
+DASHBOARD_POOLS = {
+    'resources': 'owners', 'lent': 'owners', 'purchases': 'buyers', 'reviews': 'buyers', 'eligible': 'buyers',
+    'borrowed': 'borrowers', 'reminders': 'borrowers', 'barter_acquired': 'accepters',
+}
+
+
+class ParameterPool:
+    """Realistic parameter values read from the database once: active students per role, categories, listing IDs."""
+
+    def __init__(self, conn, size=SAMPLE_POOL):
+        cursor = conn.cursor()
+        self._size = size
+        self.students = self._column(cursor, "SELECT SRN FROM Student ORDER BY SRN LIMIT %s")
+        # The most active students per role: they have the most rows on the pages they visit
+        self.borrowers = self._column(cursor, "SELECT BorrowerID FROM LendBorrow GROUP BY BorrowerID ORDER BY COUNT(*) DESC LIMIT %s")
+        self.buyers = self._column(cursor, "SELECT BuyerID FROM BuySell WHERE BuyerID IS NOT NULL GROUP BY BuyerID ORDER BY COUNT(*) DESC LIMIT %s")
+        self.owners = self._column(cursor, "SELECT OwnerID FROM Resource GROUP BY OwnerID ORDER BY COUNT(*) DESC LIMIT %s")
+        self.accepters = self._column(cursor, "SELECT AccepterID FROM Barter GROUP BY AccepterID ORDER BY COUNT(*) DESC LIMIT %s")
+        self.resource_ids = self._column(cursor, "SELECT ResourceID FROM Resource WHERE Status = 'Available' ORDER BY ResourceID DESC LIMIT %s")
+        cursor.execute("SELECT RatingAvg, ResourceID FROM Resource WHERE Status = 'Available' ORDER BY RatingAvg DESC, ResourceID DESC LIMIT %s", (size,))
+        self.ratings = [(float(rating), resource_id) for rating, resource_id in cursor.fetchall()] or [(0.0, 0)]
+        self.categories = self._column(cursor, "SELECT Cat_ID FROM Category LIMIT %s")
+        cursor.close()
+
+    def _column(self, cursor, sql):
+        cursor.execute(sql, (self._size,))
+        return [row[0] for row in cursor.fetchall()] or [None]
+
+
+def _student_query(sql, pool_name):
+    """Query whose every placeholder is the same student, drawn from one of the pools."""
+    return lambda pool, rng: (sql, (rng.choice(getattr(pool, pool_name)),) * sql.count('%s'))
+
+
+def _browse(category=False, listing_type=False, deep=False, sort=SORT_NEWEST):
+    def build(pool, rng):
+        where, params = browse_filter([rng.choice(pool.categories)] if category else None,
+                                      rng.choice(['Sell', 'Lend', 'Barter']) if listing_type else None)
+        after = None
+        if deep: after = rng.choice(pool.ratings) if sort == SORT_RATING else rng.choice(pool.resource_ids)
+        return browse_page_query(where, params, after, PAGE_SIZE, sort)
+    return build
+
+
+def _lend_calendar(pool, rng):
+    start = datetime.date.today() + datetime.timedelta(days=rng.randint(1, 30))
+    end = start + datetime.timedelta(days=rng.randint(2, 15))
+    return queries.LEND_CALENDAR, (end, start, rng.choice(pool.students))
+
+
+BENCHMARKS = [
+    Benchmark('login', _student_query(queries.LOGIN, 'students')),
+    Benchmark('catalog_version', lambda pool, rng: (CATALOG_VERSION_QUERY, ())),
+    Benchmark('browse_newest', _browse()),
+    Benchmark('browse_newest_deep', _browse(deep=True)),
+    Benchmark('browse_category_type', _browse(category=True, listing_type=True)),
+    Benchmark('browse_category_type_deep', _browse(category=True, listing_type=True, deep=True)),
+    Benchmark('browse_top_rated', _browse(sort=SORT_RATING)),
+    Benchmark('browse_top_rated_deep', _browse(deep=True, sort=SORT_RATING)),
+    Benchmark('browse_count', lambda pool, rng: browse_count_query(*browse_filter())),
+    Benchmark('browse_count_filtered', lambda pool, rng: browse_count_query(*browse_filter([rng.choice(pool.categories)], 'Sell'))),
+    Benchmark('browse_rows', lambda pool, rng: browse_rows_query(rng.sample(pool.resource_ids, min(PAGE_SIZE, len(pool.resource_ids))))),
+    Benchmark('buysell_listings', _student_query(queries.BUYSELL_LISTINGS, 'students')),
+    Benchmark('buysell_awaiting_payment', _student_query(queries.BUYSELL_AWAITING_PAYMENT, 'buyers')),
+    Benchmark('buysell_awaiting_confirmation', _student_query(queries.BUYSELL_AWAITING_CONFIRMATION, 'owners')),
+    Benchmark('lend_listings', _student_query(queries.LEND_LISTINGS, 'students')),
+    Benchmark('lend_calendar', _lend_calendar),
+    Benchmark('my_reservations', _student_query(queries.MY_RESERVATIONS, 'borrowers')),
+    Benchmark('my_loans', _student_query(queries.MY_LOANS, 'borrowers')),
+    Benchmark('my_barter_listings', _student_query(queries.MY_BARTER_LISTINGS, 'owners')),
+    Benchmark('barter_listings', _student_query(queries.BARTER_LISTINGS, 'students')),
+    Benchmark('barter_proposals', _student_query(queries.BARTER_PROPOSALS, 'accepters')),
+    Benchmark('barter_circles', _student_query(queries.BARTER_CIRCLES, 'owners')),
+    Benchmark('barter_history', _student_query(queries.BARTER_HISTORY, 'accepters')),
+    *[Benchmark(f'dashboard_{name}', _student_query(sql, DASHBOARD_POOLS.get(name, 'students')))
+      for name, (sql, _) in DASHBOARD_QUERIES.items()],
+    Benchmark('eligibility_union', _student_query(ELIGIBILITY_UNION, 'buyers')),
+]
+
+
+# --- Running ---
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values: return 0.0
+    return sorted_values[min(len(sorted_values) - 1, max(0, math.ceil(q * len(sorted_values)) - 1))]
+
+
+def explain(cursor, sql, params):
+    """EXPLAIN FORMAT=TREE of one execution plan, as text."""
+    cursor.execute("EXPLAIN FORMAT=TREE " + sql.strip(), params)
+    return "\n".join(row[0] for row in cursor.fetchall())
+
+
+def plan_shape(plan):
+    """A plan without its cost/row estimates, so two runs are only 'different' if the access paths changed."""
+    return re.sub(r"\s*\(cost=[^)]*\)|\s*\(actual [^)]*\)", "", plan or "")
+
+
+def full_scans(plan):
+    """
+    Aliases of tables/indexes a plan reads in full. The one exception is keyset paging: under a
+    top-level Limit, an ordered walk of PRIMARY on the driving table (the first table accessed)
+    stops after the page and is not counted. Inner tables and secondary-index walks always count.
+    """
+    lines = [line.strip().removeprefix("-> ") for line in plan.strip().splitlines()]
+    limited = bool(lines) and lines[0].startswith("Limit")
+    driving = next((i for i, line in enumerate(lines) if ACCESS.match(line)), None)
+    scans = []
+    for i, line in enumerate(lines):
+        match = FULL_SCAN.search(line)
+        if not match: continue
+        if limited and i == driving and line.startswith(f"Index scan on {match.group(1)} using PRIMARY"): continue
+        scans.append(match.group(1))
+    return scans
+
+
+def run_benchmark(conn, benchmark, pool, rng, iterations, warmup):
+    cursor = conn.cursor()
+    timings, rows = [], 0
+    for i in range(warmup + iterations):
+        sql, params = benchmark.build(pool, rng)
+        started = time.perf_counter()
+        cursor.execute(sql, params)
+        fetched = cursor.fetchall()
+        elapsed = time.perf_counter() - started
+        if i >= warmup:
+            timings.append(elapsed * 1000)
+            rows += len(fetched)
+    sql, params = benchmark.build(pool, rng)
+    plan = explain(cursor, sql, params)
+    cursor.close()
+    timings.sort()
+    return {
+        "p50_ms": round(percentile(timings, 0.50), 3), "p95_ms": round(percentile(timings, 0.95), 3),
+        "p99_ms": round(percentile(timings, 0.99), 3), "mean_ms": round(statistics.fmean(timings), 3),
+        "max_ms": round(timings[-1], 3), "avg_rows": round(rows / iterations, 1),
+        "full_scans": full_scans(plan), "plan": plan,
+    }
+
+
+def table_sizes(conn):
+    cursor = conn.cursor()
+    sizes = {}
+    for table in ("Student", "Resource", "BuySell", "LendBorrow", "Barter", "Review", "Reminder", "LendReservation", "ReviewEligibility"):
+        cursor.execute(f"SELECT COUNT(*) FROM {table}")
+        sizes[table] = cursor.fetchone()[0]
+    cursor.execute("SELECT VERSION()")
+    version = cursor.fetchone()[0]
+    cursor.close()
+    return sizes, version
+
+
+def run_suite(conn, iterations=50, warmup=5, seed=1, only=None, log=print):
+    """Runs every benchmark (or those whose name contains one of `only`); returns the report dict."""
+    rng = random.Random(seed)
+    pool = ParameterPool(conn)
+    sizes, version = table_sizes(conn)
+    results = {}
+    for benchmark in BENCHMARKS:
+        if only and not any(pattern in benchmark.name for pattern in only): continue
+        results[benchmark.name] = run_benchmark(conn, benchmark, pool, rng, iterations, warmup)
+        r = results[benchmark.name]
+        log(f"{benchmark.name:<34} p50 {r['p50_ms']:>9.2f}  p95 {r['p95_ms']:>9.2f}  p99 {r['p99_ms']:>9.2f} ms  "
+            f"rows {r['avg_rows']:>8.1f}{'  FULL SCAN ' + ','.join(r['full_scans']) if r['full_scans'] else ''}")
+    return {
+        "run_at": datetime.datetime.now().isoformat(timespec="seconds"), "mysql_version": version,
+        "iterations": iterations, "seed": seed, "table_sizes": sizes, "results": results,
+    }
+
+
+def _first_line(text):
+    return text.strip().splitlines()[0] if text.strip() else "-"
+
+
+def compare(report, baseline, ratio=REGRESSION_RATIO, min_ms=REGRESSION_MIN_MS):
+    """(regressions, plan changes): lists of human-readable lines for benchmarks present in both reports."""
+    regressions, plan_changes = [], []
+    for name, result in report["results"].items():
+        before = baseline.get("results", {}).get(name)
+        if before is None: continue
+        if result["p95_ms"] > before["p95_ms"] * ratio and result["p95_ms"] - before["p95_ms"] >= min_ms:
+            regressions.append(f"{name}: p95 {before['p95_ms']:.2f} -> {result['p95_ms']:.2f} ms "
+                               f"({result['p95_ms'] / max(before['p95_ms'], 1e-9):.1f}x)")
+        if plan_shape(result["plan"]) != plan_shape(before.get("plan")):
+            plan_changes.append(f"{name}: access path changed\n  before: {_first_line(plan_shape(before.get('plan')))}\n"
+                                f"  after:  {_first_line(plan_shape(result['plan']))}")
+    return regressions, plan_changes
+
+
+def scan_violations(report):
+    """Hot-path benchmarks whose plan reads a whole table or index: one line each."""
+    violations = []
+    for name, result in report["results"].items():
+        if name in SCAN_EXEMPT: continue
+        scanned = [alias for alias in result["full_scans"] if alias not in SCAN_ALLOWED.get(name, ())]
+        if scanned:
+            violations.append(f"{name}: full scan on {', '.join(scanned)}\n" + "\n".join(
+                f"    {line.strip()}" for line in result["plan"].splitlines() if FULL_SCAN.search(line)))
+    return violations
+
+
+def main():
+    from db import load_mysql_config
+    import mysql.connector
+
+    parser = argparse.ArgumentParser(description="Benchmark the app's queries against the configured database (fill it with datagen.py first).")
+    parser.add_argument("--iterations", type=int, default=50, help="timed runs per query, each with fresh parameters")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--only", nargs="*", help="run only benchmarks whose name contains one of these")
+    parser.add_argument("--save", type=Path, help="write the report (JSON) here, e.g. to use as the next baseline")
+    parser.add_argument("--baseline", type=Path, help="compare against a report saved earlier; exits 1 on regressions or plan changes")
+    parser.add_argument("--show-plans", action="store_true", help="print every EXPLAIN plan")
+    parser.add_argument("--check-scans", action="store_true", help="exit 1 if a hot-path query's plan has a full table/index scan")
+    parser.add_argument("--secrets", type=Path, help="path to secrets.toml (default: .streamlit/secrets.toml)")
+    args = parser.parse_args()
+
+    conn = mysql.connector.connect(**load_mysql_config(args.secrets))
+    try:
+        report = run_suite(conn, iterations=args.iterations, warmup=args.warmup, seed=args.seed, only=args.only)
+    finally:
+        conn.close()
+    print("table sizes: " + ", ".join(f"{table} {count}" for table, count in report["table_sizes"].items()))
+
+    if args.show_plans:
+        for name, result in report["results"].items():
+            print(f"\n== {name}\n{result['plan']}")
+    if args.save:
+        args.save.write_text(json.dumps(report, indent=2, default=str))
+        print(f"report saved to {args.save}")
+    failed = False
+    if args.check_scans:
+        violations = scan_violations(report)
+        for line in violations: print(f"FULL SCAN {line}")
+        if not violations: print("no full scans on the hot path")
+        failed = bool(violations)
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())
+        if baseline.get("table_sizes") != report["table_sizes"]:
+            print("note: the baseline was taken on different table sizes")
+        regressions, plan_changes = compare(report, baseline)
+        for line in plan_changes: print(f"PLAN CHANGE {line}")
+        for line in regressions: print(f"REGRESSION {line}")
+        if not regressions and not plan_changes: print("no regressions or plan changes against the baseline")
+        failed = failed or bool(regressions) or bool(plan_changes)
+    if failed: sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+# catalog.py - In-process views of the UniSync catalog: categories, browse queries and their cache
+
+import threading
+from collections import OrderedDict
+
+# Shown last in every category list, everything else is alphabetical
+CATCH_ALL_MAIN_TYPE = 'Miscellaneous'
+
+
+class CategoryTree:
+    """
+    The whole Category table held in memory as a MainType -> SubType hierarchy.
+    Built from rows of (Cat_ID, MainType, SubType); all lookups are dictionary hits.
+    """
+
+    def __init__(self, rows):
+        self._by_id = {}
+        self._subtypes = {}
+        for row in sorted(rows, key=lambda r: r['Cat_ID']):
+            cat_id, main_type, sub_type = row['Cat_ID'], row['MainType'], row['SubType']
+            self._by_id[cat_id] = (main_type, sub_type)
+            self._subtypes.setdefault(main_type, []).append((sub_type, cat_id))
+        self._main_types = sorted(self._subtypes, key=lambda m: (m == CATCH_ALL_MAIN_TYPE, m))
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def main_types(self):
+        """MainType names in display order."""
+        return list(self._main_types)
+
+    def sub_types(self, main_type):
+        """SubType names under a MainType (entries without a SubType are skipped)."""
+        return [sub for sub, _ in self._subtypes.get(main_type, []) if sub]
+
+    def category_id(self, main_type, sub_type=None):
+        """Cat_ID for a MainType/SubType pair. Without a SubType, the lowest Cat_ID of the MainType."""
+        entries = self._subtypes.get(main_type, [])
+        if sub_type is None:
+            return entries[0][1] if entries else None
+        for sub, cat_id in entries:
+            if sub == sub_type: return cat_id
+        return None
+
+    def ids_under(self, main_type, sub_type=None):
+        """All Cat_IDs matching a MainType, or a single MainType/SubType pair."""
+        if sub_type is not None:
+            cat_id = self.category_id(main_type, sub_type)
+            return [cat_id] if cat_id is not None else []
+        return [cat_id for _, cat_id in self._subtypes.get(main_type, [])]
+
+    def label(self, cat_id):
+        """'MainType - SubType' label for a Cat_ID (just MainType when there is no SubType)."""
+        if cat_id not in self._by_id: return 'Uncategorized'
+        main_type, sub_type = self._by_id[cat_id]
+        return f"{main_type} - {sub_type}" if sub_type else main_type
+
+    def labelled_ids(self):
+        """(label, Cat_ID) for every category, grouped by MainType in display order."""
+        return [(self.label(cat_id), cat_id) for main in self._main_types for _, cat_id in self._subtypes[main]]
+
+
+# --- Browse Queries ---
+
+BROWSE_COLUMNS = "r.ResourceID, r.Title, r.Description, r.itemCondition, r.ImagePath, r.ListingType, r.CategoryID, r.RatingAvg, r.RatingCount"
+
+# Browse orderings. Every one ends in ResourceID so the keyset is unique.
+SORT_NEWEST = 'newest'
+SORT_RATING = 'rating'
+
+
+def placeholders(values):
+    """'%s, %s, ...' for an IN (...) list."""
+    return ', '.join(['%s'] * len(values))
+
+
+def browse_filter(category_ids=None, listing_type=None):
+    """WHERE clause (without the keyword) and params for the browse page's filters."""
+    clauses, params = ["r.Status = 'Available'"], []
+    if category_ids is not None:
+        category_ids = list(category_ids) or [None]
+        clauses.append(f"r.CategoryID IN ({placeholders(category_ids)})")
+        params.extend(category_ids)
+    if listing_type is not None:
+        clauses.append("r.ListingType = %s")
+        params.append(listing_type)
+    return " AND ".join(clauses), params
+
+
+def browse_page_query(where, params, after, page_size, sort=SORT_NEWEST):
+    """
+    Keyset page: the `page_size` listings after the cursor `after` (None = first page).
+    Newest first uses a ResourceID cursor; SORT_RATING orders by the stored RatingAvg and
+    uses a (RatingAvg, ResourceID) cursor, see page_cursor().
+    One extra row is fetched so the caller can tell whether a further page exists.
+    """
+    params = list(params)
+    if sort == SORT_RATING:
+        if after is not None:
+            rating, resource_id = after
+            where += " AND (r.RatingAvg < %s OR (r.RatingAvg = %s AND r.ResourceID < %s))"
+            params.extend([rating, rating, resource_id])
+        order_by = "r.RatingAvg DESC, r.ResourceID DESC"
+    else:
+        if after is not None:
+            where += " AND r.ResourceID < %s"
+            params.append(after)
+        order_by = "r.ResourceID DESC"
+    params.append(page_size + 1)
+    return f"SELECT {BROWSE_COLUMNS} FROM Resource r WHERE {where} ORDER BY {order_by} LIMIT %s", params
+
+
+def page_cursor(row, sort=SORT_NEWEST):
+    """Keyset cursor that resumes browse_page_query() after `row`."""
+    if sort == SORT_RATING:
+        return (row['RatingAvg'], row['ResourceID'])
+    return row['ResourceID']
+
+
+def browse_count_query(where, params):
+    """COUNT(*) over the same filters, run separately from the page itself."""
+    return f"SELECT COUNT(*) AS Total FROM Resource r WHERE {where}", list(params)
+
+
+def browse_rows_query(resource_ids):
+    """Card columns for specific listings, in the given order (used for ranked search pages)."""
+    return f"SELECT {BROWSE_COLUMNS} FROM Resource r WHERE r.ResourceID IN ({placeholders(resource_ids)}) ORDER BY FIELD(r.ResourceID, {placeholders(resource_ids)})", list(resource_ids) * 2
+
+
+# --- Shared Browse Cache ---
+
+CATALOG_VERSION_QUERY = "SELECT SUM(Version) FROM CatalogVersion"
+
+
+def read_catalog_version(conn):
+    """Current catalog version (sum over the shards); triggers bump a shard on every Resource/BuySell write."""
+    cursor = conn.cursor()
+    cursor.execute(CATALOG_VERSION_QUERY)
+    row = cursor.fetchone()
+    cursor.close()
+    return row[0] if row else None
+
+
+class LRUCache:
+    """Thread-safe, size-bounded mapping that evicts the least recently used entry."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
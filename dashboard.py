@@ -0,0 +1,141 @@
+# dashboard.py - Parallel data loader for the My Activity page
+
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+# name -> (SQL, result columns). Every %s placeholder receives the student's SRN.
+DASHBOARD_QUERIES = {
+    'resources': ("""
+        SELECT r.ResourceID, r.Title, r.itemCondition, r.Status, c.MainType, r.ListingType
+        FROM Resource r
+        JOIN Category c ON r.CategoryID = c.Cat_ID
+        WHERE r.OwnerID = %s
+    """, ['ResourceID', 'Title', 'itemCondition', 'Status', 'MainType', 'ListingType']),
+    'purchases': ("""
+        SELECT bs.BuySellID, r.Title, bs.Price, bs.Status AS SaleStatus, bs.TransactionDate
+        FROM BuySell bs
+        JOIN Resource r ON bs.ItemID = r.ResourceID
+        WHERE bs.BuyerID = %s AND bs.Status IN ('Completed', 'PendingPayment', 'PendingConfirmation')
+    """, ['BuySellID', 'Title', 'Price', 'SaleStatus', 'TransactionDate']),
+    'barter_acquired': ("""
+        (
+            -- Find items I acquired as the PROPOSER (I get Item2)
+            SELECT b.BarterID, r2.Title AS AcquiredItemTitle, b.BarterDate, b.Status
+            FROM Barter b
+            JOIN Resource r2 ON b.Item2ID = r2.ResourceID -- Item I received
+            WHERE b.ProposerID = %s AND b.Status = 'Accepted'
+        )
+        UNION
+        (
+            -- Find items I acquired as the ACCEPTER (I get Item1)
+            SELECT b.BarterID, r1.Title AS AcquiredItemTitle, b.BarterDate, b.Status
+            FROM Barter b
+            JOIN Resource r1 ON b.Item1ID = r1.ResourceID -- Item I received
+            WHERE b.AccepterID = %s AND b.Status = 'Accepted'
+        )
+        ORDER BY BarterDate DESC
+    """, ['BarterID', 'AcquiredItemTitle', 'BarterDate', 'Status']),
+    'borrowed': ("""
+        SELECT lb.LendBorrowID, r.Title, lb.StartDate, lb.EndDate, lb.Status,
+               lb.PenaltyAmount, r.ResourceID
+        FROM LendBorrow lb
+        JOIN Resource r ON lb.itemID = r.ResourceID
+        WHERE lb.BorrowerID = %s
+        ORDER BY lb.StartDate DESC
+    """, ['LendBorrowID', 'Title', 'StartDate', 'EndDate', 'Status', 'PenaltyAmount', 'ResourceID']),
+    'lent': ("""
+        SELECT lb.LendBorrowID, r.Title, lb.StartDate, lb.EndDate, lb.Status,
+               CONCAT(s.FirstName, ' ', s.LastName) AS Borrower
+        FROM LendBorrow lb
+        JOIN Resource r ON lb.itemID = r.ResourceID
+        JOIN Student s ON lb.BorrowerID = s.SRN
+        WHERE lb.LenderID = %s
+    """, ['LendBorrowID', 'Title', 'StartDate', 'EndDate', 'Status', 'Borrower']),
+    'reminders': ("""
+        SELECT ReminderID, Msg, RDate, Status FROM Reminder WHERE STD_ID = %s ORDER BY RDate DESC
+    """, ['ReminderID', 'Msg', 'RDate', 'Status']),
+    'reviews': ("""
+        SELECT rv.Rating, rv.Comments, r.Title, r.ResourceID
+        FROM Review rv JOIN Resource r ON rv.ItemID = r.ResourceID WHERE rv.STD_ID = %s
+    """, ['Rating', 'Comments', 'Title', 'ResourceID']),
+    # Completed transactions without a review, kept up to date by triggers
+    'eligible': ("""
+        SELECT r.ResourceID, r.Title
+        FROM ReviewEligibility e
+        JOIN Resource r ON e.ItemID = r.ResourceID
+        WHERE e.STD_ID = %s
+        ORDER BY e.EligibleSince DESC
+    """, ['ResourceID', 'Title']),
+}
+
+EXECUTOR_WORKERS = 32   # threads shared by all sessions; the dashboard pool bounds how many run queries at once
+
+# Shared by all sessions; each task checks out its own connection from the dashboard pool
+_executor = ThreadPoolExecutor(max_workers=EXECUTOR_WORKERS, thread_name_prefix="dashboard")
+
+@dataclass
+class DashboardData:
+    """Everything the My Activity page shows. A query that failed or timed out yields an empty frame."""
+    resources: pd.DataFrame
+    purchases: pd.DataFrame
+    barter_acquired: pd.DataFrame
+    borrowed: pd.DataFrame
+    lent: pd.DataFrame
+    reminders: pd.DataFrame
+    reviews: pd.DataFrame
+    eligible: pd.DataFrame
+    errors: dict = field(default_factory=dict)     # query name -> error message
+    timings: dict = field(default_factory=dict)    # query name -> seconds
+
+
+def _run_query(pool, name, srn, timeout):
+    """
+    Task: one query on its own pooled connection. The session's max_execution_time makes the server
+    abandon it after `timeout` seconds (for every branch of a UNION, unlike an optimizer hint on the
+    first SELECT), so one slow query never eats into the budget of another.
+    Returns (DataFrame, seconds) or the exception it failed with.
+    """
+    sql = DASHBOARD_QUERIES[name][0]
+    try:
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"SET SESSION max_execution_time = {max(1, int(timeout * 1000))}")
+            try:
+                started = time.perf_counter()
+                return pd.read_sql(sql, conn, params=(srn,) * sql.count('%s')), time.perf_counter() - started
+            finally:
+                # Pooled connections are reused; do not leave the limit on for the next borrower
+                cursor.execute("SET SESSION max_execution_time = DEFAULT")
+                cursor.close()
+    except Exception as e:
+        return e
+
+
+def load_dashboard(pool, srn, timeout=5.0):
+    """
+    Runs all DASHBOARD_QUERIES for a student at once, each on its own connection of `pool` -- a pool
+    reserved for dashboard reads and sized to len(DASHBOARD_QUERIES), so the page waits about as long
+    as its slowest query. Every query gets `timeout` seconds of its own; when other sessions hold the
+    pool, a query may also wait up to the pool's checkout_timeout for a connection first.
+    """
+    # Each task runs with the caller's context, so query metrics keep the page's route label
+    futures = {
+        _executor.submit(contextvars.copy_context().run, _run_query, pool, name, srn, timeout): name
+        for name in DASHBOARD_QUERIES
+    }
+    _, not_done = wait(futures, timeout=pool.checkout_timeout + timeout + 1.0)
+    for future in not_done: future.cancel()
+
+    frames, errors, timings = {}, {}, {}
+    for future, name in futures.items():
+        result = future.result() if future.done() and not future.cancelled() else None
+        if isinstance(result, tuple):
+            frames[name], timings[name] = result
+            continue
+        frames[name] = pd.DataFrame(columns=DASHBOARD_QUERIES[name][1])
+        errors[name] = str(result) if isinstance(result, Exception) else f"timed out after {timeout:g}s"
+    return DashboardData(**frames, errors=errors, timings=timings)
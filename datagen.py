@@ -0,0 +1,312 @@
+# datagen.py - Seeded synthetic data at any scale, for benchmarking (bench.py) and load testing
+
+import argparse
+import datetime
+import hashlib
+import random
+import time
+from pathlib import Path
+
+SYNTHETIC_PREFIX = "SYN"        # SRNs are SYN + 10 digits, so synthetic students never clash with real ones
+DEFAULT_PASSWORD = "123"
+DEPARTMENTS = ['Computer Science', 'Electronics and Commn', 'Mechanical', 'Electrical', 'Civil']
+CONDITIONS = ['Excellent', 'Good', 'Fair', 'Poor']
+LISTING_TYPES = (('Sell', 0.40), ('Lend', 0.35), ('Barter', 0.25))
+CATEGORIES = [
+    ('Books', 'Textbook'), ('Books', 'Novel'), ('Books', 'Reference'), ('Books', 'Lab Manual'),
+    ('Electronics', 'Laptop'), ('Electronics', 'Calculator'), ('Electronics', 'Headphones'), ('Electronics', 'Arduino Kit'),
+    ('Furniture', 'Chair'), ('Furniture', 'Table'), ('Furniture', 'Shelf'),
+    ('Sports', 'Racket'), ('Sports', 'Cycle'), ('Stationery', 'Drafter'), ('Stationery', 'Lab Coat'),
+    ('Miscellaneous', 'General'),
+]
+TITLE_WORDS = {
+    'Books': ['DBMS', 'Operating Systems', 'Calculus', 'Physics', 'Data Structures', 'Networks', 'Signals', 'Thermodynamics', 'Mechanics', 'Compilers'],
+    'Electronics': ['Dell', 'HP', 'Lenovo', 'Casio', 'Sony', 'Boat', 'Arduino Uno', 'Raspberry Pi', 'Asus', 'JBL'],
+    'Furniture': ['Study', 'Ergonomic', 'Folding', 'Wooden', 'Plastic', 'Compact', 'Revolving'],
+    'Sports': ['Yonex', 'Hero', 'Cosco', 'Nivia', 'Firefox', 'Li-Ning'],
+    'Stationery': ['Omega', 'Camlin', 'Faber', 'Classmate', 'White', 'Half-sleeve'],
+    'Miscellaneous': ['Used', 'Spare', 'Handy', 'Old', 'Barely used'],
+}
+DESCRIPTION_WORDS = ("good condition barely used edition latest notes included charger box original warranty "
+                     "scratches minor works perfectly semester hostel pickup campus cheap urgent sale exchange "
+                     "borrow week return clean spare manual cover highlighted pages battery").split()
+
+# Shares of listings with transaction history; everything else stays a plain 'Available' listing
+SOLD_SHARE, PENDING_PAYMENT_SHARE, PENDING_CONFIRMATION_SHARE = 0.30, 0.05, 0.03
+ONGOING_LOAN_SHARE, OVERDUE_SHARE, FUTURE_BOOKING_SHARE = 0.20, 0.25, 0.10
+MAX_PAST_LOANS = 4
+BARTER_PENDING_SHARE, BARTER_ACCEPTED_SHARE = 0.10, 0.10
+REVIEW_SHARE = 0.5
+
+
+def _pick_weighted(rng, choices):
+    roll, total = rng.random(), 0.0
+    for value, weight in choices:
+        total += weight
+        if roll < total: return value
+    return choices[-1][0]
+
+
+class Generator:
+    """
+    Writes `students` students and `resources` listings with their transactions, reminders, reviews and
+    barter wants, `batch_size` listings per transaction. IDs are assigned here, after the current
+    maxima, so dependent rows can be written in the same batch; the same seed gives the same data.
+
+    Rows are inserted in their final state and the trigger-maintained columns and tables
+    (Resource.Status, Reminder.Status, ReviewEligibility, LendReservation) are then reconciled with
+    the same set-based statements the seed data in unisync.sql uses. Rating totals and return
+    reminders come from the triggers themselves.
+    """
+
+    def __init__(self, conn, students, resources, seed=1, batch_size=5000, today=None, log=print):
+        self.conn = conn
+        self.cursor = conn.cursor()
+        self.n_students = students
+        self.n_resources = resources
+        self.rng = random.Random(seed)
+        self.batch_size = batch_size
+        self.today = today or datetime.date.today()
+        self.log = log
+        self.password = hashlib.sha256(DEFAULT_PASSWORD.encode()).hexdigest()
+        self.reviewed = set()
+
+    # --- Helpers ---
+
+    def _next_id(self, table, column):
+        self.cursor.execute(f"SELECT COALESCE(MAX({column}), 0) + 1 FROM {table}")
+        return self.cursor.fetchone()[0]
+
+    def _insert(self, table, columns, rows):
+        if not rows: return
+        self.cursor.executemany(
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})", rows)
+
+    def _student(self):
+        # Quadratic skew: a minority of students owns most listings and makes most trades
+        return self.srns[int(len(self.srns) * self.rng.random() ** 2)]
+
+    def _other_student(self, srn):
+        other = self._student()
+        while other == srn and len(self.srns) > 1: other = self._student()
+        return other
+
+    def _past_date(self, max_days):
+        return self.today - datetime.timedelta(days=self.rng.randint(1, max_days))
+
+    # --- Generation ---
+
+    def run(self):
+        started = time.perf_counter()
+        self.categories = self._categories()
+        self._students()
+        first_resource = self._next_id("Resource", "ResourceID")
+        self.next_trans = self._next_id("Transactions", "TransactionID")
+        for offset in range(0, self.n_resources, self.batch_size):
+            count = min(self.batch_size, self.n_resources - offset)
+            self._listing_batch(first_resource + offset, count)
+            self._reconcile(first_resource + offset, first_resource + offset + count - 1)
+            self.conn.commit()
+            self.log(f"{offset + count} / {self.n_resources} listings")
+        self.cursor.close()
+        self.log(f"done in {time.perf_counter() - started:.1f}s")
+
+    def _categories(self):
+        self.cursor.execute("SELECT Cat_ID, MainType, SubType FROM Category")
+        existing = {(main, sub): cat_id for cat_id, main, sub in self.cursor.fetchall()}
+        next_id = max(existing.values(), default=0) + 1
+        missing = [pair for pair in CATEGORIES if pair not in existing]
+        self._insert("Category", ("Cat_ID", "MainType", "SubType"),
+                     [(next_id + i, main, sub) for i, (main, sub) in enumerate(missing)])
+        existing.update({pair: next_id + i for i, pair in enumerate(missing)})
+        self.conn.commit()
+        return [(cat_id, main) for (main, _), cat_id in existing.items()]
+
+    def _students(self):
+        self.cursor.execute("SELECT COUNT(*) FROM Student WHERE SRN LIKE %s", (SYNTHETIC_PREFIX + '%',))
+        start = self.cursor.fetchone()[0]
+        self.srns = [f"{SYNTHETIC_PREFIX}{i:010d}" for i in range(self.n_students)]
+        rows = []
+        for i in range(start, self.n_students):
+            rows.append((self.srns[i], f"Student{i}", "", f"Synthetic{i % 997}", f"syn{i}@unisync.edu", f"8{i:09d}",
+                         self.rng.choice(DEPARTMENTS), self._past_date(4 * 365), self.password))
+            if len(rows) == self.batch_size:
+                self._insert("Student", ("SRN", "FirstName", "MiddleName", "LastName", "Email", "Phone", "Department", "JoinDate", "Password"), rows)
+                self.conn.commit()
+                rows = []
+        self._insert("Student", ("SRN", "FirstName", "MiddleName", "LastName", "Email", "Phone", "Department", "JoinDate", "Password"), rows)
+        self.conn.commit()
+        self.log(f"{self.n_students - start} students added ({start} already there)")
+
+    def _transaction(self, kind, rows):
+        trans_id = self.next_trans
+        self.next_trans += 1
+        rows.append((trans_id, kind))
+        return trans_id
+
+    def _listing_batch(self, first_id, count):
+        resources, transactions, buysell, lendborrow, barter, wants, reviews, bookings = ([] for _ in range(8))
+        open_barter_items = []
+        for resource_id in range(first_id, first_id + count):
+            owner = self._student()
+            category_id, main_type = self.rng.choice(self.categories)
+            listing_type = _pick_weighted(self.rng, LISTING_TYPES)
+            title = f"{self.rng.choice(TITLE_WORDS.get(main_type, TITLE_WORDS['Miscellaneous']))} {main_type.rstrip('s')} {resource_id % 1000}"[:50]
+            description = " ".join(self.rng.choices(DESCRIPTION_WORDS, k=self.rng.randint(6, 25)))
+            preference = f"Looking for {self.rng.choice(CATEGORIES)[1].lower()}" if listing_type == 'Barter' else None
+            resources.append((resource_id, title, description, self.rng.choice(CONDITIONS), 'Available', listing_type,
+                              owner, category_id, preference))
+
+            if listing_type == 'Sell':
+                price = round(self.rng.uniform(50, 60000 if main_type == 'Electronics' else 2000), 2)
+                roll = self.rng.random()
+                if roll < SOLD_SHARE:
+                    buyer = self._other_student(owner)
+                    buysell.append((resource_id, owner, buyer, price, 'Completed', self._past_date(365), f"UPI{resource_id}", True,
+                                    self._transaction('BuySell', transactions)))
+                    self._maybe_review(reviews, buyer, resource_id)
+                elif roll < SOLD_SHARE + PENDING_PAYMENT_SHARE:
+                    buysell.append((resource_id, owner, self._other_student(owner), price, 'PendingPayment', self._past_date(7), None, False,
+                                    self._transaction('BuySell', transactions)))
+                elif roll < SOLD_SHARE + PENDING_PAYMENT_SHARE + PENDING_CONFIRMATION_SHARE:
+                    buysell.append((resource_id, owner, self._other_student(owner), price, 'PendingConfirmation', self._past_date(7),
+                                    f"UPI{resource_id}", False, self._transaction('BuySell', transactions)))
+                else:
+                    buysell.append((resource_id, owner, None, price, 'Listed', self._past_date(180), None, False, None))
+
+            elif listing_type == 'Lend':
+                # Past loans back to back, oldest first, all returned
+                start = self.today - datetime.timedelta(days=self.rng.randint(60, 720))
+                for _ in range(self.rng.randint(0, MAX_PAST_LOANS)):
+                    end = start + datetime.timedelta(days=self.rng.randint(3, 21))
+                    if end >= self.today - datetime.timedelta(days=30): break
+                    borrower = self._other_student(owner)
+                    penalty = 10.0 * self.rng.randint(1, 5) if self.rng.random() < 0.1 else 0.0
+                    lendborrow.append((resource_id, owner, borrower, start, end, 'Completed',
+                                       self._transaction('LendBorrow', transactions), penalty))
+                    self._maybe_review(reviews, borrower, resource_id)
+                    start = end + datetime.timedelta(days=self.rng.randint(1, 30))
+                free_from = self.today
+                if self.rng.random() < ONGOING_LOAN_SHARE:
+                    overdue = self.rng.random() < OVERDUE_SHARE
+                    loan_start = self.today - datetime.timedelta(days=self.rng.randint(10, 40) if overdue else self.rng.randint(0, 6))
+                    loan_end = self.today - datetime.timedelta(days=self.rng.randint(1, 9)) if overdue else self.today + datetime.timedelta(days=self.rng.randint(1, 14))
+                    lendborrow.append((resource_id, owner, self._other_student(owner), loan_start, loan_end, 'Ongoing',
+                                       self._transaction('LendBorrow', transactions), 0.0))
+                    free_from = max(loan_end, self.today) + datetime.timedelta(days=1)
+                if self.rng.random() < FUTURE_BOOKING_SHARE:
+                    booking_start = free_from + datetime.timedelta(days=self.rng.randint(1, 10))
+                    bookings.append((resource_id, self._other_student(owner), booking_start,
+                                     booking_start + datetime.timedelta(days=self.rng.randint(2, 15)), 'Reserved'))
+
+            else:
+                for category_id, _ in self.rng.sample(self.categories, self.rng.randint(1, 2)):
+                    wants.append((resource_id, category_id))
+                open_barter_items.append((resource_id, owner))
+
+        # Barter proposals pair up listings of this batch; each listing takes part in at most one
+        self.rng.shuffle(open_barter_items)
+        pairs = list(zip(open_barter_items[0::2], open_barter_items[1::2]))
+        for (item1, proposer), (item2, accepter) in pairs:
+            if proposer == accepter: continue
+            roll = self.rng.random()
+            if roll < BARTER_PENDING_SHARE: status = 'Pending'
+            elif roll < BARTER_PENDING_SHARE + BARTER_ACCEPTED_SHARE: status = 'Accepted'
+            else: continue
+            barter.append((item1, item2, proposer, accepter, status, self._past_date(60), self._transaction('Barter', transactions)))
+
+        self._insert("Resource", ("ResourceID", "Title", "Description", "itemCondition", "Status", "ListingType", "OwnerID", "CategoryID", "BarterPreference"), resources)
+        self._insert("Transactions", ("TransactionID", "Type"), transactions)
+        self._insert("BuySell", ("ItemID", "SellerID", "BuyerID", "Price", "Status", "TransactionDate", "BuyerTransID", "SellerConfirm", "TransactionID"), buysell)
+        self._insert("LendBorrow", ("itemID", "LenderID", "BorrowerID", "StartDate", "EndDate", "Status", "TransactionID", "PenaltyAmount"), lendborrow)
+        self._insert("Barter", ("Item1ID", "Item2ID", "ProposerID", "AccepterID", "Status", "BarterDate", "TransactionID"), barter)
+        self._insert("BarterWant", ("ResourceID", "CategoryID"), wants)
+        self._insert("Review", ("Rating", "Comments", "STD_ID", "ItemID"), reviews)
+        self._insert("LendReservation", ("ItemID", "BorrowerID", "StartDate", "EndDate", "Status"), bookings)
+
+    def _maybe_review(self, reviews, student, resource_id):
+        if self.rng.random() >= REVIEW_SHARE or (student, resource_id) in self.reviewed: return
+        self.reviewed.add((student, resource_id))
+        rating = min(5, max(1, round(self.rng.gauss(4, 1))))
+        reviews.append((rating, self.rng.choice(["Great", "As described", "Okay", "Could be better", "Very helpful"]), student, resource_id))
+
+    # --- Derived state ---
+
+    def _reconcile(self, first_id, last_id):
+        """Brings trigger-maintained state of a batch of generated listings in line with their transactions."""
+        statements = [
+            # tg_lend_insert marked every loaned item Unavailable, returned loans included
+            ("UPDATE Resource SET Status = 'Available' WHERE ResourceID BETWEEN %s AND %s AND Status <> 'Available'", (first_id, last_id)),
+            ("""UPDATE Resource r JOIN LendBorrow lb ON lb.itemID = r.ResourceID AND lb.Status = 'Ongoing'
+                SET r.Status = 'Unavailable' WHERE r.ResourceID BETWEEN %s AND %s""", (first_id, last_id)),
+            ("""UPDATE Resource r JOIN Barter b ON b.Item1ID = r.ResourceID AND b.Status = 'Accepted'
+                SET r.Status = 'Unavailable' WHERE r.ResourceID BETWEEN %s AND %s""", (first_id, last_id)),
+            ("""UPDATE Resource r JOIN Barter b ON b.Item2ID = r.ResourceID AND b.Status = 'Accepted'
+                SET r.Status = 'Unavailable' WHERE r.ResourceID BETWEEN %s AND %s""", (first_id, last_id)),
+            ("""UPDATE Resource r JOIN BuySell bs ON bs.ItemID = r.ResourceID AND bs.Status = 'Completed'
+                SET r.Status = 'Sold' WHERE r.ResourceID BETWEEN %s AND %s""", (first_id, last_id)),
+            # Return reminders of loans that were already over when inserted
+            ("""UPDATE Reminder rm JOIN LendBorrow lb ON lb.TransactionID = rm.TransID
+                SET rm.Status = 'Expired' WHERE lb.Status = 'Completed' AND lb.itemID BETWEEN %s AND %s""", (first_id, last_id)),
+            ("""INSERT IGNORE INTO ReviewEligibility (STD_ID, ItemID)
+                SELECT t.StudentID, t.ItemID
+                FROM (
+                  SELECT BorrowerID AS StudentID, itemID AS ItemID FROM LendBorrow WHERE Status = 'Completed' AND itemID BETWEEN %s AND %s
+                  UNION
+                  SELECT BuyerID, ItemID FROM BuySell WHERE Status = 'Completed' AND BuyerID IS NOT NULL AND ItemID BETWEEN %s AND %s
+                ) t
+                WHERE NOT EXISTS (SELECT 1 FROM Review rv WHERE rv.STD_ID = t.StudentID AND rv.ItemID = t.ItemID)""",
+             (first_id, last_id, first_id, last_id)),
+            ("""INSERT INTO LendReservation (ItemID, BorrowerID, StartDate, EndDate, Status, LendBorrowID)
+                SELECT itemID, BorrowerID, StartDate, GREATEST(COALESCE(EndDate, StartDate), StartDate) + INTERVAL 1 DAY, 'Active', LendBorrowID
+                FROM LendBorrow WHERE Status = 'Ongoing' AND itemID BETWEEN %s AND %s""", (first_id, last_id)),
+        ]
+        for sql, params in statements:
+            self.cursor.execute(sql, params)
+
+
+def remove_synthetic(conn):
+    """Deletes every synthetic student; their listings and transactions go with them (ON DELETE CASCADE)."""
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM Student WHERE SRN LIKE %s", (SYNTHETIC_PREFIX + '%',))
+    deleted = cursor.rowcount
+    cursor.execute("""
+        DELETE t FROM Transactions t
+        WHERE NOT EXISTS (SELECT 1 FROM LendBorrow WHERE TransactionID = t.TransactionID)
+          AND NOT EXISTS (SELECT 1 FROM BuySell WHERE TransactionID = t.TransactionID)
+          AND NOT EXISTS (SELECT 1 FROM Barter WHERE TransactionID = t.TransactionID)
+          AND NOT EXISTS (SELECT 1 FROM BarterCycle WHERE TransactionID = t.TransactionID)
+    """)
+    # Cascaded deletes skip the Resource/BuySell triggers; bump a shard so cached browse pages are dropped
+    cursor.execute("UPDATE CatalogVersion SET Version = Version + 1 WHERE ID = 0")
+    conn.commit()
+    cursor.close()
+    return deleted
+
+
+def main():
+    from db import load_mysql_config
+    import mysql.connector
+
+    parser = argparse.ArgumentParser(description="Fill the UniSync database with seeded synthetic students, listings and transactions.")
+    parser.add_argument("--students", type=int, default=1000)
+    parser.add_argument("--resources", type=int, help="listings to add (default: 10 per student)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=5000, help="listings per transaction")
+    parser.add_argument("--remove", action="store_true", help="delete all synthetic data instead of adding more")
+    parser.add_argument("--secrets", type=Path, help="path to secrets.toml (default: .streamlit/secrets.toml)")
+    args = parser.parse_args()
+
+    conn = mysql.connector.connect(**load_mysql_config(args.secrets))
+    try:
+        if args.remove:
+            print(f"{remove_synthetic(conn)} synthetic students removed")
+        else:
+            Generator(conn, args.students, args.resources if args.resources is not None else 10 * args.students,
+                      seed=args.seed, batch_size=args.batch_size).run()
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
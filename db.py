@@ -0,0 +1,428 @@
+# db.py - Shared MySQL connection pool for the UniSync app
+
+import bisect
+import contextvars
+import queue
+import re
+import threading
+import time
+import tomllib
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+
+import mysql.connector
+from mysql.connector import errors
+
+DEFAULT_SECRETS_PATH = Path(__file__).resolve().parent / ".streamlit" / "secrets.toml"
+# Upper bounds (seconds) of the latency histogram buckets; one more bucket catches everything slower
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+RECLAIM_POLL_INTERVAL = 0.1     # seconds a waiting checkout sleeps between looks at leaked connections
+MAX_TRACKED_STATEMENTS = 1000   # distinct (route, statement) pairs; the rest are pooled under OTHER_STATEMENT
+OTHER_STATEMENT = "(other statements)"
+
+# Page/route the current thread is serving, attached to every statement it runs
+current_route = contextvars.ContextVar("current_route", default="-")
+# Optional callable(sql, seconds, rows) also told about every statement, e.g. by profiling.RerunProfile
+statement_listener = contextvars.ContextVar("statement_listener", default=None)
+
+
+def load_mysql_config(secrets_path=None):
+    """
+    Connection arguments from the [mysql] table of Streamlit's secrets.toml,
+    for maintenance scripts that run outside `streamlit run`.
+    """
+    with open(secrets_path or DEFAULT_SECRETS_PATH, "rb") as f:
+        mysql_secrets = tomllib.load(f)["mysql"]
+    config = {key: mysql_secrets[key] for key in ("host", "user", "password", "database")}
+    if "port" in mysql_secrets: config["port"] = int(mysql_secrets["port"])
+    return config
+
+
+class PooledConnection:
+    """
+    A connection checked out of a ConnectionPool.
+    Behaves like a normal mysql.connector connection, except close() hands it back to the pool.
+    """
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+
+    def cursor(self, *args, **kwargs):
+        raw_cursor = self.__getattr__("cursor")(*args, **kwargs)
+        if self._pool.metrics is None: return raw_cursor
+        return InstrumentedCursor(raw_cursor, self._pool.metrics)
+
+    def close(self):
+        if self._raw is not None:
+            raw, self._raw = self._raw, None
+            self._pool._release(raw)
+
+    def __getattr__(self, name):
+        if self._raw is None:
+            raise errors.OperationalError("Connection was already returned to the pool.")
+        return getattr(self._raw, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __del__(self):
+        # st.rerun()/st.stop() unwind pages before they reach conn.close(); reclaim those here.
+        # GC may run this on a thread that holds the pool's lock, so only hand the connection over.
+        if getattr(self, "_raw", None) is not None:
+            raw, self._raw = self._raw, None
+            self._pool._reclaim.append(raw)
+
+
+class ConnectionPool:
+    """
+    Fixed-size pool of MySQL connections, meant to be created once per server process.
+
+    Connections are opened lazily up to `size`. Once all are in use, a checkout waits up to
+    `checkout_timeout` seconds for one to come back. Idle connections older than
+    `health_check_after` seconds are pinged (and reconnected if needed) before being handed out.
+    On return, any open transaction is rolled back so the next user never sees a stale snapshot.
+    With `metrics`, every statement run through a pooled connection is timed and counted there.
+    """
+
+    def __init__(self, size=8, checkout_timeout=10.0, health_check_after=30.0, metrics=None, **connect_args):
+        self.size = size
+        self.metrics = metrics      # QueryMetrics: when set, cursors of pooled connections are instrumented
+        self.checkout_timeout = checkout_timeout
+        self.health_check_after = health_check_after
+        self._connect_args = connect_args
+        self._idle = queue.LifoQueue()
+        self._reclaim = deque()     # leaked connections from finalizers; drained by checkouts (deque.append takes no lock)
+        self._lock = threading.Lock()
+        self._open = 0
+        self._in_use = 0
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "wait_seconds": 0.0,
+            "timeouts": 0,
+            "reconnects": 0,
+            "discarded": 0,
+            "leaks": 0,
+        }
+
+    # --- Checkout / Return ---
+
+    def checkout(self):
+        """Returns a PooledConnection; raises mysql.connector PoolError if none frees up in time."""
+        self._drain_reclaimed()
+        entry = self._take()
+        try:
+            raw = self._ensure_healthy(entry)
+        except mysql.connector.Error:
+            self._discard(entry[0])
+            raise
+        with self._lock:
+            self._stats["checkouts"] += 1
+            self._in_use += 1
+        return PooledConnection(self, raw)
+
+    @contextmanager
+    def connection(self):
+        """with pool.connection() as conn: ... -- the connection always goes back to the pool."""
+        conn = self.checkout()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _take(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_open = self._open < self.size
+            if can_open:
+                self._open += 1
+        if can_open:
+            try:
+                return (self._connect(), time.monotonic())
+            except mysql.connector.Error:
+                with self._lock:
+                    self._open -= 1
+                raise
+
+        started = time.monotonic()
+        deadline = started + self.checkout_timeout
+        while True:
+            try:
+                # Short waits, so connections leaked meanwhile are reclaimed for this checkout too
+                entry = self._idle.get(timeout=max(0.0, min(RECLAIM_POLL_INTERVAL, deadline - time.monotonic())))
+                break
+            except queue.Empty:
+                self._drain_reclaimed()
+                if time.monotonic() < deadline: continue
+            with self._lock:
+                self._stats["waits"] += 1
+                self._stats["timeouts"] += 1
+            raise errors.PoolError(f"No database connection became free within {self.checkout_timeout}s (pool size {self.size}).")
+        with self._lock:
+            self._stats["waits"] += 1
+            self._stats["wait_seconds"] += time.monotonic() - started
+        return entry
+
+    def _ensure_healthy(self, entry):
+        raw, last_used = entry
+        if time.monotonic() - last_used < self.health_check_after:
+            return raw
+        try:
+            raw.ping(reconnect=False)
+        except mysql.connector.Error:
+            raw.ping(reconnect=True, attempts=2, delay=0)
+            with self._lock:
+                self._stats["reconnects"] += 1
+        return raw
+
+    def _drain_reclaimed(self):
+        while True:
+            try:
+                raw = self._reclaim.popleft()
+            except IndexError:
+                return
+            self._release(raw, leaked=True)
+
+    def _release(self, raw, leaked=False):
+        with self._lock:
+            self._in_use -= 1
+            if leaked:
+                self._stats["leaks"] += 1
+        try:
+            if raw.unread_result:
+                raw.consume_results()
+            if raw.in_transaction:
+                raw.rollback()
+        except mysql.connector.Error:
+            self._discard(raw)
+            return
+        self._idle.put((raw, time.monotonic()))
+
+    def _discard(self, raw):
+        with self._lock:
+            self._open -= 1
+            self._stats["discarded"] += 1
+        try:
+            raw.close()
+        except mysql.connector.Error:
+            pass
+
+    def _connect(self):
+        return mysql.connector.connect(**self._connect_args)
+
+    # --- Introspection ---
+
+    def stats(self):
+        """Snapshot of pool counters (checkouts, waits, leaks, ...) plus current occupancy."""
+        self._drain_reclaimed()
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot.update(size=self.size, open=self._open, in_use=self._in_use, idle=self._idle.qsize())
+        return snapshot
+
+
+# --- Query Metrics ---
+
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_RUN = re.compile(r"%s(?:\s*,\s*%s)+")
+_TUPLE_RUN = re.compile(r"(\(%s(?:, \.\.\.)?\))(?:\s*,\s*\(%s(?:, \.\.\.)?\))+")
+
+
+def fingerprint(sql):
+    """
+    Statement text with literals replaced by '?' and placeholder lists collapsed, so the same query
+    is counted as one statement whatever its parameters or IN-list length.
+    """
+    sql = " ".join(sql.split())
+    sql = _NUMBER_LITERAL.sub("?", _STRING_LITERAL.sub("?", sql))
+    sql = _PLACEHOLDER_RUN.sub("%s, ...", sql)
+    return _TUPLE_RUN.sub(r"\1, ...", sql)
+
+
+def set_route(route):
+    """Labels the statements this thread runs from now on (the Streamlit page being rendered)."""
+    current_route.set(route or "-")
+
+
+@dataclass
+class StatementStats:
+    count: int = 0
+    errors: int = 0
+    rows: int = 0
+    seconds: float = 0.0
+    max_seconds: float = 0.0
+    buckets: list = field(default_factory=lambda: [0] * (len(LATENCY_BUCKETS) + 1))
+
+    def quantile(self, q):
+        """Upper bound of the histogram bucket holding the q-quantile, capped at the slowest call seen."""
+        if self.count == 0: return 0.0
+        target, seen = q * self.count, 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= target:
+                return min(LATENCY_BUCKETS[i], self.max_seconds) if i < len(LATENCY_BUCKETS) else self.max_seconds
+        return self.max_seconds
+
+
+class QueryMetrics:
+    """
+    Process-wide statement metrics: per (route, statement fingerprint) latency histogram, rows and
+    error counts, plus a bounded log of statements slower than `slow_threshold` seconds.
+    Only fingerprints are kept, never parameter values.
+    """
+
+    def __init__(self, slow_threshold=0.5, slow_log_size=200):
+        self.slow_threshold = slow_threshold
+        self.started_at = datetime.now()
+        self._stats = {}
+        self._slow = deque(maxlen=slow_log_size)
+        self._lock = threading.Lock()
+
+    def record(self, route, sql, seconds, rows, error=None):
+        statement = fingerprint(sql)
+        with self._lock:
+            key = (route, statement)
+            stats = self._stats.get(key)
+            if stats is None:
+                if len(self._stats) >= MAX_TRACKED_STATEMENTS: key = (route, OTHER_STATEMENT)
+                stats = self._stats.setdefault(key, StatementStats())
+            stats.count += 1
+            stats.rows += rows
+            stats.seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+            stats.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            if error is not None: stats.errors += 1
+            if seconds >= self.slow_threshold:
+                self._slow.append({
+                    "At": datetime.now(), "Route": route, "Statement": statement, "Seconds": round(seconds, 4),
+                    "Rows": rows, "Error": str(error) if error is not None else "",
+                })
+
+    def snapshot(self):
+        """One dict per (route, statement), slowest total time first."""
+        with self._lock:
+            items = [(key, StatementStats(s.count, s.errors, s.rows, s.seconds, s.max_seconds, list(s.buckets)))
+                     for key, s in self._stats.items()]
+        rows = []
+        for (route, statement), s in items:
+            rows.append({
+                "Route": route, "Statement": statement, "Calls": s.count, "Errors": s.errors, "Rows": s.rows,
+                "TotalSeconds": round(s.seconds, 4), "MeanMs": round(1000 * s.seconds / s.count, 2),
+                "P50Ms": round(1000 * s.quantile(0.5), 2), "P95Ms": round(1000 * s.quantile(0.95), 2),
+                "MaxMs": round(1000 * s.max_seconds, 2), "Histogram": s.buckets,
+            })
+        rows.sort(key=lambda row: row["TotalSeconds"], reverse=True)
+        return rows
+
+    def slow_queries(self):
+        """Slow-log entries, newest first."""
+        with self._lock:
+            return list(reversed(self._slow))
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._slow.clear()
+            self.started_at = datetime.now()
+
+
+class InstrumentedCursor:
+    """
+    Wraps a mysql.connector cursor and reports each statement to QueryMetrics. A statement's time
+    covers execute() plus the fetches of its result, and it is recorded once the result is read to
+    the end, the next statement runs, or the cursor is closed.
+    """
+
+    def __init__(self, raw, metrics):
+        self._raw = raw
+        self._metrics = metrics
+        self._pending = None    # [route, sql, seconds, rows] of the statement whose result is being read
+
+    def _timed(self, sql, call, *args, **kwargs):
+        self._finish()
+        route = current_route.get()
+        started = time.perf_counter()
+        try:
+            result = call(*args, **kwargs)
+        except mysql.connector.Error as err:
+            self._record(route, sql, time.perf_counter() - started, 0, error=err)
+            raise
+        self._pending = [route, sql, time.perf_counter() - started, 0]
+        if self._raw.description is None:
+            # No result set (INSERT/UPDATE/CALL ...): done, rows = affected rows
+            self._pending[3] = max(self._raw.rowcount or 0, 0)
+            self._finish()
+        return result
+
+    def _fetched(self, call, *args):
+        started = time.perf_counter()
+        result = call(*args)
+        if self._pending is not None:
+            self._pending[2] += time.perf_counter() - started
+        return result
+
+    def _finish(self):
+        if self._pending is not None:
+            route, sql, seconds, rows = self._pending
+            self._pending = None
+            self._record(route, sql, seconds, rows)
+
+    def _record(self, route, sql, seconds, rows, error=None):
+        self._metrics.record(route, sql, seconds, rows, error=error)
+        listener = statement_listener.get()
+        if listener is not None: listener(sql, seconds, rows)
+
+    def execute(self, operation, *args, **kwargs):
+        return self._timed(operation, self._raw.execute, operation, *args, **kwargs)
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        return self._timed(operation, self._raw.executemany, operation, seq_params, *args, **kwargs)
+
+    def callproc(self, procname, args=()):
+        return self._timed(f"CALL {procname}", self._raw.callproc, procname, args)
+
+    def fetchone(self):
+        row = self._fetched(self._raw.fetchone)
+        if row is None: self._finish()
+        elif self._pending is not None: self._pending[3] += 1
+        return row
+
+    def fetchmany(self, size=1):
+        rows = self._fetched(self._raw.fetchmany, size)
+        if self._pending is not None: self._pending[3] += len(rows)
+        if not rows: self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._fetched(self._raw.fetchall)
+        if self._pending is not None: self._pending[3] += len(rows)
+        self._finish()
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def close(self):
+        self._finish()
+        return self._raw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
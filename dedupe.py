@@ -0,0 +1,217 @@
+# dedupe.py - Near-duplicate listing detection: MinHash/LSH over listing text, difference hashes over photos
+
+import argparse
+import hashlib
+from collections import namedtuple
+from io import BytesIO
+from pathlib import Path
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from search import tokenize
+
+# 16 bands of 4 rows: listings with shingle-set Jaccard similarity ~0.5 or more share a band with high probability
+NUM_PERM = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_PERM // BANDS
+SHINGLE_SIZE = 5            # characters per shingle
+TEXT_THRESHOLD = 0.6        # estimated Jaccard similarity that counts as a duplicate
+# A 64-bit dHash is split into 5 blocks; two hashes within Hamming distance 4 must agree on at least one block
+IMAGE_BLOCK_BITS = (13, 13, 13, 13, 12)
+IMAGE_MAX_DISTANCE = len(IMAGE_BLOCK_BITS) - 1
+MAX_CANDIDATES = 500
+MINHASH_SEED = 1729
+
+_rng = np.random.default_rng(MINHASH_SEED)
+# Multiply-shift hash family: h(x) = ((a * x + b) mod 2^64) >> 32 with odd a
+_HASH_A = _rng.integers(1, 2**63, size=NUM_PERM, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+_HASH_B = _rng.integers(0, 2**63, size=NUM_PERM, dtype=np.uint64)
+
+Signature = namedtuple('Signature', 'minhash bands image_hash image_blocks')
+Duplicate = namedtuple('Duplicate', 'resource_id owner_id title text_similarity image_distance same_owner')
+
+
+# --- Text ---
+
+def shingles(text):
+    """Character shingles of the normalised text (tokenised the same way as search)."""
+    normalized = " ".join(tokenize(text))
+    if len(normalized) <= SHINGLE_SIZE: return {normalized} if normalized else set()
+    return {normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)}
+
+
+def minhash(text):
+    """NUM_PERM-value MinHash signature (uint32) of the text's shingle set, or None for empty text."""
+    items = shingles(text)
+    if not items: return None
+    hashed = np.fromiter((int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), 'little') for s in items),
+                         dtype=np.uint64, count=len(items))
+    with np.errstate(over='ignore'):
+        values = (_HASH_A[:, None] * hashed[None, :] + _HASH_B[:, None]) >> np.uint64(32)
+    return values.min(axis=1).astype(np.uint32)
+
+
+def band_hashes(signature):
+    """One signed 64-bit key per LSH band; listings sharing any key are candidates."""
+    return [
+        int.from_bytes(hashlib.blake2b(band.tobytes(), digest_size=8).digest(), 'little', signed=True)
+        for band in signature.reshape(BANDS, ROWS_PER_BAND)
+    ]
+
+
+def estimated_jaccard(a, b):
+    return float(np.mean(a == b))
+
+
+# --- Images ---
+
+def dhash(data):
+    """64-bit difference hash: survives re-encoding, resizing and small edits of the same photo."""
+    with Image.open(BytesIO(data)) as img:
+        small = ImageOps.exif_transpose(img).convert('L').resize((9, 8), Image.LANCZOS)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+def image_blocks(image_hash):
+    blocks, shift = [], 64
+    for width in IMAGE_BLOCK_BITS:
+        shift -= width
+        blocks.append((image_hash >> shift) & ((1 << width) - 1))
+    return blocks
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+# --- Signatures ---
+
+def listing_signature(title, description, image_data=None):
+    """Everything the duplicate check and the signature tables need for one listing."""
+    text_signature = minhash(f"{title or ''} {description or ''}")
+    image_hash = None
+    if image_data:
+        try:
+            image_hash = dhash(image_data)
+        except Exception:
+            # Undecodable upload: compare text only
+            image_hash = None
+    return Signature(
+        text_signature,
+        band_hashes(text_signature) if text_signature is not None else [],
+        image_hash,
+        image_blocks(image_hash) if image_hash is not None else [],
+    )
+
+
+def find_duplicates(cursor, owner_id, signature, exclude_id=None):
+    """
+    Available listings that look like the same item, the owner's own first. Candidates come from
+    indexed lookups of shared LSH bands / dHash blocks, so the cost follows the number of near
+    matches rather than the catalog size; only those are compared in full.
+    """
+    candidates = set()
+    if signature.bands:
+        pairs = [(band, key) for band, key in enumerate(signature.bands)]
+        cursor.execute(
+            f"SELECT DISTINCT ResourceID FROM ListingBand WHERE (Band, BandHash) IN ({', '.join(['(%s, %s)'] * len(pairs))}) LIMIT {MAX_CANDIDATES}",
+            [value for pair in pairs for value in pair],
+        )
+        candidates.update(row[0] for row in cursor.fetchall())
+    if signature.image_blocks:
+        pairs = [(block, value) for block, value in enumerate(signature.image_blocks)]
+        cursor.execute(
+            f"SELECT DISTINCT ResourceID FROM ListingImageBlock WHERE (Block, Value) IN ({', '.join(['(%s, %s)'] * len(pairs))}) LIMIT {MAX_CANDIDATES}",
+            [value for pair in pairs for value in pair],
+        )
+        candidates.update(row[0] for row in cursor.fetchall())
+    candidates.discard(exclude_id)
+    if not candidates: return []
+
+    ids = sorted(candidates)
+    cursor.execute(f"""
+        SELECT s.ResourceID, s.MinHash, s.ImageHash, r.OwnerID, r.Title
+        FROM ListingSignature s JOIN Resource r ON r.ResourceID = s.ResourceID
+        WHERE s.ResourceID IN ({', '.join(['%s'] * len(ids))}) AND r.Status = 'Available'
+    """, ids)
+    duplicates = []
+    for resource_id, stored_minhash, stored_image_hash, candidate_owner, title in cursor.fetchall():
+        text_similarity = None
+        if signature.minhash is not None and stored_minhash is not None:
+            text_similarity = estimated_jaccard(signature.minhash, np.frombuffer(stored_minhash, dtype=np.uint32))
+        image_distance = None
+        if signature.image_hash is not None and stored_image_hash is not None:
+            image_distance = hamming(signature.image_hash, stored_image_hash)
+        if (text_similarity or 0) >= TEXT_THRESHOLD or (image_distance is not None and image_distance <= IMAGE_MAX_DISTANCE):
+            duplicates.append(Duplicate(resource_id, candidate_owner, title, text_similarity, image_distance, candidate_owner == owner_id))
+    duplicates.sort(key=lambda d: (not d.same_owner, -(d.text_similarity or 0), d.image_distance if d.image_distance is not None else 64))
+    return duplicates
+
+
+def store_signature(cursor, resource_id, signature, duplicate_of=None):
+    """Saves a listing's signature and its LSH band / dHash block index rows (caller commits)."""
+    cursor.execute(
+        "REPLACE INTO ListingSignature (ResourceID, MinHash, ImageHash, DuplicateOf) VALUES (%s, %s, %s, %s)",
+        (resource_id, signature.minhash.tobytes() if signature.minhash is not None else None, signature.image_hash, duplicate_of),
+    )
+    cursor.execute("DELETE FROM ListingBand WHERE ResourceID = %s", (resource_id,))
+    cursor.execute("DELETE FROM ListingImageBlock WHERE ResourceID = %s", (resource_id,))
+    if signature.bands:
+        cursor.executemany("INSERT INTO ListingBand (Band, BandHash, ResourceID) VALUES (%s, %s, %s)",
+                           [(band, key, resource_id) for band, key in enumerate(signature.bands)])
+    if signature.image_blocks:
+        cursor.executemany("INSERT INTO ListingImageBlock (Block, Value, ResourceID) VALUES (%s, %s, %s)",
+                           [(block, value, resource_id) for block, value in enumerate(signature.image_blocks)])
+
+
+# --- Backfill ---
+
+def backfill(conn, base_dir, batch_size=500, log=print):
+    """Computes signatures for listings that have none (created before this check existed). Returns the count."""
+    cursor = conn.cursor()
+    done = 0
+    while True:
+        cursor.execute("""
+            SELECT r.ResourceID, r.Title, r.Description, r.ImagePath
+            FROM Resource r LEFT JOIN ListingSignature s ON s.ResourceID = r.ResourceID
+            WHERE s.ResourceID IS NULL
+            ORDER BY r.ResourceID
+            LIMIT %s
+        """, (batch_size,))
+        rows = cursor.fetchall()
+        if not rows: break
+        for resource_id, title, description, image_path in rows:
+            image_data = None
+            if image_path and (Path(base_dir) / image_path).is_file():
+                image_data = (Path(base_dir) / image_path).read_bytes()
+            store_signature(cursor, resource_id, listing_signature(title, description, image_data))
+        conn.commit()
+        done += len(rows)
+        log(f"signed {done} listings")
+    cursor.close()
+    return done
+
+
+def main():
+    from db import load_mysql_config
+    import mysql.connector
+
+    parser = argparse.ArgumentParser(description="Compute duplicate-detection signatures for listings that have none.")
+    parser.add_argument("--base-dir", default=Path(__file__).resolve().parent, type=Path, help="directory Resource.ImagePath is relative to")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--secrets", type=Path, help="path to secrets.toml (default: .streamlit/secrets.toml)")
+    args = parser.parse_args()
+
+    conn = mysql.connector.connect(**load_mysql_config(args.secrets))
+    try:
+        count = backfill(conn, args.base_dir, batch_size=args.batch_size)
+    finally:
+        conn.close()
+    print(f"{count} listings signed")
+
+
+if __name__ == "__main__":
+    main()
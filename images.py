@@ -0,0 +1,283 @@
+# images.py - Listing photo storage: content-addressed, decoded once, kept as pre-sized variants
+
+import argparse
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from io import BytesIO
+from pathlib import Path
+
+from PIL import Image, ImageOps
+
+# Longest edge in pixels, largest first so each variant is resized from the previous one.
+# 'original' keeps the full resolution but, like the others, is re-encoded without EXIF.
+VARIANT_SIZES = {'detail': 1200, 'thumb': 400}
+JPEG_QUALITY = {'original': 90, 'detail': 85, 'thumb': 75}
+
+
+def variant_path(image_path, variant):
+    """Path of a stored variant, derived from the original's path ('original' returns it unchanged)."""
+    if variant == 'original': return image_path
+    path = Path(image_path)
+    return str(path.with_name(f"{path.stem}_{variant}{path.suffix}"))
+
+
+def _encode(img, variant):
+    buffer = BytesIO()
+    # No exif= argument, so camera metadata (GPS, device, ...) is dropped
+    img.save(buffer, format='JPEG', quality=JPEG_QUALITY[variant], optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def render_variants(data):
+    """
+    Decodes an uploaded photo once and returns {variant: jpeg bytes} for 'original', 'detail' and 'thumb'.
+    Orientation from EXIF is applied to the pixels before the metadata is stripped.
+    Raises PIL.UnidentifiedImageError if the bytes are not an image.
+    """
+    with Image.open(BytesIO(data)) as img:
+        img = ImageOps.exif_transpose(img)
+        if img.mode != 'RGB':
+            # JPEG has no alpha: flatten transparent PNGs onto white
+            rgba = img.convert('RGBA')
+            img = Image.new('RGB', rgba.size, (255, 255, 255))
+            img.paste(rgba, mask=rgba.getchannel('A'))
+
+    variants = {'original': _encode(img, 'original')}
+    for variant, edge in VARIANT_SIZES.items():
+        img = img.copy()
+        img.thumbnail((edge, edge), Image.LANCZOS, reducing_gap=3.0)
+        variants[variant] = _encode(img, variant)
+    return variants
+
+
+# --- Content-Addressed Store ---
+# A photo is keyed by the SHA-256 of the uploaded bytes and lives at ab/cd/<digest>.jpg under the
+# upload directory (two levels of 256 shards keep every directory small). Re-uploading the same photo
+# finds the existing file and skips decoding entirely; ImageBlob.RefCount tracks how many listings use it.
+
+StoredImage = namedtuple('StoredImage', 'name digest size reused')
+
+
+def content_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def blob_name(digest):
+    """Sharded file name of the original variant, relative to the upload directory."""
+    return f"{digest[:2]}/{digest[2:4]}/{digest}.jpg"
+
+
+def _write_atomic(path, payload):
+    # Two sessions uploading the same photo at once both end up with one complete file
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(payload)
+    os.replace(tmp_path, path)
+
+
+def store_listing_image(data, upload_dir):
+    """
+    Stores an uploaded photo (all variants) unless an identical one is already stored.
+    Returns StoredImage(name relative to upload_dir, digest, bytes on disk, reused).
+    """
+    digest = content_digest(data)
+    name = blob_name(digest)
+    original = Path(upload_dir) / name
+    if original.exists():
+        # Restart the sweeper's grace window: the blob is about to be referenced again
+        for variant in ('original', *VARIANT_SIZES):
+            try:
+                os.utime(Path(upload_dir) / variant_path(name, variant))
+            except FileNotFoundError:
+                pass
+        return StoredImage(name, digest, original.stat().st_size, True)
+
+    original.parent.mkdir(parents=True, exist_ok=True)
+    variants = render_variants(data)
+    # Original last: its presence marks the blob as complete
+    for variant in ('thumb', 'detail', 'original'):
+        _write_atomic(Path(upload_dir) / variant_path(name, variant), variants[variant])
+    return StoredImage(name, digest, len(variants['original']), False)
+
+
+# --- Manifest ---
+
+class ImageManifest:
+    """
+    In-memory set of image files present under the upload directory, so rendering a card does not stat the disk.
+    Built with one directory walk; the app adds what it stores. An unknown name costs one stat, and the
+    answer is remembered either way, so cards without a photo variant do not stat on every rerun. Files
+    written by other processes show up when the manifest is rebuilt (the app caches it with a TTL).
+    """
+
+    def __init__(self, upload_dir):
+        self.upload_dir = Path(upload_dir)
+        self._lock = threading.Lock()
+        self._names = {name for name, _ in iter_image_files(self.upload_dir)}
+        self._missing = set()
+
+    def __len__(self):
+        return len(self._names)
+
+    def add(self, name):
+        with self._lock:
+            self._names.add(str(name))
+            self._missing.discard(str(name))
+
+    def discard(self, name):
+        with self._lock:
+            self._names.discard(str(name))
+            self._missing.add(str(name))
+
+    def exists(self, name):
+        name = str(name)
+        if name in self._names: return True
+        if name in self._missing: return False
+        if (self.upload_dir / name).is_file():
+            self.add(name)
+            return True
+        with self._lock:
+            self._missing.add(name)
+        return False
+
+
+def iter_image_files(upload_dir):
+    """(name relative to upload_dir, os.DirEntry) for every stored image file, walking the shards."""
+    stack = [Path(upload_dir)]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(Path(entry.path))
+                elif entry.is_file(follow_symlinks=False):
+                    yield Path(entry.path).relative_to(upload_dir).as_posix(), entry
+
+
+def original_name(name):
+    """Maps a variant's file name back to its original (a name that is not a variant is returned as is)."""
+    path = Path(name)
+    for variant in VARIANT_SIZES:
+        suffix = f"_{variant}"
+        if path.stem.endswith(suffix):
+            return path.with_name(path.stem[:-len(suffix)] + path.suffix).as_posix()
+    return path.as_posix()
+
+
+# --- Orphan Sweeper ---
+
+SweepReport = namedtuple('SweepReport', 'scanned orphans files_removed bytes_reclaimed blobs_corrected')
+
+
+def _modified_since(path, cutoff):
+    try:
+        return path.stat().st_mtime >= cutoff
+    except FileNotFoundError:
+        return False
+
+
+def sweep_orphans(conn, upload_dir, db_prefix, quarantine_dir=None, dry_run=False, batch_size=500, grace_seconds=3600, log=print):
+    """
+    Removes stored photos that no Resource.ImagePath points to any more (deleted or edited listings,
+    cascade-deleted owners, abandoned uploads), then recomputes ImageBlob.RefCount from Resource.
+
+    Originals are checked against the database `batch_size` at a time. Files younger than
+    `grace_seconds` are skipped, since an upload may be saved a moment before its Resource row commits.
+    With quarantine_dir, orphans are moved there instead of being deleted.
+    """
+    upload_dir = Path(upload_dir)
+    now = time.time()
+    groups = {}
+    for name, entry in iter_image_files(upload_dir):
+        stat = entry.stat()
+        if name.endswith('.tmp'):
+            # Left behind by an interrupted _write_atomic()
+            if now - stat.st_mtime > grace_seconds:
+                groups.setdefault(name, []).append((name, stat))
+            continue
+        groups.setdefault(original_name(name), []).append((name, stat))
+
+    def db_path(name):
+        return str(Path(db_prefix) / name)
+
+    scanned = len(groups)
+    orphans, files_removed, bytes_reclaimed = [], 0, 0
+    candidates = sorted(groups)
+    cursor = conn.cursor()
+    for start in range(0, len(candidates), batch_size):
+        batch = candidates[start:start + batch_size]
+        paths = [db_path(name) for name in batch]
+        cursor.execute(f"SELECT DISTINCT ImagePath FROM Resource WHERE ImagePath IN ({', '.join(['%s'] * len(paths))})", paths)
+        referenced = {row[0] for row in cursor.fetchall()}
+        for name in batch:
+            files = groups[name]
+            if db_path(name) in referenced: continue
+            if any(now - stat.st_mtime < grace_seconds for _, stat in files): continue
+            # Stat again right before removing: a re-upload of the same photo since the walk touches its files
+            if any(_modified_since(upload_dir / file_name, time.time() - grace_seconds) for file_name, _ in files): continue
+            orphans.append(name)
+            for file_name, stat in files:
+                bytes_reclaimed += stat.st_size
+                files_removed += 1
+                if dry_run: continue
+                source = upload_dir / file_name
+                if quarantine_dir:
+                    target = Path(quarantine_dir) / file_name
+                    target.parent.mkdir(parents=True, exist_ok=True)
+                    shutil.move(source, target)
+                else:
+                    source.unlink(missing_ok=True)
+        log(f"checked {min(start + batch_size, len(candidates))}/{len(candidates)} images, {len(orphans)} orphaned so far")
+
+    blobs_corrected = 0
+    if not dry_run:
+        for start in range(0, len(orphans), batch_size):
+            paths = [db_path(name) for name in orphans[start:start + batch_size]]
+            cursor.execute(f"DELETE FROM ImageBlob WHERE ImagePath IN ({', '.join(['%s'] * len(paths))})", paths)
+        # Cascade deletes skip the Resource triggers, so counts can drift; recompute the ones that did
+        cursor.execute("""
+            UPDATE ImageBlob b
+            LEFT JOIN (SELECT ImagePath, COUNT(*) AS Refs FROM Resource WHERE ImagePath IS NOT NULL GROUP BY ImagePath) r
+                ON r.ImagePath = b.ImagePath
+            SET b.RefCount = COALESCE(r.Refs, 0)
+            WHERE b.RefCount <> COALESCE(r.Refs, 0)
+        """)
+        blobs_corrected = cursor.rowcount
+        conn.commit()
+    cursor.close()
+    return SweepReport(scanned, len(orphans), files_removed, bytes_reclaimed, blobs_corrected)
+
+
+def main():
+    from db import load_mysql_config
+    import mysql.connector
+
+    base_dir = Path(__file__).resolve().parent
+    parser = argparse.ArgumentParser(description="Remove listing photos no longer referenced by any Resource.")
+    parser.add_argument("--upload-dir", default=base_dir / "static" / "images", type=Path)
+    parser.add_argument("--quarantine", metavar="DIR", type=Path, help="move orphans here instead of deleting them")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be removed")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--grace-hours", type=float, default=1.0, help="leave files younger than this alone")
+    parser.add_argument("--secrets", type=Path, help="path to secrets.toml (default: .streamlit/secrets.toml)")
+    args = parser.parse_args()
+
+    conn = mysql.connector.connect(**load_mysql_config(args.secrets))
+    try:
+        report = sweep_orphans(
+            conn, args.upload_dir, Path("static") / "images", quarantine_dir=args.quarantine,
+            dry_run=args.dry_run, batch_size=args.batch_size, grace_seconds=args.grace_hours * 3600,
+        )
+    finally:
+        conn.close()
+    action = "would reclaim" if args.dry_run else ("quarantined" if args.quarantine else "reclaimed")
+    print(f"{report.scanned} images scanned, {report.orphans} orphaned ({report.files_removed} files), "
+          f"{action} {report.bytes_reclaimed / 1_048_576:.1f} MiB; {report.blobs_corrected} ImageBlob ref counts corrected")
+
+
+if __name__ == "__main__":
+    main()
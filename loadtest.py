@@ -0,0 +1,506 @@
+# loadtest.py - Concurrent-session load test: N simulated students, one process each, run scripted flows through app.py
+
+import argparse
+import json
+import multiprocessing
+import queue
+import random
+import re
+import statistics
+import threading
+import time
+import tomllib
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from bench import percentile
+from datagen import DEFAULT_PASSWORD, SYNTHETIC_PREFIX, TITLE_WORDS
+from db import DEFAULT_SECRETS_PATH
+
+APP_PATH = Path(__file__).resolve().parent / "app.py"
+RUN_TIMEOUT = 30.0              # seconds one interaction (script run) may take before it counts as an error
+MONITOR_INTERVAL = 0.5          # seconds between samples of the server's connection counters
+MAX_BACK_CLICKS = 6
+FLOW_WEIGHTS = {'browse': 0.45, 'list_item': 0.10, 'buy': 0.15, 'borrow_return': 0.20, 'barter': 0.10}
+SEARCH_TERMS = [word for words in TITLE_WORDS.values() for word in words]
+LISTING_ID = re.compile(r"\(ID: (\d+)\)$")
+
+
+class FlowError(Exception):
+    """A step failed (script exception, timeout, missing widget); the session goes back home and carries on."""
+
+
+class NothingToDo(FlowError):
+    """The flow found nothing to act on (no listings to buy, no loans to return, ...); counted as skipped."""
+
+
+# --- Shared State ---
+
+class Recorder:
+    """
+    Step latencies, step errors/rejections and flow outcomes. Each session process keeps its own and
+    sends a snapshot() back when it stops; the parent merge()s them. `progress` is an optional shared
+    (steps, errors) array the parent reads for its progress lines while the test runs.
+    """
+
+    def __init__(self, progress=None):
+        self._lock = threading.Lock()
+        self.progress = progress
+        self.latencies = defaultdict(list)      # step -> [ms]
+        self.errors = Counter()                 # step -> script exceptions and timeouts
+        self.rejected = Counter()               # step -> runs that ended on st.error/st.warning (e.g. lost a purchase race)
+        self.flows = defaultdict(Counter)       # flow -> {'completed', 'failed', 'skipped'}
+        self.failures = Counter()               # first line of each failure message
+
+    def step(self, name, ms, error=None, rejected=False):
+        with self._lock:
+            self.latencies[name].append(ms)
+            if error: self.errors[name] += 1
+            if rejected: self.rejected[name] += 1
+        if self.progress is not None:
+            with self.progress.get_lock():
+                self.progress[0] += 1
+                if error: self.progress[1] += 1
+
+    def flow(self, name, outcome, message=None):
+        with self._lock:
+            self.flows[name][outcome] += 1
+            if message: self.failures[f"{name}: {message.splitlines()[0][:160]}"] += 1
+
+    def snapshot(self):
+        """Plain, picklable copy of everything recorded so far."""
+        with self._lock:
+            return {"latencies": dict(self.latencies), "errors": dict(self.errors), "rejected": dict(self.rejected),
+                    "flows": {name: dict(outcomes) for name, outcomes in self.flows.items()},
+                    "failures": dict(self.failures)}
+
+    def merge(self, snapshot):
+        with self._lock:
+            for name, timings in snapshot["latencies"].items(): self.latencies[name].extend(timings)
+            self.errors.update(snapshot["errors"])
+            self.rejected.update(snapshot["rejected"])
+            for name, outcomes in snapshot["flows"].items(): self.flows[name].update(outcomes)
+            self.failures.update(snapshot["failures"])
+
+
+class BarterBoard:
+    """
+    Barter listings owned by the simulated students, so proposals go to sessions that will review them.
+    Backed by a multiprocessing.Manager dict (SRN -> ResourceIDs) shared by the session processes.
+    """
+
+    def __init__(self, owned):
+        self._owned = owned
+
+    def publish(self, srn, resource_ids):
+        self._owned[srn] = sorted(resource_ids)
+
+    def others(self, srn):
+        return {rid for owner, ids in self._owned.items() if owner != srn for rid in ids}
+
+
+class ConnectionMonitor(threading.Thread):
+    """Samples Threads_connected/Threads_running on its own connection while the test runs."""
+
+    def __init__(self, conn, interval=MONITOR_INTERVAL):
+        super().__init__(name="loadtest-monitor", daemon=True)
+        self.conn = conn
+        self.interval = interval
+        self.samples = []           # (seconds since start, Threads_connected, Threads_running)
+        self.start_status = self.end_status = {}
+        self._stop = threading.Event()
+
+    def status(self):
+        cursor = self.conn.cursor()
+        cursor.execute("SHOW GLOBAL STATUS WHERE Variable_name IN "
+                       "('Threads_connected', 'Threads_running', 'Connections', 'Max_used_connections', 'Aborted_connects')")
+        status = {name: int(value) for name, value in cursor.fetchall()}
+        cursor.close()
+        return status
+
+    def run(self):
+        started = time.perf_counter()
+        self.start_status = self.status()
+        while not self._stop.wait(self.interval):
+            status = self.status()
+            self.samples.append((time.perf_counter() - started, status['Threads_connected'], status['Threads_running']))
+        self.end_status = self.status()
+
+    def stop(self):
+        self._stop.set()
+        self.join()
+
+    def report(self):
+        connected = [c for _, c, _ in self.samples] or [0]
+        running = [r for _, _, r in self.samples] or [0]
+        return {
+            "threads_connected_peak": max(connected), "threads_connected_mean": round(statistics.fmean(connected), 1),
+            "threads_running_peak": max(running), "threads_running_mean": round(statistics.fmean(running), 1),
+            "max_used_connections": self.end_status.get('Max_used_connections'),
+            "connections_opened": self.end_status.get('Connections', 0) - self.start_status.get('Connections', 0),
+            "aborted_connects": self.end_status.get('Aborted_connects', 0) - self.start_status.get('Aborted_connects', 0),
+        }
+
+
+# --- Simulated Student ---
+
+def _labelled(elements, label):
+    """The widget with this label, or None."""
+    return next((element for element in elements if element.label == label), None)
+
+
+def _listing_id(option):
+    match = LISTING_ID.search(str(option))
+    return int(match.group(1)) if match else None
+
+
+class Session:
+    """
+    One browser session: an AppTest of app.py driven through its widgets the way a student clicks.
+    Every interaction is one step -- widget changes plus the script run they trigger -- timed end to end.
+    """
+
+    def __init__(self, srn, secrets, recorder, board, rng, think_time=1.0, timeout=RUN_TIMEOUT):
+        from streamlit.testing.v1 import AppTest
+
+        self.srn = srn
+        self.recorder = recorder
+        self.board = board
+        self.rng = rng
+        self.think_time = think_time
+        self.listed = 0
+        self.at = AppTest.from_file(str(APP_PATH), default_timeout=timeout)
+        for table, values in secrets.items(): self.at.secrets[table] = values
+
+    # --- Steps ---
+
+    def step(self, name, action):
+        """Waits a think time, runs `action` (which ends in a script run) and records it under `name`."""
+        if self.think_time: time.sleep(self.rng.expovariate(1 / self.think_time))
+        started = time.perf_counter()
+        try:
+            action()
+            error = f"{self.at.exception[0].message}" if len(self.at.exception) else None
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        rejected = error is None and (len(self.at.error) > 0 or len(self.at.warning) > 0)
+        self.recorder.step(name, 1000 * (time.perf_counter() - started), error, rejected)
+        if error: raise FlowError(f"{name}: {error}")
+        return not rejected
+
+    def click(self, name, button):
+        return self.step(name, lambda: button.click().run())
+
+    @property
+    def page(self):
+        return self.at.session_state['page'] if 'page' in self.at.session_state else None
+
+    def expect_page(self, page):
+        if self.page != page: raise FlowError(f"expected page {page!r}, on {self.page!r}")
+
+    def widget(self, elements, label):
+        """The widget with this label; NothingToDo if the page did not render it (nothing to act on)."""
+        element = _labelled(elements, label)
+        if element is None: raise NothingToDo(f"no {label!r} on page {self.page!r}")
+        return element
+
+    # --- Navigation ---
+
+    def login(self):
+        self.step("open", self.at.run)
+        self.click("login_page", self.widget(self.at.button, "Log In"))
+        def submit():
+            self.at.text_input(key="login_srn_input").input(self.srn)
+            self.at.text_input(key="login_pass_input").input(DEFAULT_PASSWORD)
+            _labelled(self.at.button, "Log In").click().run()
+        self.step("login", submit)
+        self.expect_page('home')
+
+    def go_home(self):
+        for _ in range(MAX_BACK_CLICKS):
+            if self.page == 'home': return
+            self.click("back", self.widget(self.at.button, "⬅️ Go Back"))
+        self.expect_page('home')
+
+    def set_filters(self, listing_type='All Options', search="", category='All Categories', sort='Newest'):
+        def apply():
+            self.at.text_input(key="browse_search").input(search)
+            _labelled(self.at.selectbox, "Filter by Category").set_value(category)
+            _labelled(self.at.selectbox, "Filter by Transaction Type").set_value(listing_type)
+            _labelled(self.at.selectbox, "Sort by").set_value(sort)
+            self.at.run()
+        self.step("filter", apply)
+
+    def open_listing(self, listing_type, page):
+        """From home: filter to one transaction type and open a random card's action page."""
+        self.go_home()
+        self.set_filters(listing_type)
+        cards = [button for button in self.at.button if (button.key or "").startswith("act_")]
+        if not cards: raise NothingToDo(f"no {listing_type} listings")
+        self.click("open_listing", self.rng.choice(cards))
+        self.expect_page(page)
+
+    def choose(self, selectbox, preferred=None):
+        """Selects a random option of `selectbox`, among `preferred` option indexes when there are any."""
+        indexes = preferred or range(len(selectbox.options))
+        selectbox.select_index(self.rng.choice(list(indexes)))
+
+    # --- Flows ---
+
+    def browse(self):
+        self.go_home()
+        category = self.widget(self.at.selectbox, "Filter by Category")
+        self.set_filters(search=self.rng.choice(SEARCH_TERMS))
+        self.set_filters(category=self.rng.choice(category.options[1:] or category.options),
+                         sort=self.rng.choice(['Newest', 'Top Rated']))
+        next_page = _labelled(self.at.button, "Next ▶")
+        if next_page is not None and not next_page.disabled:
+            self.click("next_page", next_page)
+
+    def list_item(self, action_type=None):
+        action_type = action_type or self.rng.choice(['sell', 'lend', 'barter'])
+        self.go_home()
+        self.click("open_upload", self.widget(self.at.sidebar.button, {
+            'sell': "💸 **SELL** an Item", 'lend': "📚 **LEND** an Item", 'barter': "🔄 **BARTER** an Item"}[action_type]))
+        self.expect_page(f'upload_{action_type}')
+        self.listed += 1
+        title = f"{self.rng.choice(SEARCH_TERMS)} load test {self.srn}-{self.listed}"
+        def submit():
+            _labelled(self.at.text_input, "Item Title (e.g., 'DBMS Book', 'Study Chair')").input(title)
+            _labelled(self.at.text_area, "Detailed Description").input(f"Listed by the load test ({action_type})")
+            self.choose(_labelled(self.at.selectbox, "Condition"))
+            self.choose(_labelled(self.at.selectbox, "Category"))
+            if action_type == 'sell':
+                _labelled(self.at.number_input, "Selling Price (₹)").set_value(float(self.rng.randint(50, 5000)))
+            elif action_type == 'lend':
+                _labelled(self.at.text_area, "Lending Terms (e.g., Duration, Late Fee info)").input("One week")
+            else:
+                wanted = _labelled(self.at.multiselect, "Categories you would accept in exchange")
+                wanted.set_value(self.rng.sample(wanted.options, min(2, len(wanted.options))))
+            _labelled(self.at.checkbox, "List it even if it looks like one of my existing listings").check()
+            _labelled(self.at.button, {'sell': "List Item for Sale", 'lend': "List Item for Lending",
+                                       'barter': "List Item for Barter"}[action_type]).click().run()
+        if self.step("list_item", submit): self.expect_page('home')
+
+    def buy(self):
+        self.open_listing('Buy/Sell', 'buysell')
+        listing = self.widget(self.at.selectbox, "Select Resource ID to Purchase")
+        self.choose(listing)
+        if not self.click("buy", self.widget(self.at.button, "Request Purchase")): return
+        self.step("payments_tab", lambda: self.at.radio(key="buysell_tab").set_value('Confirm Sales').run())
+        if _labelled(self.at.selectbox, "Select BuySellID to Confirm Payment") is None: raise NothingToDo("no purchase awaiting payment")
+        def pay():
+            self.at.text_input(key="buy_trans_id_input").input(f"LT{self.rng.randrange(10 ** 9)}")
+            _labelled(self.at.button, "Submit Transaction ID").click().run()
+        self.step("pay", pay)
+
+    def borrow_return(self):
+        self.open_listing('Lend/Borrow', 'lendborrow')
+        self.choose(self.widget(self.at.selectbox, "Select Resource ID to Borrow"))
+        self.click("borrow", self.widget(self.at.button, "Initiate Borrow"))
+        self.step("loans_tab", lambda: self.at.radio(key="lendborrow_tab").set_value('Manage Active Loans').run())
+        loan = _labelled(self.at.selectbox, "Select Loan ID to Return")
+        if loan is None: raise NothingToDo("no ongoing loan to return")
+        self.choose(loan)
+        self.click("return", self.widget(self.at.button, "Confirm Return Early / On Time"))
+
+    def barter(self):
+        self.list_item('barter')
+        self.open_listing('Barter', 'barter')
+        mine = self.widget(self.at.selectbox, "Your Item (Item 1)")
+        self.board.publish(self.srn, [_listing_id(option) for option in mine.options])
+        wanted = self.widget(self.at.selectbox, "Item You Want (Item 2)")
+        others = self.board.others(self.srn)
+        self.choose(mine)
+        # Propose to another simulated student when possible, so someone is there to accept
+        self.choose(wanted, [i for i, option in enumerate(wanted.options) if _listing_id(option) in others])
+        self.click("propose_barter", self.widget(self.at.button, "Submit Barter Proposal"))
+        self.step("proposals_tab", lambda: self.at.radio(key="barter_tab").set_value('Review Proposals').run())
+        proposal = _labelled(self.at.selectbox, "Select Barter ID to Accept/Reject")
+        if proposal is None: raise NothingToDo("no proposal to review")
+        self.choose(proposal)
+        self.click("accept_barter", self.widget(self.at.button, "Accept Barter"))
+
+
+# --- Running ---
+
+def synthetic_students(conn, n):
+    """SRNs of n datagen.py students, who all share DEFAULT_PASSWORD."""
+    cursor = conn.cursor()
+    cursor.execute("SELECT SRN FROM Student WHERE SRN LIKE %s ORDER BY SRN LIMIT %s", (SYNTHETIC_PREFIX + '%', n))
+    srns = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    return srns
+
+
+def session_process(index, srn, secrets, board, stop, progress, results, options):
+    """
+    Body of one session process: log in, then pick flows by weight until `stop` is set, starting over
+    with a fresh AppTest after a failure it cannot navigate away from. Puts (srn, Recorder snapshot) on
+    `results` when done.
+    """
+    recorder = Recorder(progress)
+    rng = random.Random(options["seed"] * 100003 + index)
+    flows, flow_weights = list(options["weights"]), list(options["weights"].values())
+    think_time, timeout = options["think_time"], options["timeout"]
+    session = None
+    try:
+        if stop.wait(options["start_delay"]): return
+        while not stop.is_set():
+            if session is None:
+                session = Session(srn, secrets, recorder, board, rng, think_time, timeout)
+                try:
+                    session.login()
+                    recorder.flow('login', 'completed')
+                except FlowError as e:
+                    recorder.flow('login', 'failed', str(e))
+                    session = None
+                    stop.wait(1.0)
+                continue
+            flow = rng.choices(flows, flow_weights)[0]
+            try:
+                getattr(session, flow)()
+                recorder.flow(flow, 'completed')
+            except NothingToDo:
+                recorder.flow(flow, 'skipped')
+            except FlowError as e:
+                recorder.flow(flow, 'failed', str(e))
+                try:
+                    session.go_home()
+                except FlowError:
+                    session = None      # start over with a fresh browser session
+    finally:
+        results.put((srn, recorder.snapshot()))
+
+
+def run_load_test(monitor_conn, secrets, srns, duration=60.0, ramp_up=10.0, think_time=1.0, seed=1,
+                  timeout=RUN_TIMEOUT, weights=FLOW_WEIGHTS, log=print):
+    """
+    One process per student in `srns`: log in, then pick flows by `weights` until `duration` seconds have
+    passed since the last session started. Sessions start evenly over `ramp_up` seconds.
+
+    AppTest swaps process-global Streamlit state (the runtime instance, st.secrets, config) on every run,
+    so two of them cannot share a process. Each session is therefore its own Streamlit process with its
+    own caches and connection pool -- N pools against MySQL rather than the one a `streamlit run` server
+    shares between its sessions, which is the number to size [mysql] pool_size against.
+    """
+    context = multiprocessing.get_context("spawn")
+    manager = context.Manager()
+    board = BarterBoard(manager.dict())
+    stop, results = context.Event(), context.Queue()
+    progress = context.Array('l', 2)        # steps, errors over all sessions
+    recorder = Recorder()
+
+    processes = [
+        context.Process(target=session_process, name=f"session-{srn}", daemon=True, args=(
+            i, srn, secrets, board, stop, progress, results,
+            {"seed": seed, "weights": dict(weights), "think_time": think_time, "timeout": timeout,
+             "start_delay": ramp_up * i / len(srns)}))
+        for i, srn in enumerate(srns)
+    ]
+    monitor = ConnectionMonitor(monitor_conn)
+    monitor.start()
+    started = time.perf_counter()
+    for process in processes: process.start()
+    deadline = started + ramp_up + duration
+    while time.perf_counter() < deadline:
+        time.sleep(min(10.0, max(0.0, deadline - time.perf_counter())))
+        log(f"{time.perf_counter() - started:6.0f}s  {progress[0]} steps, {progress[1]} errors")
+    stop.set()
+
+    # Drain results before joining: a process does not exit while its queue data is unflushed
+    finish_by = time.perf_counter() + timeout + think_time * 10
+    reported = set()
+    while len(reported) < len(processes):
+        try:
+            srn, snapshot = results.get(timeout=1.0)
+        except queue.Empty:
+            if time.perf_counter() > finish_by or not any(process.is_alive() for process in processes): break
+            continue
+        recorder.merge(snapshot)
+        reported.add(srn)
+    elapsed = time.perf_counter() - started
+    for process in processes:
+        process.join(1.0)
+        if process.is_alive(): process.terminate()
+    monitor.stop()
+    manager.shutdown()
+    if len(reported) < len(processes): log(f"{len(processes) - len(reported)} sessions did not report back in time")
+    return build_report(recorder, monitor, len(srns), elapsed, think_time)
+
+
+def build_report(recorder, monitor, sessions, elapsed, think_time):
+    steps = {}
+    for name, timings in sorted(recorder.latencies.items()):
+        timings = sorted(timings)
+        steps[name] = {
+            "count": len(timings), "errors": recorder.errors[name], "rejected": recorder.rejected[name],
+            "p50_ms": round(percentile(timings, 0.50), 1), "p95_ms": round(percentile(timings, 0.95), 1),
+            "p99_ms": round(percentile(timings, 0.99), 1), "max_ms": round(timings[-1], 1),
+        }
+    total_steps = sum(step["count"] for step in steps.values())
+    completed = sum(outcomes['completed'] for name, outcomes in recorder.flows.items() if name != 'login')
+    return {
+        "sessions": sessions, "seconds": round(elapsed, 1), "think_time": think_time,
+        "steps_per_second": round(total_steps / elapsed, 2), "flows_per_second": round(completed / elapsed, 2),
+        "error_rate": round(sum(recorder.errors.values()) / max(1, total_steps), 4),
+        "steps": steps, "flows": {name: dict(outcomes) for name, outcomes in sorted(recorder.flows.items())},
+        "connections": monitor.report(), "top_failures": recorder.failures.most_common(10),
+    }
+
+
+def print_report(report):
+    c = report["connections"]
+    print(f"\n{report['sessions']} sessions for {report['seconds']}s (think time {report['think_time']}s): "
+          f"{report['steps_per_second']} steps/s, {report['flows_per_second']} flows/s, error rate {report['error_rate']:.2%}")
+    print(f"\n{'step':<16}{'count':>8}{'errors':>8}{'rejected':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, s in report["steps"].items():
+        print(f"{name:<16}{s['count']:>8}{s['errors']:>8}{s['rejected']:>10}{s['p50_ms']:>10.1f}{s['p95_ms']:>10.1f}"
+              f"{s['p99_ms']:>10.1f}{s['max_ms']:>10.1f}")
+    print("\nflows: " + ", ".join(f"{name} {o.get('completed', 0)} ok/{o.get('skipped', 0)} skipped/{o.get('failed', 0)} failed"
+                                  for name, o in report["flows"].items()))
+    print(f"connections: {c['threads_connected_peak']} peak / {c['threads_connected_mean']} mean connected, "
+          f"{c['threads_running_peak']} peak running, {c['connections_opened']} opened during the run, "
+          f"max used {c['max_used_connections']}, {c['aborted_connects']} aborted")
+    for message, count in report["top_failures"]:
+        print(f"  {count:>5}x {message}")
+
+
+def main():
+    from db import load_mysql_config
+    import mysql.connector
+
+    parser = argparse.ArgumentParser(description="Simulate concurrent students clicking through app.py (one AppTest session per "
+                                                 "process) against a local MySQL filled by datagen.py.")
+    parser.add_argument("--sessions", type=int, default=10, help="concurrent students")
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds to run after the last session started")
+    parser.add_argument("--ramp-up", type=float, default=10.0, help="seconds over which sessions start")
+    parser.add_argument("--think-time", type=float, default=1.0, help="mean seconds a student pauses between steps (0: none)")
+    parser.add_argument("--pool-size", type=int, help="override [mysql] pool_size for each session process")
+    parser.add_argument("--timeout", type=float, default=RUN_TIMEOUT, help="seconds one script run may take")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--save", type=Path, help="write the report (JSON) here")
+    parser.add_argument("--secrets", type=Path, help="path to secrets.toml (default: .streamlit/secrets.toml)")
+    args = parser.parse_args()
+
+    with open(args.secrets or DEFAULT_SECRETS_PATH, "rb") as f:
+        secrets = tomllib.load(f)
+    if args.pool_size is not None: secrets["mysql"]["pool_size"] = args.pool_size
+
+    conn = mysql.connector.connect(**load_mysql_config(args.secrets))
+    try:
+        srns = synthetic_students(conn, args.sessions)
+        if len(srns) < args.sessions:
+            parser.error(f"only {len(srns)} synthetic students; run datagen.py --students {args.sessions} first")
+        report = run_load_test(conn, secrets, srns, duration=args.duration, ramp_up=args.ramp_up,
+                               think_time=args.think_time, seed=args.seed, timeout=args.timeout)
+    finally:
+        conn.close()
+    print_report(report)
+    if args.save:
+        args.save.write_text(json.dumps(report, indent=2))
+        print(f"report saved to {args.save}")
+
+
+if __name__ == "__main__":
+    main()
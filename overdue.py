@@ -0,0 +1,46 @@
+# overdue.py - Runs the overdue-penalty and reminder pass (run_overdue_pass) outside the MySQL event scheduler
+
+import argparse
+import datetime
+import time
+from pathlib import Path
+
+DEFAULT_CHUNK_SIZE = 5000
+
+
+def run_overdue_pass(conn, as_of=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Calls the run_overdue_pass procedure (which commits as it goes). Returns its counters as a dict."""
+    cursor = conn.cursor()
+    try:
+        cursor.callproc('run_overdue_pass', (as_of or datetime.date.today(), chunk_size))
+        result = next(cursor.stored_results())
+        columns = [c[0] for c in result.description]
+        return dict(zip(columns, result.fetchone()))
+    finally:
+        cursor.close()
+
+
+def main():
+    from db import load_mysql_config
+    import mysql.connector
+
+    parser = argparse.ArgumentParser(description="Accrue late fees on overdue loans and advance/escalate reminders. "
+                                                 "Equivalent to the ev_overdue_nightly event, for cron.")
+    parser.add_argument("--as-of", type=datetime.date.fromisoformat, help="day to run the pass for (default: today)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="loans updated per transaction")
+    parser.add_argument("--secrets", type=Path, help="path to secrets.toml (default: .streamlit/secrets.toml)")
+    args = parser.parse_args()
+
+    conn = mysql.connector.connect(**load_mysql_config(args.secrets))
+    started = time.perf_counter()
+    try:
+        report = run_overdue_pass(conn, args.as_of, args.chunk_size)
+    finally:
+        conn.close()
+    print(f"run {report['RunID']}: {report['PenaltiesUpdated']} late fees updated, {report['RemindersDue']} reminders due, "
+          f"{report['RemindersOverdue']} marked overdue, {report['NoticesSent']} overdue notices, "
+          f"{time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+# profiling.py - Opt-in per-rerun profiler: section timings, SQL per section and sampled stacks for flamegraphs
+
+import contextvars
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from pathlib import Path
+
+from db import fingerprint, statement_listener
+
+SAMPLE_INTERVAL = 0.005     # seconds between stack samples of the script thread
+MAX_STACK_DEPTH = 200
+
+# Profile of the rerun the current thread is executing, if profiling is on
+active_profile = contextvars.ContextVar("active_profile", default=None)
+
+
+def section(name):
+    """with section("cards"): ... -- times the block in the active rerun profile; does nothing when profiling is off."""
+    profile = active_profile.get()
+    return profile.section(name) if profile is not None else nullcontext()
+
+
+class RerunProfile:
+    """
+    One script rerun. Named sections nest (navigation, page_*, cards, ...) and are timed with
+    perf_counter; every statement run through an instrumented cursor is attributed to the innermost
+    open section; a background thread samples the script thread's Python stack every
+    SAMPLE_INTERVAL seconds for a flamegraph. Frames outside `root` (Streamlit's runner) are trimmed.
+    """
+
+    def __init__(self, label, root=None, sample_interval=SAMPLE_INTERVAL):
+        self.label = label
+        self.root = str(root) if root is not None else None
+        self.sample_interval = sample_interval
+        self.started_at = datetime.now()
+        self.seconds = 0.0
+        self.sections = {}          # section path (tuple) -> [calls, seconds]
+        self.queries = {}           # (section path, statement fingerprint) -> [calls, seconds, rows]
+        self.samples = Counter()    # folded stack -> sample count
+        self._path = ()
+        self._thread_id = None
+        self._started = None
+        self._stop = threading.Event()
+        self._sampler = None
+        self._tokens = []
+        self._lock = threading.Lock()     # dashboard workers record queries concurrently
+
+    # --- Lifecycle ---
+
+    def start(self):
+        self._thread_id = threading.get_ident()
+        self._tokens = [active_profile.set(self), statement_listener.set(self.record_query)]
+        self._started = time.perf_counter()
+        self._sampler = threading.Thread(target=self._sample_loop, name="rerun-profiler", daemon=True)
+        self._sampler.start()
+        return self
+
+    def stop(self):
+        if self._started is None: return self
+        self.seconds = time.perf_counter() - self._started
+        self._started = None
+        self._stop.set()
+        self._sampler.join()
+        for var, token in zip((active_profile, statement_listener), self._tokens):
+            var.reset(token)
+        return self
+
+    @contextmanager
+    def section(self, name):
+        parent = self._path
+        self._path = parent + (name,)
+        entry = self.sections.setdefault(self._path, [0, 0.0])
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry[0] += 1
+            entry[1] += time.perf_counter() - started
+            self._path = parent
+
+    def record_query(self, sql, seconds, rows):
+        key = (self._path, fingerprint(sql))
+        with self._lock:
+            entry = self.queries.setdefault(key, [0, 0.0, 0])
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] += rows
+
+    # --- Sampling ---
+
+    def _sample_loop(self):
+        while not self._stop.wait(self.sample_interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None: continue
+            stack = []
+            while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                code = frame.f_code
+                stack.append((code.co_filename, f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"))
+                frame = frame.f_back
+            stack.reverse()
+            if self.root is not None:
+                first_own = next((i for i, (filename, _) in enumerate(stack) if filename.startswith(self.root)), 0)
+                stack = stack[first_own:]
+            sections = [f"[{name}]" for name in self._path]
+            self.samples[";".join(sections + [label for _, label in stack])] += 1
+
+    # --- Reports ---
+
+    def breakdown(self):
+        """One dict per section, in first-entered order: wall time, SQL time and rows inside it (nested sections included)."""
+        rows = []
+        for path, (calls, seconds) in self.sections.items():
+            with self._lock:
+                sql = [q for (query_path, _), q in self.queries.items() if query_path[:len(path)] == path]
+            sql_seconds = sum(q[1] for q in sql)
+            rows.append({
+                "Section": " › ".join(path), "Calls": calls, "Ms": round(1000 * seconds, 1),
+                "SqlMs": round(1000 * sql_seconds, 1), "OtherMs": round(1000 * (seconds - sql_seconds), 1),
+                "Statements": sum(q[0] for q in sql), "Rows": sum(q[2] for q in sql),
+                "Share": round(seconds / self.seconds, 3) if self.seconds else 0.0,
+            })
+        return rows
+
+    def query_breakdown(self):
+        """One dict per (section, statement), slowest first."""
+        with self._lock:
+            queries = list(self.queries.items())
+        rows = [
+            {"Section": " › ".join(path) or "-", "Statement": statement, "Calls": calls,
+             "Ms": round(1000 * seconds, 2), "Rows": n_rows}
+            for (path, statement), (calls, seconds, n_rows) in queries
+        ]
+        rows.sort(key=lambda row: row["Ms"], reverse=True)
+        return rows
+
+    def hot_functions(self, limit=25):
+        """
+        Functions by sampled self time (leaf frames) and total time (anywhere on the stack). Samples are
+        scaled to the rerun's wall time, since the sampler wakes up less often than asked under load.
+        """
+        own, total = Counter(), Counter()
+        for stack, count in self.samples.items():
+            frames = [frame for frame in stack.split(";") if not frame.startswith("[")]
+            if not frames: continue
+            own[frames[-1]] += count
+            for frame in set(frames): total[frame] += count
+        n = sum(self.samples.values()) or 1
+        ms_per_sample = 1000 * self.seconds / n if self.seconds else 1000 * self.sample_interval
+        return [
+            {"Function": frame, "SelfMs": round(own[frame] * ms_per_sample, 1),
+             "TotalMs": round(count * ms_per_sample, 1), "TotalShare": round(count / n, 3)}
+            for frame, count in total.most_common(limit)
+        ]
+
+    def folded(self):
+        """Samples in the folded-stack format read by flamegraph.pl, speedscope and inferno."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+    def dump(self, directory):
+        """Writes the folded stacks to `directory`; returns the file path."""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"{self.started_at:%Y%m%d-%H%M%S}-{self.label}.folded"
+        path.write_text(self.folded())
+        return path
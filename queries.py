@@ -0,0 +1,156 @@
+# queries.py - Read queries of the app pages, named so the benchmark suite (bench.py) runs exactly what the pages run
+
+# Login by SRN or email; params: identifier, identifier
+LOGIN = "SELECT SRN, Password FROM Student WHERE SRN = %s OR Email = %s"
+
+# Items for sale by others (Buy/Sell > Browse Items to Buy)
+BUYSELL_LISTINGS = """
+SELECT
+    r.ResourceID, r.Title, r.Description, r.itemCondition,
+    bs.Price, CONCAT(s.FirstName, ' ', s.LastName) AS SellerName
+FROM Resource r
+JOIN Student s ON r.OwnerID = s.SRN
+JOIN BuySell bs ON r.ResourceID = bs.ItemID
+WHERE r.Status = 'Available'
+  AND r.ListingType = 'Sell' -- Ensures it's a 'Sell' item
+  AND r.OwnerID != %s
+  AND bs.Status = 'Listed' -- Only show items that are 'Listed'
+"""
+
+# Reserved purchases the buyer has not paid yet
+BUYSELL_AWAITING_PAYMENT = """
+SELECT bs.BuySellID, r.Title, bs.Price, bs.BuyerTransID
+FROM BuySell bs
+JOIN Resource r ON bs.ItemID = r.ResourceID
+WHERE bs.BuyerID = %s AND bs.BuyerTransID IS NULL AND bs.Status = 'PendingPayment'
+"""
+
+# Paid purchases waiting for the seller's confirmation
+BUYSELL_AWAITING_CONFIRMATION = """
+SELECT bs.BuySellID, r.Title, bs.Price, bs.BuyerTransID, s.FirstName AS BuyerName
+FROM BuySell bs
+JOIN Resource r ON bs.ItemID = r.ResourceID
+JOIN Student s ON bs.BuyerID = s.SRN
+WHERE bs.SellerID = %s AND bs.BuyerTransID IS NOT NULL AND bs.SellerConfirm = FALSE AND bs.Status = 'PendingConfirmation'
+"""
+
+# Items others lend out that are free right now
+LEND_LISTINGS = """
+SELECT
+    r.ResourceID, r.Title, r.Description, r.itemCondition,
+    CONCAT(s.FirstName, ' ', s.LastName) AS LenderName
+FROM Resource r
+JOIN Student s ON r.OwnerID = s.SRN
+WHERE r.Status = 'Available'
+  AND r.ListingType = 'Lend'
+  AND r.OwnerID != %s
+"""
+
+# Lend items of others with availability for a window; params: window end (exclusive), window start, student
+LEND_CALENDAR = """
+SELECT r.ResourceID, r.Title, CONCAT(s.FirstName, ' ', s.LastName) AS LenderName,
+       NOT EXISTS (
+           SELECT 1 FROM LendReservation lr
+           WHERE lr.ItemID = r.ResourceID AND lr.Status IN ('Reserved', 'Active')
+             AND lr.StartDate < %s AND lr.EndDate > %s
+       ) AS FreeForDates
+FROM Resource r
+JOIN Student s ON r.OwnerID = s.SRN
+WHERE r.ListingType = 'Lend' AND r.OwnerID != %s
+ORDER BY FreeForDates DESC, r.ResourceID DESC
+"""
+
+# A student's open bookings on the lending calendar
+MY_RESERVATIONS = """
+SELECT lr.ReservationID, r.Title, lr.StartDate, DATE_SUB(lr.EndDate, INTERVAL 1 DAY) AS ReturnDate, lr.Status
+FROM LendReservation lr JOIN Resource r ON r.ResourceID = lr.ItemID
+WHERE lr.BorrowerID = %s AND lr.Status IN ('Reserved', 'Waitlisted')
+ORDER BY lr.StartDate
+"""
+
+# Everything a student borrowed, newest first
+MY_LOANS = """
+SELECT
+    lb.LendBorrowID, r.Title, lb.StartDate, lb.EndDate, lb.Status,
+    DATEDIFF(CURDATE(), lb.EndDate) AS DaysLate,
+    r.ResourceID
+FROM LendBorrow lb
+JOIN Resource r ON lb.itemID = r.ResourceID
+WHERE lb.BorrowerID = %s
+ORDER BY lb.StartDate DESC
+"""
+
+# A student's own available barter listings
+MY_BARTER_LISTINGS = """
+SELECT ResourceID, Title FROM Resource WHERE OwnerID = %s AND Status = 'Available' AND ListingType = 'Barter'
+"""
+
+# Available barter listings of others
+BARTER_LISTINGS = """
+SELECT ResourceID, Title, CONCAT(s.FirstName, ' ', s.LastName) AS OwnerName
+FROM Resource r JOIN Student s ON r.OwnerID = s.SRN
+WHERE r.Status = 'Available'
+  AND r.ListingType = 'Barter'
+  AND r.OwnerID != %s
+"""
+
+# Pending proposals the student has to answer
+BARTER_PROPOSALS = """
+SELECT b.BarterID, r1.Title AS ProposerItem, r2.Title AS YourItem,
+       CONCAT(s.FirstName, ' ', s.LastName) AS ProposerName
+FROM Barter b
+JOIN Resource r1 ON b.Item1ID = r1.ResourceID
+JOIN Resource r2 ON b.Item2ID = r2.ResourceID
+JOIN Student s ON b.ProposerID = s.SRN
+WHERE b.AccepterID = %s AND b.Status = 'Pending'
+"""
+
+# Legs of every proposed trade circle the student is part of
+BARTER_CIRCLES = """
+SELECT c.CycleID, l.Position, r.Title, l.ItemID, l.GiverID, l.ReceiverID, l.Response,
+       CONCAT(g.FirstName, ' ', g.LastName) AS GiverName, CONCAT(rc.FirstName, ' ', rc.LastName) AS ReceiverName
+FROM BarterCycle c
+JOIN BarterCycleLeg mine ON mine.CycleID = c.CycleID AND mine.GiverID = %s
+JOIN BarterCycleLeg l ON l.CycleID = c.CycleID
+JOIN Resource r ON r.ResourceID = l.ItemID
+JOIN Student g ON g.SRN = l.GiverID
+JOIN Student rc ON rc.SRN = l.ReceiverID
+WHERE c.Status = 'Proposed'
+ORDER BY c.CycleID, l.Position
+"""
+
+# Accepted barters from the student's side; params: student, student
+BARTER_HISTORY = """
+(
+    -- I was the Proposer (I GAVE Item1, I RECEIVED Item2)
+    SELECT
+        b.BarterID,
+        r1.Title AS 'Item You Gave',
+        r2.Title AS 'Item You Received',
+        CONCAT(s_acc.FirstName, ' ', s_acc.LastName) AS 'Traded With',
+        b.Status,
+        b.BarterDate
+    FROM Barter b
+    JOIN Resource r1 ON b.Item1ID = r1.ResourceID
+    JOIN Resource r2 ON b.Item2ID = r2.ResourceID
+    JOIN Student s_acc ON b.AccepterID = s_acc.SRN
+    WHERE b.ProposerID = %s AND b.Status = 'Accepted'
+)
+UNION
+(
+    -- I was the Accepter (I GAVE Item2, I RECEIVED Item1)
+    SELECT
+        b.BarterID,
+        r2.Title AS 'Item You Gave',
+        r1.Title AS 'Item You Received',
+        CONCAT(s_prop.FirstName, ' ', s_prop.LastName) AS 'Traded With',
+        b.Status,
+        b.BarterDate
+    FROM Barter b
+    JOIN Resource r1 ON b.Item1ID = r1.ResourceID
+    JOIN Resource r2 ON b.Item2ID = r2.ResourceID
+    JOIN Student s_prop ON b.ProposerID = s_prop.SRN
+    WHERE b.AccepterID = %s AND b.Status = 'Accepted'
+)
+ORDER BY BarterDate DESC
+"""
@@ -0,0 +1,210 @@
+# recommend.py - "Similar items" and "you might need" recommendations from an in-process vector index
+
+import threading
+import zlib
+
+import numpy as np
+
+from search import TITLE_WEIGHT, deleted_ids, tokenize
+
+HASH_BUCKETS = 1 << 14      # words are hashed into this many TF-IDF features
+TEXT_DIM = 256              # ...which a fixed random projection maps down to this many dimensions
+CATEGORY_DIM = 64           # CategoryID is hashed into a one-hot block of this size
+CATEGORY_WEIGHT = 0.5       # weight of the category block relative to the (unit length) text part
+REWEIGHT_GROWTH = 0.25      # recompute every vector once the corpus has grown/shrunk this much since the last IDF pass
+PROJECTION_SEED = 20240611
+
+
+def _bucket(term):
+    return zlib.crc32(term.encode()) % HASH_BUCKETS
+
+
+class SimilarityIndex:
+    """
+    Resource listings as dense, L2-normalised vectors: hashed TF-IDF of Title/Description projected to
+    TEXT_DIM dimensions, plus a category block. All vectors live in one float32 matrix, so a query is a
+    single matrix product over every listing instead of per-row Python.
+
+    Kept in sync with the Resource table through refresh(), which only reads rows whose UpdatedAt
+    moved since the previous call and drops deleted ones (the same scheme as search.SearchIndex).
+    """
+
+    def __init__(self, capacity=1024):
+        rng = np.random.default_rng(PROJECTION_SEED)
+        # Johnson-Lindenstrauss projection: cosine similarity survives the reduction approximately
+        self._projection = (rng.standard_normal((HASH_BUCKETS, TEXT_DIM)) / np.sqrt(TEXT_DIM)).astype(np.float32)
+        self._vectors = np.zeros((capacity, TEXT_DIM + CATEGORY_DIM), dtype=np.float32)
+        self._active = np.zeros(capacity, dtype=bool)      # row holds a listing that is Available
+        self._ids = np.full(capacity, -1, dtype=np.int64)
+        self._owners = np.full(capacity, -1, dtype=np.int32)   # owner code, see _owner_code()
+        self._owner_codes = {}
+        self._rows = {}                                     # ResourceID -> row
+        self._free_rows = []
+        self._terms = {}                                    # ResourceID -> (bucket indices, term frequencies, CategoryID)
+        self._df = np.zeros(HASH_BUCKETS, dtype=np.int32)   # document frequency per bucket
+        self._weighted_at = 0                               # corpus size at the last full IDF pass
+        self._lock = threading.RLock()
+        self.synced_until = None
+        self.synced_version = None              # catalog version of the last refresh, see refresh()
+
+    def __len__(self):
+        return len(self._rows)
+
+    # --- Maintenance ---
+
+    def upsert(self, resource_id, title, description, category_id, owner_id, available=True):
+        counts = {}
+        for t in tokenize(title): counts[_bucket(t)] = counts.get(_bucket(t), 0) + TITLE_WEIGHT
+        for t in tokenize(description): counts[_bucket(t)] = counts.get(_bucket(t), 0) + 1
+        buckets = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+        tf = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+        with self._lock:
+            self._drop_terms(resource_id)
+            self._terms[resource_id] = (buckets, tf, category_id)
+            self._df[buckets] += 1
+            row = self._rows.get(resource_id)
+            if row is None:
+                row = self._free_rows.pop() if self._free_rows else self._grow()
+                self._rows[resource_id] = row
+                self._ids[row] = resource_id
+            self._owners[row] = self._owner_code(owner_id)
+            self._active[row] = available
+            self._vectors[row] = self._vectorize(buckets, tf, category_id)
+
+    def remove(self, resource_id):
+        with self._lock:
+            self._drop_terms(resource_id)
+            row = self._rows.pop(resource_id, None)
+            if row is None: return
+            self._active[row] = False
+            self._ids[row] = -1
+            self._owners[row] = -1
+            self._vectors[row] = 0.0
+            self._free_rows.append(row)
+
+    def _drop_terms(self, resource_id):
+        previous = self._terms.pop(resource_id, None)
+        if previous is not None: self._df[previous[0]] -= 1
+
+    def _grow(self):
+        used = len(self._rows)
+        if used == len(self._ids):
+            capacity = 2 * len(self._ids)
+            self._vectors = np.resize(self._vectors, (capacity, self._vectors.shape[1]))
+            self._vectors[used:] = 0.0
+            self._active = np.concatenate([self._active, np.zeros(capacity - used, dtype=bool)])
+            self._ids = np.concatenate([self._ids, np.full(capacity - used, -1, dtype=np.int64)])
+            self._owners = np.concatenate([self._owners, np.full(capacity - used, -1, dtype=np.int32)])
+        return used
+
+    def _owner_code(self, owner_id):
+        # Integer codes keep owner comparisons vectorised
+        return self._owner_codes.setdefault(owner_id, len(self._owner_codes))
+
+    def _vectorize(self, buckets, tf, category_id):
+        vector = np.zeros(TEXT_DIM + CATEGORY_DIM, dtype=np.float32)
+        if len(buckets):
+            n_docs = max(len(self._terms), 1)
+            idf = np.log((1 + n_docs) / (1 + self._df[buckets])).astype(np.float32) + 1.0
+            text = (np.log1p(tf) * idf) @ self._projection[buckets]
+            norm = np.linalg.norm(text)
+            if norm > 0: vector[:TEXT_DIM] = text / norm
+        if category_id is not None:
+            vector[TEXT_DIM + category_id % CATEGORY_DIM] = CATEGORY_WEIGHT
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def reweight(self):
+        """Recomputes every vector with the current IDF (upserts use the IDF of their moment)."""
+        with self._lock:
+            for resource_id, (buckets, tf, category_id) in self._terms.items():
+                self._vectors[self._rows[resource_id]] = self._vectorize(buckets, tf, category_id)
+            self._weighted_at = len(self._terms)
+
+    def refresh(self, conn, version=None):
+        """
+        Applies Resource rows changed since the last refresh (all rows on the first call).
+        With the current catalog version, skips the query when nothing changed since the last refresh.
+        """
+        with self._lock:
+            if version is not None and version == self.synced_version: return
+            self.synced_version = version
+            cursor = conn.cursor(dictionary=True)
+            columns = "ResourceID, Title, Description, CategoryID, OwnerID, Status, UpdatedAt"
+            if self.synced_until is None:
+                cursor.execute(f"SELECT {columns} FROM Resource")
+            else:
+                # >= so rows written later within the same second are not missed; re-applying is harmless
+                cursor.execute(f"SELECT {columns} FROM Resource WHERE UpdatedAt >= %s", (self.synced_until,))
+            for row in cursor.fetchall():
+                self.upsert(row['ResourceID'], row['Title'], row['Description'], row['CategoryID'],
+                            row['OwnerID'], available=row['Status'] == 'Available')
+                if self.synced_until is None or row['UpdatedAt'] > self.synced_until:
+                    self.synced_until = row['UpdatedAt']
+            cursor.close()
+            for resource_id in deleted_ids(conn, list(self._rows)): self.remove(resource_id)
+            if abs(len(self._terms) - self._weighted_at) > REWEIGHT_GROWTH * max(self._weighted_at, 1):
+                self.reweight()
+
+    # --- Querying ---
+
+    def _top_k(self, scores, k):
+        """(ResourceID, score) of the k best columns of a score vector, best first; -inf marks excluded rows."""
+        k = min(k, int(np.isfinite(scores).sum()))
+        if k <= 0: return []
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [(int(self._ids[row]), float(scores[row])) for row in best]
+
+    def similar(self, resource_ids, k=5):
+        """
+        {ResourceID: [(ResourceID, score), ...]} with the k most similar Available listings for each
+        given listing, from one batched matrix product. Listings by the same owner are left out.
+        """
+        with self._lock:
+            known = [resource_id for resource_id in resource_ids if resource_id in self._rows]
+            if not known: return {}
+            rows = np.array([self._rows[resource_id] for resource_id in known])
+            n = len(self._ids)
+            scores = self._vectors[rows] @ self._vectors[:n].T
+            scores[:, ~self._active[:n]] = -np.inf
+            results = {}
+            for i, resource_id in enumerate(known):
+                row_scores = scores[i]
+                row_scores[self._owners[:n] == self._owners[rows[i]]] = -np.inf
+                results[resource_id] = self._top_k(row_scores, k)
+            return results
+
+    def recommend_for(self, history_ids, student_id, k=8):
+        """
+        Available listings closest to the centroid of what a student bought or borrowed before,
+        excluding their own listings and the history itself. [] when there is no usable history.
+        """
+        with self._lock:
+            rows = [self._rows[resource_id] for resource_id in history_ids if resource_id in self._rows]
+            if not rows: return []
+            profile = self._vectors[rows].mean(axis=0)
+            n = len(self._ids)
+            scores = self._vectors[:n] @ profile
+            scores[~self._active[:n]] = -np.inf
+            if student_id in self._owner_codes: scores[self._owners[:n] == self._owner_codes[student_id]] = -np.inf
+            scores[rows] = -np.inf
+            return self._top_k(scores, k)
+
+
+def student_history(conn, student_id, limit=50):
+    """ResourceIDs a student bought or borrowed, most recent first."""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT ItemID FROM (
+            SELECT ItemID, TransactionDate AS At FROM BuySell
+            WHERE BuyerID = %s AND Status IN ('Completed', 'PendingPayment', 'PendingConfirmation')
+            UNION ALL
+            SELECT itemID, StartDate FROM LendBorrow WHERE BorrowerID = %s
+        ) h
+        ORDER BY At DESC
+        LIMIT %s
+    """, (student_id, student_id, limit))
+    history = list(dict.fromkeys(row[0] for row in cursor.fetchall()))
+    cursor.close()
+    return history
@@ -0,0 +1,209 @@
+# search.py - In-process full-text index over Resource titles and descriptions
+
+import bisect
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset("a an and are as at be by for from in is it of on or the to with".split())
+
+TITLE_WEIGHT = 3      # a title word counts as this many description words
+PREFIX_MIN_LEN = 2    # shortest query token that is also matched as a prefix
+PREFIX_EXPANSIONS = 50
+TYPO_MIN_LEN = 4      # shorter words are too ambiguous to correct
+PREFIX_FACTOR = 0.8   # score multipliers for inexact matches
+TYPO_FACTOR = 0.6
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def tokenize(text):
+    """Lower-cased alphanumeric words, without stopwords."""
+    if not text: return []
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+def _deletions(term):
+    """The term with each single character removed."""
+    return {term[:i] + term[i + 1:] for i in range(len(term))}
+
+
+def _within_one_edit(a, b):
+    """True if a and b differ by at most one insert, delete, substitute or adjacent swap."""
+    if a == b: return True
+    la, lb = len(a), len(b)
+    if abs(la - lb) > 1: return False
+    if la == lb:
+        diff = [i for i in range(la) if a[i] != b[i]]
+        if len(diff) == 1: return True
+        return len(diff) == 2 and diff[1] == diff[0] + 1 and a[diff[0]] == b[diff[1]] and a[diff[1]] == b[diff[0]]
+    if la > lb: a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]: i += 1
+    return a[i:] == b[i + 1:]
+
+
+def deleted_ids(conn, known_ids):
+    """
+    Those of `known_ids` no longer in Resource. Deletes leave no UpdatedAt behind, and cascaded ones
+    (a removed owner, datagen.py --remove) fire no triggers either. Once the changed rows are applied an
+    index holds every live listing, so it only compares IDs when COUNT(*) shows it holds more than that.
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM Resource")
+    gone = []
+    if cursor.fetchone()[0] < len(known_ids):
+        cursor.execute("SELECT ResourceID FROM Resource")
+        live = {row[0] for row in cursor.fetchall()}
+        gone = [resource_id for resource_id in known_ids if resource_id not in live]
+    cursor.close()
+    return gone
+
+
+class SearchIndex:
+    """
+    Inverted index of Resource.Title/Description with BM25 ranking.
+    Each query word matches exact terms, terms it is a prefix of, and terms one typo away.
+    Status, ListingType, CategoryID and RatingAvg are kept per listing, so the browse filters
+    apply to every hit before ranking instead of to a truncated top-N.
+    Kept in sync with the Resource table through refresh(), which only reads rows whose
+    UpdatedAt moved since the previous call, and drops rows deleted since (see deleted_ids()).
+    """
+
+    def __init__(self):
+        self._postings = defaultdict(dict)      # term -> {ResourceID: weighted term frequency}
+        self._doc_terms = {}                    # ResourceID -> Counter of its terms
+        self._doc_len = {}
+        self._attrs = {}                        # ResourceID -> (Status, ListingType, CategoryID, RatingAvg)
+        self._total_len = 0
+        self._vocab = []                        # sorted terms, for prefix lookups
+        self._deletes = defaultdict(set)        # one-char deletion -> terms, for typo lookups
+        self._lock = threading.RLock()
+        self.synced_until = None                # newest Resource.UpdatedAt applied so far
+
+    def __len__(self):
+        return len(self._doc_terms)
+
+    # --- Maintenance ---
+
+    def upsert(self, resource_id, title, description, status=None, listing_type=None, category_id=None, rating=0.0):
+        terms = Counter()
+        for t in tokenize(title): terms[t] += TITLE_WEIGHT
+        for t in tokenize(description): terms[t] += 1
+        with self._lock:
+            self._drop(resource_id)
+            for term, tf in terms.items():
+                if term not in self._postings: self._add_term(term)
+                self._postings[term][resource_id] = tf
+            self._doc_terms[resource_id] = terms
+            self._attrs[resource_id] = (status, listing_type, category_id, float(rating or 0))
+            self._doc_len[resource_id] = sum(terms.values())
+            self._total_len += self._doc_len[resource_id]
+
+    def remove(self, resource_id):
+        with self._lock:
+            self._drop(resource_id)
+
+    def _drop(self, resource_id):
+        terms = self._doc_terms.pop(resource_id, None)
+        if terms is None: return
+        self._attrs.pop(resource_id, None)
+        self._total_len -= self._doc_len.pop(resource_id)
+        for term in terms:
+            postings = self._postings[term]
+            postings.pop(resource_id, None)
+            if not postings: self._remove_term(term)
+
+    def _add_term(self, term):
+        bisect.insort(self._vocab, term)
+        if len(term) >= TYPO_MIN_LEN:
+            for variant in _deletions(term): self._deletes[variant].add(term)
+
+    def _remove_term(self, term):
+        del self._postings[term]
+        i = bisect.bisect_left(self._vocab, term)
+        if i < len(self._vocab) and self._vocab[i] == term: del self._vocab[i]
+        if len(term) >= TYPO_MIN_LEN:
+            for variant in _deletions(term):
+                self._deletes[variant].discard(term)
+                if not self._deletes[variant]: del self._deletes[variant]
+
+    def refresh(self, conn):
+        """Applies Resource rows changed since the last refresh (all rows on the first call)."""
+        with self._lock:
+            cursor = conn.cursor(dictionary=True)
+            columns = "ResourceID, Title, Description, Status, ListingType, CategoryID, RatingAvg, UpdatedAt"
+            if self.synced_until is None:
+                cursor.execute(f"SELECT {columns} FROM Resource")
+            else:
+                # >= so rows written later within the same second are not missed; re-applying is harmless
+                cursor.execute(f"SELECT {columns} FROM Resource WHERE UpdatedAt >= %s", (self.synced_until,))
+            for row in cursor.fetchall():
+                self.upsert(row['ResourceID'], row['Title'], row['Description'],
+                            row['Status'], row['ListingType'], row['CategoryID'], row['RatingAvg'])
+                if self.synced_until is None or row['UpdatedAt'] > self.synced_until:
+                    self.synced_until = row['UpdatedAt']
+            cursor.close()
+            for resource_id in deleted_ids(conn, list(self._doc_terms)): self._drop(resource_id)
+
+    # --- Querying ---
+
+    def _expand(self, token):
+        """Index terms a query token matches, with a score factor for each."""
+        matches = {}
+        if token in self._postings: matches[token] = 1.0
+        if len(token) >= PREFIX_MIN_LEN:
+            i = bisect.bisect_left(self._vocab, token)
+            for term in self._vocab[i:i + PREFIX_EXPANSIONS]:
+                if not term.startswith(token): break
+                matches.setdefault(term, PREFIX_FACTOR)
+        if len(token) >= TYPO_MIN_LEN:
+            candidates = set(self._deletes.get(token, ()))
+            for variant in _deletions(token):
+                candidates |= self._deletes.get(variant, set())
+                if variant in self._postings: candidates.add(variant)
+            for term in candidates:
+                if _within_one_edit(token, term): matches.setdefault(term, TYPO_FACTOR)
+        return matches
+
+    def rating(self, resource_id):
+        """RatingAvg as of the last refresh (0.0 for unknown listings)."""
+        attrs = self._attrs.get(resource_id)
+        return attrs[3] if attrs else 0.0
+
+    def search(self, query, limit=500, status=None, listing_type=None, category_ids=None):
+        """
+        Returns up to `limit` (None: all) (ResourceID, score) pairs, best first, among listings with
+        this status/listing type/category (None: any). Documents matching every query word are
+        preferred; if none do, any match counts.
+        """
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens: return []
+        category_ids = set(category_ids) if category_ids is not None else None
+        def wanted(doc_id):
+            doc_status, doc_type, doc_category, _ = self._attrs[doc_id]
+            return ((status is None or doc_status == status) and (listing_type is None or doc_type == listing_type)
+                    and (category_ids is None or doc_category in category_ids))
+        with self._lock:
+            n_docs = len(self._doc_terms)
+            if n_docs == 0: return []
+            avg_len = self._total_len / n_docs
+            per_token = []
+            for token in tokens:
+                scores = {}
+                for term, factor in self._expand(token).items():
+                    postings = self._postings[term]
+                    idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                    for doc_id, tf in postings.items():
+                        if not wanted(doc_id): continue
+                        norm = tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * self._doc_len[doc_id] / avg_len))
+                        score = factor * idf * norm
+                        if score > scores.get(doc_id, 0.0): scores[doc_id] = score
+                per_token.append(scores)
+
+        matched = set.intersection(*(set(s) for s in per_token)) or set().union(*per_token)
+        ranked = [(doc_id, sum(s.get(doc_id, 0.0) for s in per_token)) for doc_id in matched]
+        ranked.sort(key=lambda item: (-item[1], -item[0]))
+        return ranked if limit is None else ranked[:limit]
@@ -11,7 +11,7 @@ CREATE TABLE Student (
   FirstName VARCHAR(30),
   MiddleName VARCHAR(30),
   LastName VARCHAR(30),
-  Email VARCHAR(50) UNIQUE,
+  Email VARCHAR(50),
   Phone VARCHAR(15),
   Department VARCHAR(30),
   JoinDate DATE,
@@ -34,6 +34,12 @@ CREATE TABLE Resource (
   OwnerID VARCHAR(13),
   CategoryID INT,
   ImagePath VARCHAR(255),
+  BarterPreference VARCHAR(255),
+  UpdatedAt TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  -- Review statistics, maintained by the tg_review_* triggers so no query has to aggregate Review
+  RatingSum INT NOT NULL DEFAULT 0,
+  RatingCount INT NOT NULL DEFAULT 0,
+  RatingAvg DECIMAL(3,2) AS (IF(RatingCount = 0, 0, ROUND(RatingSum / RatingCount, 2))) STORED,
   CONSTRAINT fk_res_owner FOREIGN KEY (OwnerID) REFERENCES Student(SRN) ON DELETE CASCADE,
   CONSTRAINT fk_res_cat FOREIGN KEY (CategoryID) REFERENCES Category(Cat_ID)
 ) ENGINE=InnoDB;
@@ -79,6 +85,9 @@ CREATE TABLE Barter (
   Status VARCHAR(20) NOT NULL,
   BarterDate DATE NOT NULL,
   TransactionID INT NULL,
+  -- Set only while Pending, so the unique key allows one open proposal per item pair (either direction)
+  PendingPair VARCHAR(23) AS (IF(Status = 'Pending', CONCAT(LEAST(Item1ID, Item2ID), ':', GREATEST(Item1ID, Item2ID)), NULL)) STORED,
+  CONSTRAINT uq_barter_pending_pair UNIQUE (PendingPair),
   CONSTRAINT fk_barter_res1 FOREIGN KEY (Item1ID) REFERENCES Resource(ResourceID) ON DELETE CASCADE,
   CONSTRAINT fk_barter_res2 FOREIGN KEY (Item2ID) REFERENCES Resource(ResourceID) ON DELETE CASCADE,
   CONSTRAINT fk_barter_prop FOREIGN KEY (ProposerID) REFERENCES Student(SRN) ON DELETE CASCADE,
@@ -97,6 +106,70 @@ ALTER TABLE BuySell
 ALTER TABLE Barter
   ADD CONSTRAINT fk_bt_trans FOREIGN KEY (TransactionID) REFERENCES Transactions(TransactionID) ON DELETE SET NULL;
 
+-- What a barter listing's owner would take in exchange: a whole category or one specific listing
+CREATE TABLE BarterWant (
+  WantID INT AUTO_INCREMENT PRIMARY KEY,
+  ResourceID INT NOT NULL,
+  CategoryID INT NULL,
+  WantedItemID INT NULL,
+  CreatedAt TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  CONSTRAINT fk_want_resource FOREIGN KEY (ResourceID) REFERENCES Resource(ResourceID) ON DELETE CASCADE,
+  CONSTRAINT fk_want_category FOREIGN KEY (CategoryID) REFERENCES Category(Cat_ID) ON DELETE CASCADE,
+  CONSTRAINT fk_want_item FOREIGN KEY (WantedItemID) REFERENCES Resource(ResourceID) ON DELETE CASCADE,
+  CONSTRAINT chk_want_target CHECK ((CategoryID IS NULL) <> (WantedItemID IS NULL))
+) ENGINE=InnoDB;
+
+-- Multi-party exchanges found by barter_match.py. Leg p: ItemID goes from GiverID to ReceiverID
+-- (the owner of the previous leg's item); the cycle completes once every giver has accepted.
+CREATE TABLE BarterCycle (
+  CycleID INT AUTO_INCREMENT PRIMARY KEY,
+  Status VARCHAR(20) NOT NULL DEFAULT 'Proposed',
+  CreatedAt TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  UpdatedAt TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  TransactionID INT NULL,
+  CONSTRAINT fk_cycle_trans FOREIGN KEY (TransactionID) REFERENCES Transactions(TransactionID) ON DELETE SET NULL
+) ENGINE=InnoDB;
+
+CREATE TABLE BarterCycleLeg (
+  CycleID INT NOT NULL,
+  Position TINYINT NOT NULL,
+  ItemID INT NOT NULL,
+  GiverID VARCHAR(13) NOT NULL,
+  ReceiverID VARCHAR(13) NOT NULL,
+  Response VARCHAR(10) NOT NULL DEFAULT 'Pending',
+  PRIMARY KEY (CycleID, Position),
+  CONSTRAINT fk_leg_cycle FOREIGN KEY (CycleID) REFERENCES BarterCycle(CycleID) ON DELETE CASCADE,
+  CONSTRAINT fk_leg_item FOREIGN KEY (ItemID) REFERENCES Resource(ResourceID) ON DELETE CASCADE,
+  CONSTRAINT fk_leg_giver FOREIGN KEY (GiverID) REFERENCES Student(SRN) ON DELETE CASCADE,
+  CONSTRAINT fk_leg_receiver FOREIGN KEY (ReceiverID) REFERENCES Student(SRN) ON DELETE CASCADE
+) ENGINE=InnoDB;
+
+-- One row per matcher pass; the next incremental pass only searches from what changed after StartedAt
+CREATE TABLE BarterMatchRun (
+  RunID INT AUTO_INCREMENT PRIMARY KEY,
+  StartedAt TIMESTAMP NOT NULL,
+  Seeds INT NOT NULL,
+  CyclesFound INT NOT NULL
+) ENGINE=InnoDB;
+
+-- Lending calendar. Every loan and every future booking of a Lend item is a half-open [StartDate, EndDate)
+-- window, EndDate being the day after the return date; 'Reserved' and 'Active' windows of one item never overlap. A request that does overlap is kept
+-- as 'Waitlisted' and promoted once the window frees up. Other statuses: Fulfilled, Cancelled, Lapsed.
+CREATE TABLE LendReservation (
+  ReservationID INT AUTO_INCREMENT PRIMARY KEY,
+  ItemID INT NOT NULL,
+  BorrowerID VARCHAR(13) NOT NULL,
+  StartDate DATE NOT NULL,
+  EndDate DATE NOT NULL,
+  Status VARCHAR(20) NOT NULL,
+  LendBorrowID INT NULL,
+  CreatedAt TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  CONSTRAINT fk_lres_resource FOREIGN KEY (ItemID) REFERENCES Resource(ResourceID) ON DELETE CASCADE,
+  CONSTRAINT fk_lres_borrower FOREIGN KEY (BorrowerID) REFERENCES Student(SRN) ON DELETE CASCADE,
+  CONSTRAINT fk_lres_loan FOREIGN KEY (LendBorrowID) REFERENCES LendBorrow(LendBorrowID) ON DELETE SET NULL,
+  CONSTRAINT chk_lres_window CHECK (EndDate > StartDate)
+) ENGINE=InnoDB;
+
 CREATE TABLE Reminder (
   ReminderID INT AUTO_INCREMENT PRIMARY KEY,
   STD_ID VARCHAR(13) NOT NULL,
@@ -104,10 +177,25 @@ CREATE TABLE Reminder (
   Msg VARCHAR(100) NOT NULL,
   Status VARCHAR(20) NOT NULL,
   RDate DATE NOT NULL,
+  -- 0: the return reminder of a loan; n > 0: the n-th overdue notice, written by run_overdue_pass
+  Level TINYINT NOT NULL DEFAULT 0,
+  CONSTRAINT uq_reminder_level UNIQUE (TransID, STD_ID, Level),
   CONSTRAINT fk_rem_stud FOREIGN KEY (STD_ID) REFERENCES Student(SRN) ON DELETE CASCADE,
   CONSTRAINT fk_rem_trans FOREIGN KEY (TransID) REFERENCES Transactions(TransactionID) ON DELETE CASCADE
 ) ENGINE=InnoDB;
 
+-- One row per run_overdue_pass; AsOf is the day penalties and reminders were brought up to
+CREATE TABLE OverdueRun (
+  RunID INT AUTO_INCREMENT PRIMARY KEY,
+  AsOf DATE NOT NULL,
+  StartedAt TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  FinishedAt TIMESTAMP NULL,
+  PenaltiesUpdated INT NOT NULL DEFAULT 0,
+  RemindersDue INT NOT NULL DEFAULT 0,
+  RemindersOverdue INT NOT NULL DEFAULT 0,
+  NoticesSent INT NOT NULL DEFAULT 0
+) ENGINE=InnoDB;
+
 CREATE TABLE Review (
   ReviewID INT AUTO_INCREMENT PRIMARY KEY,
   Rating INT CHECK (Rating BETWEEN 1 AND 5),
@@ -118,24 +206,112 @@ CREATE TABLE Review (
   CONSTRAINT fk_review_resource FOREIGN KEY (ItemID) REFERENCES Resource(ResourceID) ON DELETE CASCADE
 ) ENGINE=InnoDB;
 
+-- Content-addressed listing photos (see images.py); RefCount = Resource rows whose ImagePath points here
+CREATE TABLE ImageBlob (
+  Digest CHAR(64) PRIMARY KEY,
+  ImagePath VARCHAR(255) NOT NULL UNIQUE,
+  Bytes BIGINT NOT NULL,
+  RefCount INT NOT NULL DEFAULT 0,
+  CreatedAt TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+) ENGINE=InnoDB;
+
+-- (student, item) pairs the student may still review: a completed loan or purchase of the item and no
+-- Review yet. Maintained by the completion and Review triggers, so "what can I review" is one PK range read.
+CREATE TABLE ReviewEligibility (
+  STD_ID VARCHAR(13) NOT NULL,
+  ItemID INT NOT NULL,
+  EligibleSince TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (STD_ID, ItemID),
+  CONSTRAINT fk_elig_student FOREIGN KEY (STD_ID) REFERENCES Student(SRN) ON DELETE CASCADE,
+  CONSTRAINT fk_elig_resource FOREIGN KEY (ItemID) REFERENCES Resource(ResourceID) ON DELETE CASCADE
+) ENGINE=InnoDB;
+
+-- Near-duplicate detection (see dedupe.py): a MinHash signature and photo dHash per listing, plus
+-- LSH band keys and dHash blocks as indexed lookup tables, so finding candidates never scans Resource.
+-- DuplicateOf flags a listing that was posted although it matched another one.
+CREATE TABLE ListingSignature (
+  ResourceID INT PRIMARY KEY,
+  MinHash VARBINARY(256),
+  ImageHash BIGINT UNSIGNED,
+  DuplicateOf INT NULL,
+  CONSTRAINT fk_sig_resource FOREIGN KEY (ResourceID) REFERENCES Resource(ResourceID) ON DELETE CASCADE,
+  CONSTRAINT fk_sig_duplicate FOREIGN KEY (DuplicateOf) REFERENCES Resource(ResourceID) ON DELETE SET NULL
+) ENGINE=InnoDB;
+
+CREATE TABLE ListingBand (
+  Band TINYINT NOT NULL,
+  BandHash BIGINT NOT NULL,
+  ResourceID INT NOT NULL,
+  PRIMARY KEY (Band, BandHash, ResourceID),
+  CONSTRAINT fk_band_resource FOREIGN KEY (ResourceID) REFERENCES Resource(ResourceID) ON DELETE CASCADE
+) ENGINE=InnoDB;
+
+CREATE TABLE ListingImageBlock (
+  Block TINYINT NOT NULL,
+  Value SMALLINT UNSIGNED NOT NULL,
+  ResourceID INT NOT NULL,
+  PRIMARY KEY (Block, Value, ResourceID),
+  CONSTRAINT fk_block_resource FOREIGN KEY (ResourceID) REFERENCES Resource(ResourceID) ON DELETE CASCADE
+) ENGINE=InnoDB;
+
+-- Counter bumped by triggers on every Resource/BuySell write; the app keys its shared browse-result
+-- cache on SUM(Version), so cached pages never outlive a change to the catalog. Sharded by item
+-- (ResourceID % 64): writers of different items lock different rows, so the counter adds no lock waits
+-- between them, and a transaction only locks the shards of rows it already holds locks on.
+CREATE TABLE CatalogVersion (
+  ID TINYINT PRIMARY KEY,
+  Version BIGINT UNSIGNED NOT NULL
+) ENGINE=InnoDB;
+
+INSERT INTO CatalogVersion (ID, Version)
+WITH RECURSIVE shard (n) AS (SELECT 0 UNION ALL SELECT n + 1 FROM shard WHERE n < 63)
+SELECT n, 0 FROM shard;
+
 -- =========================================================
 -- INDEXES
 -- =========================================================
 
-CREATE INDEX idx_student_email ON Student(Email);
-CREATE INDEX idx_student_phone ON Student(Phone);
+-- Composite indexes follow the equality filters of the page queries (queries.py, catalog.py, dashboard.py),
+-- most selective first where the app always supplies the column. `python bench.py --check-scans` EXPLAINs
+-- every hot-path query on datagen.py data and fails if one falls back to a full scan.
+-- Login: SRN = %s OR Email = %s is an index merge of PRIMARY and uq_student_email
+CREATE UNIQUE INDEX uq_student_email ON Student(Email);
+-- Browse newest-first: Status equality, then the implicit ResourceID suffix gives the order
 CREATE INDEX idx_resource_status ON Resource(Status);
-CREATE INDEX idx_resource_owner ON Resource(OwnerID);
+-- Browse by transaction type/category and the Buy/Lend/Barter tab listings
+CREATE INDEX idx_resource_browse ON Resource(Status, ListingType, CategoryID);
+-- My Activity resources (OwnerID prefix) and a student's own barter listings
+CREATE INDEX idx_resource_owner ON Resource(OwnerID, Status, ListingType);
 CREATE INDEX idx_resource_category ON Resource(CategoryID);
-CREATE INDEX idx_lb_status ON LendBorrow(Status);
-CREATE INDEX idx_lb_borrower ON LendBorrow(BorrowerID);
+-- Lets the app's in-process search index pull only rows changed since its last refresh
+CREATE INDEX idx_resource_updated ON Resource(UpdatedAt);
+CREATE INDEX idx_resource_image ON Resource(ImagePath);
+-- "Top Rated" browse order: keyset range scan over (RatingAvg, ResourceID)
+CREATE INDEX idx_resource_rating ON Resource(Status, RatingAvg, ResourceID);
+CREATE INDEX idx_want_created ON BarterWant(CreatedAt);
+CREATE INDEX idx_cycle_status ON BarterCycle(Status, UpdatedAt);
+CREATE INDEX idx_leg_giver ON BarterCycleLeg(GiverID);
+-- Interval lookups: "does [s, e) overlap a booking of item i" is a range scan over one item's
+-- bookings that start before e; covering, so availability over thousands of items never reads rows
+CREATE INDEX idx_lres_calendar ON LendReservation(ItemID, Status, StartDate, EndDate);
+CREATE INDEX idx_lres_borrower ON LendReservation(BorrowerID, Status);
+-- Overdue pass: ongoing loans past their return date
+CREATE INDEX idx_lb_due ON LendBorrow(Status, EndDate);
+CREATE INDEX idx_lb_borrower ON LendBorrow(BorrowerID, Status);
 CREATE INDEX idx_lb_lender ON LendBorrow(LenderID);
 CREATE INDEX idx_barter_status ON Barter(Status);
-CREATE INDEX idx_barter_proposer ON Barter(ProposerID);
-CREATE INDEX idx_barter_accepter ON Barter(AccepterID);
-CREATE INDEX idx_reminder_student ON Reminder(STD_ID);
-CREATE INDEX idx_reminder_status ON Reminder(Status);
-CREATE INDEX idx_review_student ON Review(STD_ID);
+CREATE INDEX idx_barter_proposer ON Barter(ProposerID, Status);
+CREATE INDEX idx_barter_accepter ON Barter(AccepterID, Status);
+-- Purchase (purchase_item) and the Buy/Sell listings join: one item's 'Listed' row
+CREATE INDEX idx_bs_item ON BuySell(ItemID, Status);
+CREATE INDEX idx_bs_buyer ON BuySell(BuyerID, Status);
+CREATE INDEX idx_bs_seller ON BuySell(SellerID, Status);
+-- My Activity reminders, newest first
+CREATE INDEX idx_reminder_student ON Reminder(STD_ID, RDate);
+-- Overdue pass: scheduled reminders whose date has come
+CREATE INDEX idx_reminder_status ON Reminder(Status, RDate);
+-- Also the "already reviewed?" NOT EXISTS probes of the eligibility triggers
+CREATE INDEX idx_review_student ON Review(STD_ID, ItemID);
 CREATE INDEX idx_review_item ON Review(ItemID);
 
 ALTER TABLE Student ADD CONSTRAINT uq_phone UNIQUE (Phone);
@@ -173,12 +349,33 @@ INSERT INTO Barter (Item1ID, Item2ID, ProposerID, AccepterID, Status, BarterDate
 VALUES (3,1,'PES2UG23CS003','PES2UG23CS001','Pending','2025-09-07',3);
 
 INSERT INTO Reminder (STD_ID, TransID, Msg, Status, RDate)
-VALUES ('PES2UG23CS002',1,'Return DBMS Book by 10th Sept','Unread','2025-09-08');
+VALUES ('PES2UG23CS002',1,'Return DBMS Book by 10th Sept','Scheduled','2025-09-08');
 
 INSERT INTO Review (Rating, Comments, STD_ID, ItemID)
 VALUES (5,'Great quality book, very helpful!','PES2UG23CS002',1),
        (4,'Laptop is in excellent condition','PES2UG23CS003',2);
 
+-- The seed reviews are inserted before the rating triggers exist
+UPDATE Resource r
+JOIN (SELECT ItemID, SUM(Rating) AS RatingSum, COUNT(Rating) AS RatingCount FROM Review GROUP BY ItemID) rv
+  ON rv.ItemID = r.ResourceID
+SET r.RatingSum = rv.RatingSum, r.RatingCount = rv.RatingCount;
+
+-- Likewise for review eligibility of the seeded completed transactions
+INSERT IGNORE INTO ReviewEligibility (STD_ID, ItemID)
+SELECT t.StudentID, t.ItemID
+FROM (
+  SELECT BorrowerID AS StudentID, itemID AS ItemID FROM LendBorrow WHERE Status = 'Completed'
+  UNION
+  SELECT BuyerID, ItemID FROM BuySell WHERE Status = 'Completed' AND BuyerID IS NOT NULL
+) t
+WHERE NOT EXISTS (SELECT 1 FROM Review rv WHERE rv.STD_ID = t.StudentID AND rv.ItemID = t.ItemID);
+
+-- Seeded loans still out occupy their window on the lending calendar
+INSERT INTO LendReservation (ItemID, BorrowerID, StartDate, EndDate, Status, LendBorrowID)
+SELECT itemID, BorrowerID, StartDate, GREATEST(COALESCE(EndDate, StartDate), StartDate) + INTERVAL 1 DAY, 'Active', LendBorrowID
+FROM LendBorrow WHERE Status IN ('Ongoing', 'Active');
+
 -- =========================================================
 -- TRIGGERS
 -- =========================================================
@@ -195,7 +392,7 @@ BEGIN
       INSERT INTO Reminder (STD_ID, TransID, Msg, Status, RDate)
       VALUES (NEW.BorrowerID, NEW.TransactionID,
               CONCAT('Reminder: return item ', NEW.itemID, ' by ', DATE_FORMAT(NEW.EndDate,'%Y-%m-%d')),
-              'Unread', DATE_SUB(NEW.EndDate, INTERVAL 2 DAY));
+              'Scheduled', DATE_SUB(NEW.EndDate, INTERVAL 2 DAY));
     END IF;
   END IF;
 END$$
@@ -207,6 +404,9 @@ BEGIN
   IF (OLD.Status <> NEW.Status) AND (NEW.Status = 'Completed') THEN
     UPDATE Resource SET Status = 'Available' WHERE ResourceID = NEW.itemID;
     UPDATE Reminder SET Status = 'Expired' WHERE TransID = NEW.TransactionID;
+    INSERT IGNORE INTO ReviewEligibility (STD_ID, ItemID)
+    SELECT NEW.BorrowerID, NEW.itemID FROM DUAL
+    WHERE NOT EXISTS (SELECT 1 FROM Review WHERE STD_ID = NEW.BorrowerID AND ItemID = NEW.itemID);
   END IF;
 END$$
 
@@ -216,6 +416,109 @@ FOR EACH ROW
 BEGIN
   IF (OLD.Status <> NEW.Status) AND (NEW.Status = 'Completed') THEN
     UPDATE Resource SET Status = 'Sold' WHERE ResourceID = NEW.ItemID;
+    IF NEW.BuyerID IS NOT NULL THEN
+      INSERT IGNORE INTO ReviewEligibility (STD_ID, ItemID)
+      SELECT NEW.BuyerID, NEW.ItemID FROM DUAL
+      WHERE NOT EXISTS (SELECT 1 FROM Review WHERE STD_ID = NEW.BuyerID AND ItemID = NEW.ItemID);
+    END IF;
+  END IF;
+END$$
+
+-- ImageBlob reference counts follow Resource.ImagePath.
+-- Note: rows removed by ON DELETE CASCADE (e.g. a deleted Student) do not fire these;
+-- the image sweeper recomputes RefCount from Resource to correct that drift.
+CREATE TRIGGER tg_resource_image_insert
+AFTER INSERT ON Resource
+FOR EACH ROW
+BEGIN
+  IF NEW.ImagePath IS NOT NULL THEN
+    UPDATE ImageBlob SET RefCount = RefCount + 1 WHERE ImagePath = NEW.ImagePath;
+  END IF;
+END$$
+
+CREATE TRIGGER tg_resource_image_update
+AFTER UPDATE ON Resource
+FOR EACH ROW
+BEGIN
+  IF NOT (OLD.ImagePath <=> NEW.ImagePath) THEN
+    IF OLD.ImagePath IS NOT NULL THEN
+      UPDATE ImageBlob SET RefCount = RefCount - 1 WHERE ImagePath = OLD.ImagePath;
+    END IF;
+    IF NEW.ImagePath IS NOT NULL THEN
+      UPDATE ImageBlob SET RefCount = RefCount + 1 WHERE ImagePath = NEW.ImagePath;
+    END IF;
+  END IF;
+END$$
+
+CREATE TRIGGER tg_resource_image_delete
+AFTER DELETE ON Resource
+FOR EACH ROW
+BEGIN
+  IF OLD.ImagePath IS NOT NULL THEN
+    UPDATE ImageBlob SET RefCount = RefCount - 1 WHERE ImagePath = OLD.ImagePath;
+  END IF;
+END$$
+
+-- Catalog version: any change to what the browse page can show
+CREATE TRIGGER tg_resource_version_insert AFTER INSERT ON Resource
+FOR EACH ROW UPDATE CatalogVersion SET Version = Version + 1 WHERE ID = NEW.ResourceID % 64$$
+
+CREATE TRIGGER tg_resource_version_update AFTER UPDATE ON Resource
+FOR EACH ROW UPDATE CatalogVersion SET Version = Version + 1 WHERE ID = NEW.ResourceID % 64$$
+
+CREATE TRIGGER tg_resource_version_delete AFTER DELETE ON Resource
+FOR EACH ROW UPDATE CatalogVersion SET Version = Version + 1 WHERE ID = OLD.ResourceID % 64$$
+
+CREATE TRIGGER tg_buysell_version_insert AFTER INSERT ON BuySell
+FOR EACH ROW UPDATE CatalogVersion SET Version = Version + 1 WHERE ID = NEW.ItemID % 64$$
+
+CREATE TRIGGER tg_buysell_version_update AFTER UPDATE ON BuySell
+FOR EACH ROW UPDATE CatalogVersion SET Version = Version + 1 WHERE ID = NEW.ItemID % 64$$
+
+CREATE TRIGGER tg_buysell_version_delete AFTER DELETE ON BuySell
+FOR EACH ROW UPDATE CatalogVersion SET Version = Version + 1 WHERE ID = OLD.ItemID % 64$$
+
+-- Rating statistics on Resource follow Review (a NULL Rating counts for neither sum nor count).
+-- Writing a review also uses up the student's ReviewEligibility row for that item.
+CREATE TRIGGER tg_review_insert
+AFTER INSERT ON Review
+FOR EACH ROW
+BEGIN
+  IF NEW.Rating IS NOT NULL THEN
+    UPDATE Resource SET RatingSum = RatingSum + NEW.Rating, RatingCount = RatingCount + 1
+    WHERE ResourceID = NEW.ItemID;
+  END IF;
+  DELETE FROM ReviewEligibility WHERE STD_ID = NEW.STD_ID AND ItemID = NEW.ItemID;
+END$$
+
+CREATE TRIGGER tg_review_update
+AFTER UPDATE ON Review
+FOR EACH ROW
+BEGIN
+  IF NOT (OLD.Rating <=> NEW.Rating) OR OLD.ItemID <> NEW.ItemID THEN
+    IF OLD.Rating IS NOT NULL THEN
+      UPDATE Resource SET RatingSum = RatingSum - OLD.Rating, RatingCount = RatingCount - 1
+      WHERE ResourceID = OLD.ItemID;
+    END IF;
+    IF NEW.Rating IS NOT NULL THEN
+      UPDATE Resource SET RatingSum = RatingSum + NEW.Rating, RatingCount = RatingCount + 1
+      WHERE ResourceID = NEW.ItemID;
+    END IF;
+  END IF;
+END$$
+
+CREATE TRIGGER tg_review_delete
+AFTER DELETE ON Review
+FOR EACH ROW
+BEGIN
+  IF OLD.Rating IS NOT NULL THEN
+    UPDATE Resource SET RatingSum = RatingSum - OLD.Rating, RatingCount = RatingCount - 1
+    WHERE ResourceID = OLD.ItemID;
+  END IF;
+  -- A withdrawn review can be written again if the completed transaction is still there
+  IF EXISTS (SELECT 1 FROM LendBorrow WHERE BorrowerID = OLD.STD_ID AND itemID = OLD.ItemID AND Status = 'Completed')
+     OR EXISTS (SELECT 1 FROM BuySell WHERE BuyerID = OLD.STD_ID AND ItemID = OLD.ItemID AND Status = 'Completed') THEN
+    INSERT IGNORE INTO ReviewEligibility (STD_ID, ItemID) VALUES (OLD.STD_ID, OLD.ItemID);
   END IF;
 END$$
 
@@ -236,29 +539,115 @@ DELIMITER ;
 
 DELIMITER $$
 
+-- Late fee of a loan due back on p_EndDate, as of p_AsOf. The one place the rate lives: used per loan
+-- at return time and over all ongoing loans by the nightly overdue pass.
+CREATE FUNCTION penalty_for(p_EndDate DATE, p_AsOf DATE)
+RETURNS DECIMAL(10,2)
+DETERMINISTIC
+NO SQL
+BEGIN
+  DECLARE v_RatePerDay DECIMAL(10,2) DEFAULT 10.00;
+  RETURN GREATEST(COALESCE(DATEDIFF(p_AsOf, p_EndDate), 0), 0) * v_RatePerDay;
+END$$
+
+-- Overdue notice number for a loan p_DaysLate days late: 1 on the first late day, then one more a week
+CREATE FUNCTION overdue_level(p_DaysLate INT)
+RETURNS TINYINT
+DETERMINISTIC
+NO SQL
+BEGIN
+  RETURN LEAST(1 + FLOOR((p_DaysLate - 1) / 7), 100);
+END$$
+
 CREATE FUNCTION calculate_penalty(p_LendBorrowID INT)
 RETURNS DECIMAL(10,2)
 DETERMINISTIC
 READS SQL DATA
 BEGIN
   DECLARE v_EndDate DATE;
-  DECLARE v_DaysLate INT;
-  DECLARE v_Penalty DECIMAL(10,2) DEFAULT 0.00;
-  DECLARE v_RatePerDay DECIMAL(10,2) DEFAULT 10.00;
   SELECT EndDate INTO v_EndDate FROM LendBorrow WHERE LendBorrowID = p_LendBorrowID;
-  SET v_DaysLate = DATEDIFF(CURDATE(), v_EndDate);
-  IF v_DaysLate > 0 THEN
-    SET v_Penalty = v_DaysLate * v_RatePerDay;
-  END IF;
-  RETURN v_Penalty;
+  RETURN penalty_for(v_EndDate, CURDATE());
+END$$
+
+-- Nightly batch over every loan and reminder, as of p_AsOf:
+--   * ongoing loans past their return date get PenaltyAmount = the fee accrued so far,
+--   * 'Scheduled' reminders whose date has come become 'Due', and reminders of overdue loans 'Overdue',
+--   * each overdue loan gets its current overdue notice; from the second one on, the lender gets a copy.
+-- Everything is set-based; loans are walked in LendBorrowID ranges of p_ChunkSize with a commit after
+-- each, so no lock is held for long. Re-running for the same day changes nothing (amounts are absolute,
+-- notices are unique per level). Ends with a one-row result set of the OverdueRun counters.
+CREATE PROCEDURE run_overdue_pass(IN p_AsOf DATE, IN p_ChunkSize INT)
+BEGIN
+  DECLARE v_runID INT;
+  DECLARE v_lo, v_hi, v_rows INT;
+  DECLARE v_penalties, v_due, v_overdue, v_notices INT DEFAULT 0;
+
+  INSERT INTO OverdueRun (AsOf) VALUES (p_AsOf);
+  SET v_runID = LAST_INSERT_ID();
+  COMMIT;
+
+  REPEAT
+    UPDATE Reminder SET Status = 'Due'
+    WHERE Status = 'Scheduled' AND RDate <= p_AsOf
+    LIMIT p_ChunkSize;
+    SET v_rows = ROW_COUNT();
+    SET v_due = v_due + v_rows;
+    COMMIT;
+  UNTIL v_rows < p_ChunkSize END REPEAT;
+
+  SELECT MIN(LendBorrowID), MAX(LendBorrowID) INTO v_lo, v_hi
+  FROM LendBorrow WHERE Status = 'Ongoing' AND EndDate < p_AsOf;
+  WHILE v_lo <= v_hi DO
+    UPDATE LendBorrow
+    SET PenaltyAmount = penalty_for(EndDate, p_AsOf)
+    WHERE Status = 'Ongoing' AND EndDate < p_AsOf AND LendBorrowID BETWEEN v_lo AND v_lo + p_ChunkSize - 1;
+    SET v_penalties = v_penalties + ROW_COUNT();
+
+    UPDATE Reminder rm
+    JOIN LendBorrow lb ON lb.TransactionID = rm.TransID
+    SET rm.Status = 'Overdue'
+    WHERE lb.Status = 'Ongoing' AND lb.EndDate < p_AsOf AND lb.LendBorrowID BETWEEN v_lo AND v_lo + p_ChunkSize - 1
+      AND rm.Status IN ('Scheduled', 'Due');
+    SET v_overdue = v_overdue + ROW_COUNT();
+
+    INSERT IGNORE INTO Reminder (STD_ID, TransID, Msg, Status, RDate, Level)
+    SELECT n.StudentID, n.TransactionID, n.Msg, 'Overdue', p_AsOf, n.Level
+    FROM (
+      SELECT lb.BorrowerID AS StudentID, lb.TransactionID, overdue_level(DATEDIFF(p_AsOf, lb.EndDate)) AS Level,
+             CONCAT('Overdue: return item ', lb.itemID, ' (due ', DATE_FORMAT(lb.EndDate, '%Y-%m-%d'),
+                    '), late fee so far ', penalty_for(lb.EndDate, p_AsOf)) AS Msg
+      FROM LendBorrow lb
+      WHERE lb.Status = 'Ongoing' AND lb.EndDate < p_AsOf AND lb.TransactionID IS NOT NULL
+        AND lb.LendBorrowID BETWEEN v_lo AND v_lo + p_ChunkSize - 1
+      UNION ALL
+      SELECT lb.LenderID, lb.TransactionID, overdue_level(DATEDIFF(p_AsOf, lb.EndDate)),
+             CONCAT('Overdue: your item ', lb.itemID, ' was due back from ', lb.BorrowerID,
+                    ' on ', DATE_FORMAT(lb.EndDate, '%Y-%m-%d'))
+      FROM LendBorrow lb
+      WHERE lb.Status = 'Ongoing' AND lb.EndDate < p_AsOf - INTERVAL 7 DAY AND lb.TransactionID IS NOT NULL
+        AND lb.LendBorrowID BETWEEN v_lo AND v_lo + p_ChunkSize - 1
+    ) n;
+    SET v_notices = v_notices + ROW_COUNT();
+
+    COMMIT;
+    SET v_lo = v_lo + p_ChunkSize;
+  END WHILE;
+
+  UPDATE OverdueRun
+  SET FinishedAt = CURRENT_TIMESTAMP, PenaltiesUpdated = v_penalties, RemindersDue = v_due,
+      RemindersOverdue = v_overdue, NoticesSent = v_notices
+  WHERE RunID = v_runID;
+  COMMIT;
+  SELECT v_runID AS RunID, v_penalties AS PenaltiesUpdated, v_due AS RemindersDue,
+         v_overdue AS RemindersOverdue, v_notices AS NoticesSent;
 END$$
 
 CREATE PROCEDURE complete_lend_with_penalty(IN p_LendBorrowID INT)
 BEGIN
-  DECLARE v_exists INT;
+  DECLARE v_itemID INT;
   DECLARE v_penalty DECIMAL(10,2);
-  SELECT COUNT(*) INTO v_exists FROM LendBorrow WHERE LendBorrowID = p_LendBorrowID AND Status = 'Ongoing';
-  IF v_exists = 0 THEN
+  SELECT itemID INTO v_itemID FROM LendBorrow WHERE LendBorrowID = p_LendBorrowID AND Status = 'Ongoing';
+  IF v_itemID IS NULL THEN
     SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'complete_lend: Active LendBorrowID not found';
   ELSE
     SET v_penalty = calculate_penalty(p_LendBorrowID);
@@ -267,6 +656,8 @@ BEGIN
         PenaltyAmount = v_penalty,
         EndDate = CASE WHEN v_penalty > 0 THEN CURDATE() ELSE EndDate END
     WHERE LendBorrowID = p_LendBorrowID;
+    UPDATE LendReservation SET Status = 'Fulfilled' WHERE LendBorrowID = p_LendBorrowID;
+    CALL lend_handoff(v_itemID);
   END IF;
 END$$
 
@@ -281,31 +672,272 @@ CREATE PROCEDURE initiate_lend(
 BEGIN
   DECLARE v_status VARCHAR(20);
   DECLARE v_transID INT;
+  DECLARE v_reservationID INT;
+  DECLARE v_windowEnd DATE DEFAULT GREATEST(COALESCE(p_EndDate, p_StartDate), p_StartDate) + INTERVAL 1 DAY;
   SELECT Status INTO v_status FROM Resource WHERE ResourceID = p_ItemID FOR UPDATE;
   IF v_status IS NULL THEN
     SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'initiate_lend: Resource not found';
   ELSEIF v_status <> 'Available' THEN
     SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'initiate_lend: Resource not available';
+  ELSEIF EXISTS (
+    SELECT 1 FROM LendReservation
+    WHERE ItemID = p_ItemID AND Status IN ('Reserved', 'Active') AND BorrowerID <> p_BorrowerID
+      AND StartDate < v_windowEnd AND EndDate > p_StartDate
+  ) THEN
+    SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'initiate_lend: Resource is reserved by someone else during that period';
   ELSE
     INSERT INTO Transactions (Type) VALUES ('LendBorrow');
     SET v_transID = LAST_INSERT_ID();
     INSERT INTO LendBorrow(itemID, LenderID, BorrowerID, StartDate, EndDate, Status, TransactionID)
     VALUES (p_ItemID, p_LenderID, p_BorrowerID, p_StartDate, p_EndDate, 'Ongoing', v_transID);
     SET p_LendBorrowID = LAST_INSERT_ID();
+    -- The borrower's own booking for this window becomes the loan; otherwise the loan books its window
+    SELECT ReservationID INTO v_reservationID FROM LendReservation
+    WHERE ItemID = p_ItemID AND BorrowerID = p_BorrowerID AND Status = 'Reserved'
+      AND StartDate < v_windowEnd AND EndDate > p_StartDate
+    ORDER BY StartDate LIMIT 1;
+    IF v_reservationID IS NOT NULL THEN
+      UPDATE LendReservation
+      SET Status = 'Active', StartDate = p_StartDate, EndDate = v_windowEnd, LendBorrowID = p_LendBorrowID
+      WHERE ReservationID = v_reservationID;
+    ELSE
+      INSERT INTO LendReservation (ItemID, BorrowerID, StartDate, EndDate, Status, LendBorrowID)
+      VALUES (p_ItemID, p_BorrowerID, p_StartDate, v_windowEnd, 'Active', p_LendBorrowID);
+    END IF;
+  END IF;
+END$$
+
+-- Books a Lend item from p_StartDate until the return date p_EndDate. The item's row lock serialises bookings,
+-- so two overlapping requests cannot both get 'Reserved'; the later one is 'Waitlisted'.
+-- Ends with a one-row result set: ReservationID, Status.
+CREATE PROCEDURE reserve_lend(IN p_ItemID INT, IN p_BorrowerID VARCHAR(13), IN p_StartDate DATE, IN p_EndDate DATE)
+BEGIN
+  DECLARE v_owner VARCHAR(13);
+  DECLARE v_type VARCHAR(10);
+  DECLARE v_status VARCHAR(20) DEFAULT 'Reserved';
+  DECLARE v_windowEnd DATE DEFAULT p_EndDate + INTERVAL 1 DAY;
+  SELECT OwnerID, ListingType INTO v_owner, v_type FROM Resource WHERE ResourceID = p_ItemID FOR UPDATE;
+  IF v_owner IS NULL THEN
+    SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'reserve_lend: Resource not found';
+  ELSEIF v_type <> 'Lend' THEN
+    SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'reserve_lend: Resource is not listed for lending';
+  ELSEIF v_owner = p_BorrowerID THEN
+    SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'reserve_lend: You cannot reserve your own item';
+  ELSEIF p_StartDate < CURDATE() OR p_EndDate < p_StartDate THEN
+    SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'reserve_lend: Invalid reservation dates';
+  END IF;
+  IF EXISTS (
+    SELECT 1 FROM LendReservation
+    WHERE ItemID = p_ItemID AND Status IN ('Reserved', 'Active')
+      AND StartDate < v_windowEnd AND EndDate > p_StartDate
+  ) THEN
+    SET v_status = 'Waitlisted';
+  END IF;
+  INSERT INTO LendReservation (ItemID, BorrowerID, StartDate, EndDate, Status)
+  VALUES (p_ItemID, p_BorrowerID, p_StartDate, v_windowEnd, v_status);
+  SELECT LAST_INSERT_ID() AS ReservationID, v_status AS Status;
+END$$
+
+CREATE PROCEDURE cancel_lend_reservation(IN p_ReservationID INT, IN p_BorrowerID VARCHAR(13))
+BEGIN
+  DECLARE v_itemID INT;
+  SELECT ItemID INTO v_itemID FROM LendReservation
+  WHERE ReservationID = p_ReservationID AND BorrowerID = p_BorrowerID AND Status IN ('Reserved', 'Waitlisted');
+  IF v_itemID IS NULL THEN
+    SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'cancel_lend_reservation: Open reservation not found';
+  END IF;
+  SELECT ResourceID INTO v_itemID FROM Resource WHERE ResourceID = v_itemID FOR UPDATE;
+  UPDATE LendReservation SET Status = 'Cancelled' WHERE ReservationID = p_ReservationID;
+  CALL promote_waitlist(v_itemID);
+END$$
+
+-- Moves waitlisted requests of an item that no longer overlap a booking up to 'Reserved', oldest first.
+-- Callers hold the item's Resource row lock.
+CREATE PROCEDURE promote_waitlist(IN p_ItemID INT)
+BEGIN
+  DECLARE v_done INT DEFAULT 0;
+  DECLARE v_reservationID INT;
+  DECLARE v_start, v_end DATE;
+  DECLARE waitlist CURSOR FOR
+    SELECT ReservationID, StartDate, EndDate FROM LendReservation
+    WHERE ItemID = p_ItemID AND Status = 'Waitlisted' ORDER BY CreatedAt, ReservationID;
+  DECLARE CONTINUE HANDLER FOR NOT FOUND SET v_done = 1;
+
+  UPDATE LendReservation SET Status = 'Lapsed' WHERE ItemID = p_ItemID AND Status = 'Waitlisted' AND EndDate <= CURDATE();
+  OPEN waitlist;
+  promote: LOOP
+    FETCH waitlist INTO v_reservationID, v_start, v_end;
+    IF v_done THEN LEAVE promote; END IF;
+    IF NOT EXISTS (
+      SELECT 1 FROM LendReservation
+      WHERE ItemID = p_ItemID AND Status IN ('Reserved', 'Active')
+        AND StartDate < v_end AND EndDate > v_start
+    ) THEN
+      UPDATE LendReservation SET Status = 'Reserved' WHERE ReservationID = v_reservationID;
+    END IF;
+  END LOOP;
+  CLOSE waitlist;
+END$$
+
+-- Runs when a loan of the item ends: the booking that is due (started on or before today) becomes a loan
+-- straight away, then the waitlist is re-checked against the freed calendar.
+CREATE PROCEDURE lend_handoff(IN p_ItemID INT)
+BEGIN
+  DECLARE v_reservationID INT;
+  DECLARE v_borrower, v_owner VARCHAR(13);
+  DECLARE v_end DATE;
+  DECLARE v_loanID INT;
+  DECLARE v_failed INT DEFAULT 0;
+  -- A hand-off initiate_lend refuses leaves the booking as it is instead of undoing the return
+  DECLARE CONTINUE HANDLER FOR SQLSTATE '45000' SET v_failed = 1;
+
+  SELECT OwnerID INTO v_owner FROM Resource WHERE ResourceID = p_ItemID FOR UPDATE;
+  UPDATE LendReservation SET Status = 'Lapsed' WHERE ItemID = p_ItemID AND Status = 'Reserved' AND EndDate <= CURDATE();
+  SELECT ReservationID, BorrowerID, EndDate INTO v_reservationID, v_borrower, v_end
+  FROM LendReservation
+  WHERE ItemID = p_ItemID AND Status = 'Reserved' AND StartDate <= CURDATE()
+  ORDER BY StartDate, ReservationID LIMIT 1;
+  IF v_reservationID IS NOT NULL THEN
+    -- initiate_lend turns the borrower's overlapping booking into the loan; EndDate is exclusive there
+    CALL initiate_lend(p_ItemID, v_owner, v_borrower, CURDATE(), v_end - INTERVAL 1 DAY, v_loanID);
+  END IF;
+  CALL promote_waitlist(p_ItemID);
+END$$
+
+-- Reserves a listed item for a buyer in one call. The BuySell row is locked with NOWAIT, so a
+-- competing buyer gets 'Busy' at once instead of queueing on the lock; one that arrives after the
+-- winner committed finds no 'Listed' row and gets 'Taken'. Ends with a one-row result set:
+-- Result ('Reserved', 'Taken', 'Busy' or 'OwnItem'), BuySellID, Price. The caller commits.
+CREATE PROCEDURE purchase_item(IN p_ItemID INT, IN p_BuyerID VARCHAR(13))
+BEGIN
+  DECLARE v_buySellID INT;
+  DECLARE v_sellerID VARCHAR(13);
+  DECLARE v_price DECIMAL(10,2);
+  DECLARE v_result VARCHAR(20);
+  DECLARE v_transID INT;
+  BEGIN
+    -- ER_LOCK_NOWAIT: another buyer's purchase_item holds the row right now
+    DECLARE EXIT HANDLER FOR 3572 SET v_result = 'Busy';
+    SELECT BuySellID, SellerID, Price INTO v_buySellID, v_sellerID, v_price
+    FROM BuySell
+    WHERE ItemID = p_ItemID AND Status = 'Listed'
+    ORDER BY BuySellID
+    LIMIT 1
+    FOR UPDATE NOWAIT;
+  END;
+  IF v_result IS NULL THEN
+    IF v_buySellID IS NULL THEN
+      SET v_result = 'Taken';
+    ELSEIF v_sellerID = p_BuyerID THEN
+      SET v_result = 'OwnItem';
+    ELSE
+      INSERT INTO Transactions (Type) VALUES ('BuySell');
+      SET v_transID = LAST_INSERT_ID();
+      UPDATE BuySell
+      SET BuyerID = p_BuyerID, Status = 'PendingPayment', TransactionDate = CURDATE(), TransactionID = v_transID
+      WHERE BuySellID = v_buySellID;
+      SET v_result = 'Reserved';
+    END IF;
+  END IF;
+  SELECT v_result AS Result, v_buySellID AS BuySellID, v_price AS Price;
+END$$
+
+-- Proposes a barter of the proposer's item (Item1) for someone else's (Item2) in one call.
+-- Both Resource rows are locked in primary-key order, so crossing proposals cannot deadlock.
+-- Ends with a one-row result set: BarterID.
+CREATE PROCEDURE propose_barter(IN p_Item1ID INT, IN p_Item2ID INT, IN p_ProposerID VARCHAR(13))
+BEGIN
+  DECLARE v_locked INT;
+  DECLARE v_owner1, v_owner2 VARCHAR(13);
+  DECLARE v_status1, v_status2 VARCHAR(20);
+  DECLARE v_type1, v_type2 VARCHAR(10);
+  DECLARE v_transID INT;
+  -- uq_barter_pending_pair: a concurrent call proposed the same pair first
+  DECLARE EXIT HANDLER FOR 1062
+    SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'propose_barter: A proposal for these items is already pending';
+
+  SELECT COUNT(*) INTO v_locked FROM Resource WHERE ResourceID IN (p_Item1ID, p_Item2ID) FOR UPDATE;
+  SELECT OwnerID, Status, ListingType INTO v_owner1, v_status1, v_type1 FROM Resource WHERE ResourceID = p_Item1ID;
+  SELECT OwnerID, Status, ListingType INTO v_owner2, v_status2, v_type2 FROM Resource WHERE ResourceID = p_Item2ID;
+
+  IF v_owner1 IS NULL OR v_owner2 IS NULL THEN
+    SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'propose_barter: Resource not found';
+  ELSEIF v_owner1 <> p_ProposerID THEN
+    SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'propose_barter: You can only offer your own item';
+  ELSEIF v_owner2 = p_ProposerID THEN
+    SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'propose_barter: You cannot barter with yourself';
+  ELSEIF v_status1 <> 'Available' OR v_status2 <> 'Available' THEN
+    SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'propose_barter: Resource not available';
+  ELSEIF v_type1 <> 'Barter' OR v_type2 <> 'Barter' THEN
+    SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'propose_barter: Both items must be listed for barter';
+  ELSEIF EXISTS (SELECT 1 FROM Barter WHERE PendingPair = CONCAT(LEAST(p_Item1ID, p_Item2ID), ':', GREATEST(p_Item1ID, p_Item2ID))) THEN
+    SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'propose_barter: A proposal for these items is already pending';
+  ELSE
+    INSERT INTO Transactions (Type) VALUES ('Barter');
+    SET v_transID = LAST_INSERT_ID();
+    INSERT INTO Barter (Item1ID, Item2ID, ProposerID, AccepterID, Status, BarterDate, TransactionID)
+    VALUES (p_Item1ID, p_Item2ID, p_ProposerID, v_owner2, 'Pending', CURDATE(), v_transID);
+    SELECT LAST_INSERT_ID() AS BarterID;
   END IF;
 END$$
 
+-- A giver's answer to a proposed BarterCycle. Declining ends the cycle. The last acceptance completes
+-- it: all items must still be Available, they become Unavailable and one Transactions row records the
+-- exchange; otherwise the cycle is marked Expired. Ends with a one-row result set: Status.
+CREATE PROCEDURE respond_barter_cycle(IN p_CycleID INT, IN p_StudentID VARCHAR(13), IN p_Accept BOOLEAN)
+BEGIN
+  DECLARE v_status VARCHAR(20);
+  DECLARE v_legs INT;
+  DECLARE v_pending INT;
+  DECLARE v_unavailable INT;
+  DECLARE v_transID INT;
+  SELECT Status INTO v_status FROM BarterCycle WHERE CycleID = p_CycleID FOR UPDATE;
+  SELECT COUNT(*) INTO v_legs FROM BarterCycleLeg WHERE CycleID = p_CycleID AND GiverID = p_StudentID;
+  IF v_status IS NULL OR v_legs = 0 THEN
+    SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'respond_barter_cycle: Exchange not found';
+  ELSEIF v_status <> 'Proposed' THEN
+    SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'respond_barter_cycle: Exchange is no longer open';
+  END IF;
+
+  UPDATE BarterCycleLeg SET Response = IF(p_Accept, 'Accepted', 'Declined')
+  WHERE CycleID = p_CycleID AND GiverID = p_StudentID;
+
+  IF NOT p_Accept THEN
+    UPDATE BarterCycle SET Status = 'Declined' WHERE CycleID = p_CycleID;
+  ELSE
+    SELECT COUNT(*) INTO v_pending FROM BarterCycleLeg WHERE CycleID = p_CycleID AND Response <> 'Accepted';
+    IF v_pending = 0 THEN
+      SELECT COUNT(*) INTO v_unavailable
+      FROM Resource r JOIN BarterCycleLeg l ON l.ItemID = r.ResourceID
+      WHERE l.CycleID = p_CycleID AND r.Status <> 'Available'
+      FOR UPDATE;
+      IF v_unavailable > 0 THEN
+        UPDATE BarterCycle SET Status = 'Expired' WHERE CycleID = p_CycleID;
+      ELSE
+        INSERT INTO Transactions (Type) VALUES ('Barter');
+        SET v_transID = LAST_INSERT_ID();
+        UPDATE Resource SET Status = 'Unavailable'
+        WHERE ResourceID IN (SELECT ItemID FROM BarterCycleLeg WHERE CycleID = p_CycleID);
+        UPDATE BarterCycle SET Status = 'Completed', TransactionID = v_transID WHERE CycleID = p_CycleID;
+      END IF;
+    END IF;
+  END IF;
+  SELECT Status FROM BarterCycle WHERE CycleID = p_CycleID;
+END$$
+
 CREATE PROCEDURE complete_lend(IN p_LendBorrowID INT)
 BEGIN
-  DECLARE v_exists INT;
-  SELECT COUNT(*) INTO v_exists FROM LendBorrow WHERE LendBorrowID = p_LendBorrowID;
-  IF v_exists = 0 THEN
+  DECLARE v_itemID INT;
+  SELECT itemID INTO v_itemID FROM LendBorrow WHERE LendBorrowID = p_LendBorrowID;
+  IF v_itemID IS NULL THEN
     SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'complete_lend: LendBorrowID not found';
   ELSE
     UPDATE LendBorrow
     SET Status = 'Completed',
         EndDate = CASE WHEN EndDate IS NULL THEN CURDATE() ELSE EndDate END
     WHERE LendBorrowID = p_LendBorrowID;
+    UPDATE LendReservation SET Status = 'Fulfilled' WHERE LendBorrowID = p_LendBorrowID;
+    CALL lend_handoff(v_itemID);
   END IF;
 END$$
 
@@ -314,17 +946,25 @@ RETURNS DECIMAL(3,2)
 DETERMINISTIC
 READS SQL DATA
 BEGIN
-  DECLARE v_avg DECIMAL(5,2);
-  SELECT AVG(Rating) INTO v_avg FROM Review WHERE ItemID = p_ItemID;
-  IF v_avg IS NULL THEN
-    RETURN 0.00;
-  ELSE
-    RETURN ROUND(v_avg,2);
-  END IF;
+  -- Reads the trigger-maintained average instead of aggregating Review
+  DECLARE v_avg DECIMAL(3,2);
+  SELECT RatingAvg INTO v_avg FROM Resource WHERE ResourceID = p_ItemID;
+  RETURN COALESCE(v_avg, 0.00);
 END$$
 
 DELIMITER ;
 
+-- =========================================================
+-- EVENTS
+-- =========================================================
+
+-- Nightly overdue pass. Needs the event scheduler (event_scheduler=ON, the default since MySQL 8.0);
+-- where it is off, run overdue.py from cron instead.
+CREATE EVENT ev_overdue_nightly
+ON SCHEDULE EVERY 1 DAY STARTS CURRENT_DATE + INTERVAL 1 DAY + INTERVAL 1 HOUR
+ON COMPLETION PRESERVE
+DO CALL run_overdue_pass(CURDATE(), 5000);
+
 -- JOIN QUERY: Display listed items for sale with seller info
 SELECT 
     r.ResourceID, 
@@ -358,12 +998,10 @@ WHERE bs.BuyerID = 'PES2UG23CS002'
       SELECT rv.ItemID FROM Review rv WHERE rv.STD_ID = 'PES2UG23CS002'
   );
 
--- AGGREGATE QUERY: Calculate average rating per item
+-- AGGREGATE QUERY: Average rating per item (maintained on Resource by the Review triggers)
 SELECT 
     r.Title, 
-    ROUND(AVG(rv.Rating), 2) AS AverageRating, 
-    COUNT(rv.ReviewID) AS TotalReviews
+    r.RatingAvg AS AverageRating, 
+    r.RatingCount AS TotalReviews
 FROM Resource r
-LEFT JOIN Review rv ON r.ResourceID = rv.ItemID
-GROUP BY r.ResourceID, r.Title
 ORDER BY AverageRating DESC;